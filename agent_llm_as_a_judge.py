@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
 from dotenv import load_dotenv
@@ -7,9 +6,17 @@ from tqdm import tqdm
 import time
 import json
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
+from chain_runner import ChainCall, invoke_chain, ainvoke_chain
+from streaming_json import failing_verdict
+from prejudge import prejudge, prejudge_enabled
+from schemas import challenging_judge_schema, moderate_judge_schema
 
 
-challenging_judgement_prompt = ChatPromptTemplate.from_template("""
+# Each judge prompt is its rubric, a verdict format and the judged candidate. The
+# full format asks for a reason per dimension; the compact one only for failing
+# dimensions, which are the only reasons the improvement prompts act on.
+CHALLENGING_RUBRIC = """
 You are {passage_language} native speaker.
 You are evaluating a reading comprehension question and its answer based on the passage below, which is written in {passage_language}.
 The question should be answerable using reasoning based on the passage, possibly supported by high school level knowledge from {country}.
@@ -40,7 +47,9 @@ Include recommendations:
 Critical: If any of the checks for boolean dimensions are false, describe how to fix it. 
 NiceToHave: Suggest briefly how to increase the reasoning complexity of the question.
 
-Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+"""
+
+CHALLENGING_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
 
 {{
   "Complexity": 1|2|3|4|5,
@@ -76,23 +85,36 @@ Output your evaluation strictly as the following JSON schema. Return only the JS
 }}
 
 Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
 
-Passage:
---------------------------------
-{passage}
---------------------------------
-
-Question:
-{question}
+CHALLENGING_COMPACT_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
 
-Answer:
-{answer}
+{{
+  "Complexity": 1|2|3|4|5,
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "AnswerNotInSpan": true|false,
+  "IsInThirdPerson": true|false,
+  "NoHighLexicalOverlap": true|false,
+  "NoSpecializedExternalKnowledge": true|false,
+  "IsShortQuestion": true|false,
+  "IsShortAndPreciseAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }}
+}}
 
-Quotes:
-{quotes}
-""")
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
 
-moderate_judgement_prompt = ChatPromptTemplate.from_template("""
+MODERATE_RUBRIC = """
 You are {passage_language} native speaker.
 You are evaluating a reading comprehension question and its answer based on the passage below, which is written in {passage_language}.
 Your task is to provide a structured analysis of the question and answer using a rating grade of answer complexity, set of critical criteria and nice-to-have recommendations.
@@ -120,7 +142,9 @@ Also, label these quality and formatting dimensions (True/False):
 Critical: If any of the checks for boolean dimensions are false, describe how to fix it. 
 NiceToHave: Suggest briefly how to increase the reasoning complexity of the question.
 
-Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+"""
+
+MODERATE_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
 
 Provide evaluation strictly in JSON:
 
@@ -159,7 +183,124 @@ Provide evaluation strictly in JSON:
 }}
 
 Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
+
+MODERATE_COMPACT_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
+
+{{
+  "Complexity": 1|2|3,
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "IsInThirdPerson": true|false,
+  "IsNotVerbatimAnswer": true|false,
+  "QuestionFreeFromLinguisticOrGrammarTerms": true|false,
+  "IsShortQuestion": true|false,
+  "IsPreciseAnswer": true|false,
+  "IsShortAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }}
+}}
+
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
+
+# Fused mode: the judge also returns the revised candidate, saving the improvement call
+REVISION_INSTRUCTIONS = """
+After the evaluation, revise the question, answer and quotes:
+- Resolve every issue in Recommendations.Critical, so that every dimension above becomes true.
+- Then implement Recommendations.NiceToHave to increase the question's reasoning complexity, without making any dimension false.
+- The question must be strictly in the third person, short and concise; the answer must be short.
+- The question, answer and quotes must be in {passage_language}. Do not use MSA or other dialects.
+- The quotes must be exact and their character indices within the passage must be provided.
+If the question can not be fixed, or every dimension is true and there is nothing to improve, set Question and Answer of the Revision to "N/A" and Quotes to [].
+
+"""
+
+CHALLENGING_FUSED_FORMAT = """Output your evaluation and revision strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
+
+{{
+  "Complexity": 1|2|3|4|5,
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "AnswerNotInSpan": true|false,
+  "IsInThirdPerson": true|false,
+  "NoHighLexicalOverlap": true|false,
+  "NoSpecializedExternalKnowledge": true|false,
+  "IsShortQuestion": true|false,
+  "IsShortAndPreciseAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }},
+  "Revision": {{
+    "Question": "<revised question in {passage_language} or N/A>",
+    "Answer": "<revised answer in {passage_language} or N/A>",
+    "Quotes": [
+      {{
+        "text": "<quote in {passage_language}>",
+        "start_char": <the starting character index of the quote in the passage as an integer>,
+        "end_char": <the ending character index of the quote in the passage as an integer>
+      }}
+    ]
+  }}
+}}
+
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
+
+MODERATE_FUSED_FORMAT = """Output your evaluation and revision strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
+
+{{
+  "Complexity": 1|2|3,
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "IsInThirdPerson": true|false,
+  "IsNotVerbatimAnswer": true|false,
+  "QuestionFreeFromLinguisticOrGrammarTerms": true|false,
+  "IsShortQuestion": true|false,
+  "IsPreciseAnswer": true|false,
+  "IsShortAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }},
+  "Revision": {{
+    "Question": "<revised question in {passage_language} or N/A>",
+    "Answer": "<revised answer in {passage_language} or N/A>",
+    "Quotes": [
+      {{
+        "text": "<quote in {passage_language}>",
+        "start_char": <the starting character index of the quote in the passage as an integer>,
+        "end_char": <the ending character index of the quote in the passage as an integer>
+      }}
+    ]
+  }}
+}}
+
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
 
+JUDGED_CANDIDATE = """
 Passage:
 --------------------------------
 {passage}
@@ -173,41 +314,125 @@ Answer:
 
 Quotes:
 {quotes}
-""")
+"""
+
+challenging_judgement_prompt = ChatPromptTemplate.from_template(CHALLENGING_RUBRIC + CHALLENGING_VERDICT_FORMAT + JUDGED_CANDIDATE)
+challenging_compact_judgement_prompt = ChatPromptTemplate.from_template(CHALLENGING_RUBRIC + CHALLENGING_COMPACT_VERDICT_FORMAT + JUDGED_CANDIDATE)
+
+moderate_judgement_prompt = ChatPromptTemplate.from_template(MODERATE_RUBRIC + MODERATE_VERDICT_FORMAT + JUDGED_CANDIDATE)
+moderate_compact_judgement_prompt = ChatPromptTemplate.from_template(MODERATE_RUBRIC + MODERATE_COMPACT_VERDICT_FORMAT + JUDGED_CANDIDATE)
+
+challenging_fused_prompt = ChatPromptTemplate.from_template(CHALLENGING_RUBRIC + REVISION_INSTRUCTIONS + CHALLENGING_FUSED_FORMAT + JUDGED_CANDIDATE)
+moderate_fused_prompt = ChatPromptTemplate.from_template(MODERATE_RUBRIC + REVISION_INSTRUCTIONS + MODERATE_FUSED_FORMAT + JUDGED_CANDIDATE)
+
+VERDICT_FORMATS = ("compact", "full")
+
+
+def verdict_format_from_env():
+  """JUDGE_VERDICT=full asks the judges for a reason per dimension again; compact is the default."""
+  verdict_format = os.getenv("JUDGE_VERDICT", "compact").lower()
+  if verdict_format not in VERDICT_FORMATS:
+    raise ValueError(f"JUDGE_VERDICT must be one of {VERDICT_FORMATS}, got {verdict_format!r}")
+  return verdict_format
 
 
 class LLMAsAJudge:
-  def __init__(self, passage, passage_language, country):
-    self.llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        temperature=0.7,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=os.getenv("GOOGLE_API_KEY"),
-    )
+  def __init__(self, passage, passage_language, country, passage_context=None, llm=None, cascade=None,
+               use_prejudge=None, verdict_format=None):
+    self.llm = llm if llm is not None else get_llm("gemini-2.5-pro", temperature=0.7)
+    # JudgeCascade whose fast model judges first, None to always use self.llm
+    self.cascade = cascade
+    # Mechanical checks that reject a candidate locally before any judge call
+    self.use_prejudge = prejudge_enabled() if use_prejudge is None else use_prejudge
     self.passage = passage
     self.passage_language = passage_language
     self.country = country
+    self.passage_context = passage_context
+    # "compact": reasons only for failing dimensions, "full": a reason for every dimension
+    self.verdict_format = verdict_format if verdict_format is not None else verdict_format_from_env()
+    self.compact = self.verdict_format == "compact"
+    
+  def challenging_eval_call(self, question, answer, quotes, decisive=False, llm=None, stage="judge", fused=False):
+    """With decisive=True the verdict is streamed and cut off at the first failing check."""
+    if fused:
+      return self.challenging_fused_call(question, answer, quotes, llm=llm, stage=stage)
+    prompt = challenging_compact_judgement_prompt if self.compact else challenging_judgement_prompt
+    return ChainCall(prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes, 
+                      "country": self.country},
+                     stage=stage, difficulty="challenging", variant=self.verdict_format,
+                     context=self.passage_context,
+                     abort_when=failing_verdict if decisive else None,
+                     schema=challenging_judge_schema(self.passage_language, compact=self.compact))
+
+  def challenging_fused_call(self, question, answer, quotes, llm=None, stage="judge"):
+    """Compact verdict plus the revised candidate under "Revision", in one call."""
+    return ChainCall(challenging_fused_prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes,
+                      "country": self.country},
+                     stage=stage, difficulty="challenging", variant="fused",
+                     context=self.passage_context,
+                     schema=challenging_judge_schema(self.passage_language, compact=True, revision=True))
+
+  def challenging_eval_steps(self, question, answer, quotes, decisive=False, fused=False):
+    """
+    Verdict as a step generator: the local pre-judge's rejection if a mechanical
+    check fails, else the LLM verdict, through the judge cascade when there is one.
+    With fused=True an LLM verdict also carries the revised candidate as "Revision";
+    a pre-judge rejection never does.
+    """
+    verdict = prejudge("challenging", self.passage, question, answer, quotes) if self.use_prejudge else None
+    if verdict is not None:
+      return verdict
+    if self.cascade is None:
+      judgement = yield self.challenging_eval_call(question, answer, quotes, decisive=decisive, fused=fused)
+      return judgement
+    return (yield from self.cascade.steps(
+      lambda llm, stage: self.challenging_eval_call(question, answer, quotes, decisive=decisive, llm=llm, stage=stage,
+                                            fused=fused)))
+  
+  def moderate_eval_call(self, question, answer, quotes, decisive=False, llm=None, stage="judge", fused=False):
+    if fused:
+      return self.moderate_fused_call(question, answer, quotes, llm=llm, stage=stage)
+    prompt = moderate_compact_judgement_prompt if self.compact else moderate_judgement_prompt
+    return ChainCall(prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes},
+                     stage=stage, difficulty="moderate", variant=self.verdict_format,
+                     context=self.passage_context,
+                     abort_when=failing_verdict if decisive else None,
+                     schema=moderate_judge_schema(self.passage_language, compact=self.compact))
+
+  def moderate_fused_call(self, question, answer, quotes, llm=None, stage="judge"):
+    """Compact verdict plus the revised candidate under "Revision", in one call."""
+    return ChainCall(moderate_fused_prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes},
+                     stage=stage, difficulty="moderate", variant="fused",
+                     context=self.passage_context,
+                     schema=moderate_judge_schema(self.passage_language, compact=True, revision=True))
+
+  def moderate_eval_steps(self, question, answer, quotes, decisive=False, fused=False):
+    verdict = prejudge("moderate", self.passage, question, answer, quotes) if self.use_prejudge else None
+    if verdict is not None:
+      return verdict
+    if self.cascade is None:
+      judgement = yield self.moderate_eval_call(question, answer, quotes, decisive=decisive, fused=fused)
+      return judgement
+    return (yield from self.cascade.steps(
+      lambda llm, stage: self.moderate_eval_call(question, answer, quotes, decisive=decisive, llm=llm, stage=stage,
+                                            fused=fused)))
     
   def run_challenging_eval_prompt(self, question, answer, quotes):
-    chain = challenging_judgement_prompt | self.llm | JsonOutputParser()
-    try:
-        res = chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                            "question": question, "answer": answer, "quotes": quotes, 
-                            "country": self.country})
-    except Exception as e:
-        print(e)
-        return None
-    return res
+    return invoke_chain(self.challenging_eval_call(question, answer, quotes))
   
   def run_moderate_eval_prompt(self, question, answer, quotes):
-      chain = moderate_judgement_prompt | self.llm | JsonOutputParser()
-      try:
-          res = chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                              "question": question, "answer": answer, "quotes": quotes
-                              })
-      except Exception as e:
-          print(e)
-          return None
-      return res
+    return invoke_chain(self.moderate_eval_call(question, answer, quotes))
+  
+  async def arun_challenging_eval_prompt(self, question, answer, quotes):
+    return await ainvoke_chain(self.challenging_eval_call(question, answer, quotes))
+  
+  async def arun_moderate_eval_prompt(self, question, answer, quotes):
+    return await ainvoke_chain(self.moderate_eval_call(question, answer, quotes))
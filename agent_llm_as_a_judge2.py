@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
 from dotenv import load_dotenv
@@ -7,9 +6,16 @@ from tqdm import tqdm
 import time
 import json
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
+from chain_runner import ChainCall, invoke_chain, ainvoke_chain
+from streaming_json import failing_verdict
+from prejudge import prejudge, prejudge_enabled
+from schemas import combined_judge_schema
+from agent_llm_as_a_judge import JUDGED_CANDIDATE, REVISION_INSTRUCTIONS, verdict_format_from_env
 
 
-combined_judgement_prompt = ChatPromptTemplate.from_template("""
+# Rubric, verdict format and judged candidate, as in agent_llm_as_a_judge
+COMBINED_RUBRIC = """
 You are {passage_language} native speaker.
 You are evaluating a reading comprehension question and its answer based on the passage below, which is written in {passage_language}.
 Your task is to set of critical criteria and nice-to-have recommendations.
@@ -31,7 +37,9 @@ Label these quality and formatting dimensions (True/False):
 Critical: If any of the checks for boolean dimensions are false, describe how to fix it. 
 NiceToHave: Suggest briefly how to increase the reasoning complexity of the question.
 
-Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+"""
+
+COMBINED_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
 
 Provide evaluation strictly in JSON:
 
@@ -64,55 +72,124 @@ Provide evaluation strictly in JSON:
 }}
 
 Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
+
+COMBINED_COMPACT_VERDICT_FORMAT = """Output your evaluation strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
+
+{{
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "IsInThirdPerson": true|false,
+  "QuestionFreeFromLinguisticOrGrammarTerms": true|false,
+  "IsShortQuestion": true|false,
+  "IsPreciseAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }}
+}}
+
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
 
-Passage:
---------------------------------
-{passage}
---------------------------------
+COMBINED_FUSED_FORMAT = """Output your evaluation and revision strictly as the following JSON schema. Return only the JSON object, nothing else.
+Give the "<dimension>_reason" of a dimension only when it is false, right after that dimension, in one short sentence. Dimensions that are true get no reason.
+Critical is "None" when every dimension is true. NiceToHave is one sentence, or "None" when the question needs no change.
 
-Question:
-{question}
+{{
+  "IsNonOpinionated": true|false,
+  "UnambiguousAnswer": true|false,
+  "IsUnbiased": true|false,
+  "IsAnswerable": true|false,
+  "IsRelevant": true|false,
+  "IsInThirdPerson": true|false,
+  "QuestionFreeFromLinguisticOrGrammarTerms": true|false,
+  "IsShortQuestion": true|false,
+  "IsPreciseAnswer": true|false,
+  "IsIn{passage_language}": true|false,
+  "Recommendations": {{
+    "Critical": "string",
+    "NiceToHave": "string"
+  }},
+  "Revision": {{
+    "Question": "<revised question in {passage_language} or N/A>",
+    "Answer": "<revised answer in {passage_language} or N/A>",
+    "Quotes": [
+      {{
+        "text": "<quote in {passage_language}>",
+        "start_char": <the starting character index of the quote in the passage as an integer>,
+        "end_char": <the ending character index of the quote in the passage as an integer>
+      }}
+    ]
+  }}
+}}
 
-Answer:
-{answer}
+Return only the JSON object, nothing else. Otherwise you will be penalized $1000 per word.
+"""
 
-Quotes:
-{quotes}
-""")
+combined_judgement_prompt = ChatPromptTemplate.from_template(COMBINED_RUBRIC + COMBINED_VERDICT_FORMAT + JUDGED_CANDIDATE)
+combined_compact_judgement_prompt = ChatPromptTemplate.from_template(COMBINED_RUBRIC + COMBINED_COMPACT_VERDICT_FORMAT + JUDGED_CANDIDATE)
+combined_fused_prompt = ChatPromptTemplate.from_template(COMBINED_RUBRIC + REVISION_INSTRUCTIONS + COMBINED_FUSED_FORMAT + JUDGED_CANDIDATE)
 
 
 class LLMAsAJudge:
-  def __init__(self, passage, passage_language, country):
-    self.llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        temperature=0.7,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=os.getenv("GOOGLE_API_KEY"),
-    )
+  def __init__(self, passage, passage_language, country, passage_context=None, llm=None, cascade=None,
+               use_prejudge=None, verdict_format=None):
+    self.llm = llm if llm is not None else get_llm("gemini-2.5-pro", temperature=0.7)
+    # JudgeCascade whose fast model judges first, None to always use self.llm
+    self.cascade = cascade
+    # Mechanical checks that reject a candidate locally before any judge call
+    self.use_prejudge = prejudge_enabled() if use_prejudge is None else use_prejudge
     self.passage = passage
     self.passage_language = passage_language
     self.country = country
+    self.passage_context = passage_context
+    # "compact": reasons only for failing dimensions, "full": a reason for every dimension
+    self.verdict_format = verdict_format if verdict_format is not None else verdict_format_from_env()
+    self.compact = self.verdict_format == "compact"
+    
+  def combined_eval_call(self, question, answer, quotes, decisive=False, llm=None, stage="judge", fused=False):
+    if fused:
+      return self.combined_fused_call(question, answer, quotes, llm=llm, stage=stage)
+    prompt = combined_compact_judgement_prompt if self.compact else combined_judgement_prompt
+    return ChainCall(prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes, 
+                      "country": self.country},
+                     stage=stage, difficulty="combined", variant=self.verdict_format,
+                     context=self.passage_context,
+                     abort_when=failing_verdict if decisive else None,
+                     schema=combined_judge_schema(self.passage_language, compact=self.compact))
+
+  def combined_fused_call(self, question, answer, quotes, llm=None, stage="judge"):
+    """Compact verdict plus the revised candidate under "Revision", in one call."""
+    return ChainCall(combined_fused_prompt, llm if llm is not None else self.llm,
+                     {"passage": self.passage, "passage_language": self.passage_language, 
+                      "question": question, "answer": answer, "quotes": quotes,
+                      "country": self.country},
+                     stage=stage, difficulty="combined", variant="fused",
+                     context=self.passage_context,
+                     schema=combined_judge_schema(self.passage_language, compact=True, revision=True))
+
+  def combined_eval_steps(self, question, answer, quotes, decisive=False, fused=False):
+    verdict = prejudge("combined", self.passage, question, answer, quotes) if self.use_prejudge else None
+    if verdict is not None:
+      return verdict
+    if self.cascade is None:
+      judgement = yield self.combined_eval_call(question, answer, quotes, decisive=decisive, fused=fused)
+      return judgement
+    return (yield from self.cascade.steps(
+      lambda llm, stage: self.combined_eval_call(question, answer, quotes, decisive=decisive, llm=llm, stage=stage,
+                                            fused=fused)))
     
   def run_combined_eval_prompt(self, question, answer, quotes):
-    chain = combined_judgement_prompt | self.llm | JsonOutputParser()
-    try:
-        res = chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                            "question": question, "answer": answer, "quotes": quotes, 
-                            "country": self.country})
-    except Exception as e:
-        print(e)
-        return None
-    return res
+    return invoke_chain(self.combined_eval_call(question, answer, quotes))
   
-  def run_combined_eval_prompt(self, question, answer, quotes):
-      chain = combined_judgement_prompt | self.llm | JsonOutputParser()
-      try:
-          res = chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                              "question": question, "answer": answer, "quotes": quotes
-                              })
-      except Exception as e:
-          print(e)
-          return None
-      return res
+  async def arun_combined_eval_prompt(self, question, answer, quotes):
+    return await ainvoke_chain(self.combined_eval_call(question, answer, quotes))
@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
 from dotenv import load_dotenv
@@ -6,8 +5,17 @@ import glob
 from tqdm import tqdm
 import time
 import json
+import asyncio
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
 from agent_llm_as_a_judge import LLMAsAJudge
+from chain_runner import ChainCall, run_steps, arun_steps, budgeted_steps
+from streaming_json import question_not_available
+from schemas import QuestionAnswer, CandidateSet
+from prejudge import prejudge, prejudge_enabled
+from budget import passage_budget_from_env
+from novelty_index import result_question
+from question_store import QuestionRecord
 
 load_dotenv()
 
@@ -57,7 +65,7 @@ challenging_improvement_prompt = ChatPromptTemplate.from_template("""
 You are a Logic & Reasoning teacher and {passage_language} native speaker.  
 Revise the original_question along with original_answer and original_quotes based on the provided judge feedback.
 Your primary mandate is to resolve all issues in Recommendations.Critical. 
-Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits. 
+Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits (a verdict may give reasons for the false dimensions only). 
 After addressing all critical errors, implement the Recommendations.NiceToHave to increase the question's reasoning complexity.
 Ensure all boolean dimensions from the feedback are True for new version of question and answer. If not, make changes to the question and answer to satisfy all boolean dimensions.
 The quotes must be exact and exact character indices of the quote in the passage must be provided.
@@ -198,7 +206,7 @@ Previous questions:
 moderate_improvement_prompt = ChatPromptTemplate.from_template("""
 Revise the original_question and original_answer based on the provided judge feedback.
 Your primary mandate is to resolve all issues in Recommendations.Critical. 
-Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits. 
+Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits (a verdict may give reasons for the false dimensions only). 
 After addressing all critical errors, implement the Recommendations.NiceToHave to increase the question's reasoning complexity.
 The final reading comprehension question-answer-quotes output must be non-opinionated, have a short, unambiguous answer derivable or inferred from the passage quotes.
 The quotes must be exact and exact character indices of the quote in the passage must be provided.
@@ -237,47 +245,210 @@ Judge Feedback:
 
 """)
 
+multi_candidate_prompt = ChatPromptTemplate.from_template("""
+You are a Logic & Reasoning teacher and {passage_language} native speaker.
+You need to generate several diverse reading comprehension non-opinionated questions, each with a short, precise, unambiguous answer and the list of exact quotes from the text that was used to form the answer, based on the passage written in {passage_language}.
+Generate exactly this many questions of each difficulty:
+{counts}
+
+Difficulties:
+- challenging: The answer must be derived through inference or reasoning (connecting pieces of information or tracking the order of events), never a verbatim copy of a single text span. It can partly rely on high school level knowledge from {country}. Avoid copying exact phrases from the passage into the question. The answer is no more than 5 words.
+- moderate: The answer must be a different grammatical form of a word or words from the passage (inflectional, derivational or other word transformations), uniquely inferable from the passage but never verbatim. Do NOT mention linguistic or grammar terms in the question. The answer is less than 4 words.
+- easy: The answer must be found directly in the text and be copied verbatim as a short quote from the passage. Do not paraphrase or rephrase.
+
+For every question:
+Formulate the question strictly in the third person.
+Keep the question short and concise (no more than 16 words).
+Every question must ask about a different part or fact of the passage, and no two answers may be the same.
+You must not use a question similar to the previous questions. The answer to the question should not be the same as the answer to previous questions.
+The quotes must be exact and exact character indices of the quote in the passage must be provided.
+Leave out a difficulty rather than return a question that does not meet its requirements.
+
+IMPORTANT: The questions, answers and quotes must be in {passage_language}. Otherwise you will be penalized $1000 per word.
+
+Return your response in the following JSON format:
+{{
+  "Candidates": [
+    {{
+      "Difficulty": "<challenging, moderate or easy>",
+      "Question": "<your question in {passage_language}>",
+      "Answer": "<your answer in {passage_language}>",
+      "Quotes":[
+            {{
+              "text": "<your quote in {passage_language}>",
+              "start_char": "<the starting character index of the quote in the passage>",
+              "end_char": "<the ending character index of the quote in the passage>"
+            }}
+      ]
+    }}
+  ]
+}}
+
+Passage:
+--------------------------------
+{passage}
+--------------------------------
+
+Previous questions:
+
+{previous_questions}
+""")
+
+
+def normalize_question_text(text):
+    return " ".join(str(text).split())
+
+
+# Refinement loop of a difficulty: "two_call" judges and then calls the improvement
+# prompt, "fused" gets the revision together with the verdict in one call
+REFINEMENT_MODES = ("two_call", "fused")
+REFINED_DIFFICULTIES = ("challenging", "moderate", "combined")
+
+
+def refinement_modes_from_env(overrides=None):
+    """
+    Refinement mode per difficulty from CHALLENGING_REFINEMENT, MODERATE_REFINEMENT
+    and COMBINED_REFINEMENT (two_call by default), with `overrides` on top.
+    """
+    modes = {difficulty: os.getenv(f"{difficulty.upper()}_REFINEMENT", "two_call").lower()
+             for difficulty in REFINED_DIFFICULTIES}
+    modes.update(overrides or {})
+    for difficulty, mode in modes.items():
+        if mode not in REFINEMENT_MODES:
+            raise ValueError(f"Refinement mode of {difficulty} must be one of {REFINEMENT_MODES}, got {mode!r}")
+    return modes
+
+
+def no_recommendations(recommendations):
+    """True when a verdict asks for no change: Critical and NiceToHave empty, "None" or left out."""
+    return all(str(recommendations.get(key) or "None").strip() in ("", "None")
+               for key in ("Critical", "NiceToHave"))
+
+
+def revision_unchanged(res, question, answer, quotes):
+    """True when an improvement returned the candidate it was given, which was already judged."""
+    return (normalize_question_text(res.get("Question")) == normalize_question_text(question)
+            and normalize_question_text(res.get("Answer")) == normalize_question_text(answer)
+            and res.get("Quotes") == quotes)
+
+
+def dedup_results(results, previous_questions):
+    """
+    Blank out results whose question or answer repeats a previous question or an
+    earlier result of the same round. Used after the difficulty stages ran
+    concurrently and could not see each other's output.
+    """
+    seen_questions = set()
+    seen_answers = set()
+    for previous in previous_questions:
+        if isinstance(previous, (dict, QuestionRecord)):
+            if previous.get("Question") is not None:
+                seen_questions.add(normalize_question_text(previous["Question"]))
+            if previous.get("Answer") is not None:
+                seen_answers.add(normalize_question_text(previous["Answer"]))
+        elif previous is not None:
+            seen_questions.add(normalize_question_text(previous))
+    
+    deduped = []
+    for result in results:
+        question = result.get("Question")
+        answer = result.get("Answer")
+        if question is None or question == "N/A":
+            deduped.append(result)
+            continue
+        question_key = normalize_question_text(question)
+        answer_key = normalize_question_text(answer) if answer is not None else None
+        if question_key in seen_questions or (answer_key is not None and answer_key in seen_answers):
+            print(f"Dropping duplicate question: {question}")
+            deduped.append({**result, "Question": None, "Answer": None, "Quotes": None})
+            continue
+        seen_questions.add(question_key)
+        if answer_key is not None:
+            seen_answers.add(answer_key)
+        deduped.append(result)
+    return deduped
+
 
 class QuestionBuilder:
-    def __init__(self, passage, passage_language, country, previous_questions = []):
+    def __init__(self, passage, passage_language, country, previous_questions=None, context_cache=None, llm=None, judge_cascade=None,
+                 budget=None, novelty_index=None, refinement=None):
         # Set basic attributes first
         self.passage = passage
         self.passage_language = passage_language
         self.question_answer_pairs = []
-        self.previous_questions = previous_questions
+        # A builder's own list; shared QuestionRecords are not copied, only the list is
+        self.previous_questions = list(previous_questions) if previous_questions is not None else []
         self.country = country
+        # Every judge (and pre-judge) verdict of this builder, for checkpoints and logs
+        self.verdicts = []
+        # Share one PassageBudget between the builders of all rounds of a passage
+        self.budget = budget if budget is not None else passage_budget_from_env()
+        # NoveltyIndex of the passage's accepted questions; when set, near duplicates are
+        # dropped after generation and the prompts only get a short summary
+        self.novelty_index = novelty_index
+        # Difficulty -> "two_call" or "fused" refinement loop, see refinement_modes_from_env
+        self.refinement = refinement_modes_from_env(refinement)
         
-        # Initialize LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
-            temperature=0.7,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-            api_key=os.getenv("GOOGLE_API_KEY"),
-        )
+        # Shared LLM client, or any chat runnable such as a HedgedRouter
+        self.llm = llm if llm is not None else get_llm("gemini-2.5-pro", temperature=0.7)
+        
+        # Register the passage once; later calls refer to the cached context instead of resending it
+        self.passage_context = context_cache.register(passage) if context_cache is not None else None
         
         # Initialize judge with error handling
         try:
-            self.judge = LLMAsAJudge(passage, passage_language, country)
+            self.judge = LLMAsAJudge(passage, passage_language, country, passage_context=self.passage_context, llm=llm,
+                                     cascade=judge_cascade)
         except Exception as e:
             print(f"Warning: Failed to initialize LLMAsAJudge: {e}")
             self.judge = None
     
-    def build_easy_qna_in_single_step(self):
-
-        chain = easy_initial_prompt | self.llm | JsonOutputParser()
-         
-        try:
-            res = chain.invoke({"passage": self.passage, "passage_language": self.passage_language,                                 
-                                "previous_questions": self.previous_questions})
-        except Exception as e:
-            print(e)
-            return None
+    def previous_questions_text(self):
+        if self.novelty_index is None:
+            return self.previous_questions
+        return self.novelty_index.summary(extra=[result_question(previous)[0] for previous in self.previous_questions])
+    
+    def drop_similar(self, results):
+        """Blank out results that nearly repeat an accepted question or one from this round."""
+        if self.novelty_index is None:
+            return results
+        return self.novelty_index.filter(results, pending=self.previous_questions)
+    
+    def easy_qna_steps(self, initial=None):
+        ledger = self.budget.stage("easy")
+        if initial is None:
+            reason = ledger.stop_reason()
+            if reason is not None:
+                self.budget.record_stop("easy", reason)
+                return None, None, None
+            res = yield ChainCall(easy_initial_prompt, self.llm,
+                                  {"passage": self.passage, "passage_language": self.passage_language,                                 
+                                   "previous_questions": self.previous_questions_text()},
+                                  stage="initial", difficulty="easy",
+                                  context=self.passage_context,
+                                  abort_when=question_not_available,
+                                  schema=QuestionAnswer, budget=ledger)
+        else:
+            res = initial
+        if res is None:
+            return None, None, None
+        
+        if prejudge_enabled() and not question_not_available(res):
+            # Easy questions are not judged, so the verbatim answer and quotes are only checked here.
+            # The checks are report-only: there is no loop to regenerate against, and
+            # filter_results still drops questions whose quotes cannot be aligned
+            verdict = prejudge("easy", self.passage, res.get("Question"), res.get("Answer"), res.get("Quotes"))
+            if verdict is not None:
+                print("Easy question flagged: ", verdict["Recommendations"]["Critical"])
+                self.verdicts.append({"Difficulty": "easy", "Question": res.get("Question"), "Answer": res.get("Answer"),
+                                      "Verdict": verdict})
           
-        return res["Question"], res["Answer"], res["Quotes"]
+        if not question_not_available(res):
+            self.budget.record_accepted(ledger, res.get("Question"))
+        # An "N/A" answer is cut off after the Question field
+        return res.get("Question"), res.get("Answer"), res.get("Quotes")
     
-    def build_challenging_qna_in_multiple_steps(self):
+    def challenging_qna_steps(self, initial=None):
       if self.judge is None:
           print("Warning: Judge not initialized, skipping challenging question generation")
           return None, None, None
@@ -288,18 +459,30 @@ class QuestionBuilder:
       print(self.passage)
       print("--------------------------------")
       
-      initial_chain = challenging_initial_prompt | self.llm | JsonOutputParser()
-      improvement_chain = challenging_improvement_prompt | self.llm | JsonOutputParser()
-      try:
-          res = initial_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                                      "country": self.country})
-      except Exception as e:
-          print(e)
-          return None
+      ledger = self.budget.stage("challenging")
+      if initial is None:
+        reason = ledger.stop_reason()
+        if reason is not None:
+          self.budget.record_stop("challenging", reason)
+          return None, None, None
+        res = yield ChainCall(challenging_initial_prompt, self.llm,
+                              {"passage": self.passage, "passage_language": self.passage_language, 
+                               "country": self.country},
+                              stage="initial", difficulty="challenging",
+                              context=self.passage_context,
+                              abort_when=question_not_available,
+                              schema=QuestionAnswer, budget=ledger)
+      else:
+        # A candidate from candidate_steps takes the place of the initial question
+        res = initial
         
       if res is None:
         print("No question generated")
-        return None
+        return None, None, None
+      
+      if question_not_available(res):
+        print("Question can not be created (N/A)")
+        return None, None, None
       
       print("Question-Generation Agent: ", res)
       
@@ -315,13 +498,25 @@ class QuestionBuilder:
       final_quotes = None
       
       for i in range(iteration_limit + extended_iteration_limit):
-        judgement = self.judge.run_challenging_eval_prompt(question, answer, quotes)
+        # A failing check on the last round, or once a candidate is kept past the
+        # iteration limit, ends the loop, so that verdict can stop at the first failure
+        decisive = i == iteration_limit + extended_iteration_limit - 1 or (final_question is not None and i >= iteration_limit)
+        reason = ledger.stop_reason()
+        if reason is not None:
+          self.budget.record_stop("challenging", reason)
+          break
+        # The last verdict is never followed by a revision, so it is not fused
+        fused = self.refinement["challenging"] == "fused" and not decisive
+        judgement = yield from budgeted_steps(
+          self.judge.challenging_eval_steps(question, answer, quotes, decisive=decisive, fused=fused), ledger)
         if judgement is None:
           print("No judgement generated")
-          return None
+          return None, None, None
+        # Revised candidate of a fused verdict; two-call verdicts and pre-judge rejections have none
+        revision = judgement.pop("Revision", None)
+        self.verdicts.append({"Difficulty": "challenging", "Question": question, "Answer": answer, "Verdict": judgement})
         print("Judgement Agent: ", judgement)
         
-        complexity = int(judgement["Complexity"])
         check_passed = True
         
         for key, value in judgement.items():
@@ -331,16 +526,23 @@ class QuestionBuilder:
             check_passed = False
             break
         
+        if decisive and not check_passed:
+          print("Check failed, no further improvement")
+          break
+        
+        # A local pre-judge rejection carries no Complexity grade
+        complexity = int(judgement.get("Complexity", -1))
+        
         if complexity > max_complexity and check_passed:
           max_complexity = complexity
           final_question = question
           final_answer = answer
           final_quotes = quotes
+          if self.budget.target_reached("challenging", complexity):
+            self.budget.record_stop("challenging", f"target complexity reached ({complexity})")
+            break
           
-        critical_recommendation = judgement["Recommendations"]["Critical"]
-        nice_to_have_recommendation = judgement["Recommendations"]["NiceToHave"]
-        
-        if critical_recommendation == "None" and nice_to_have_recommendation == "None":
+        if no_recommendations(judgement["Recommendations"]):
           print("No improvement needed")
           break
         
@@ -348,22 +550,37 @@ class QuestionBuilder:
           print("No improvement needed")
           break
         
-        print("Improving question...")
-
-        try:
-            res = improvement_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                                            "country": self.country,
-                                            "original_question": question, "original_answer": answer, 
-                                            "original_quotes": quotes,
-                                            "judge_feedback": judgement})  
-        except Exception as e:
-            print(e)
-            return None
+        if revision is not None:
+          print("Revised with the verdict")
+          res = revision
+        else:
+          reason = ledger.stop_reason()
+          if reason is not None:
+            self.budget.record_stop("challenging", reason)
+            break
+          print("Improving question...")
+
+          res = yield ChainCall(challenging_improvement_prompt, self.llm,
+                                {"passage": self.passage, "passage_language": self.passage_language, 
+                                 "country": self.country,
+                                 "original_question": question, "original_answer": answer, 
+                                 "original_quotes": quotes,
+                                 "judge_feedback": judgement},
+                                stage="improvement", difficulty="challenging",
+                                context=self.passage_context,
+                                abort_when=question_not_available,
+                                schema=QuestionAnswer, budget=ledger)
           
         if res is None:
           print("No improvement generated")
           break
+        if question_not_available(res):
+          print("Question can not be fixed (N/A)")
+          break
         print("Question-Improvement Agent: ", res)
+        if revision_unchanged(res, question, answer, quotes):
+          self.budget.record_stop("challenging", "revision unchanged")
+          break
         question = res["Question"]
         answer = res["Answer"]
         quotes = res["Quotes"]
@@ -372,29 +589,44 @@ class QuestionBuilder:
       print(f"Final answer: {final_answer}")
       print(f"Final quotes: {final_quotes}")
       
+      if final_question is not None:
+        self.budget.record_accepted(ledger, final_question)
+      
       return final_question, final_answer, final_quotes
     
-    def build_moderate_qna_in_multiple_steps(self):
+    def moderate_qna_steps(self, initial=None):
       if self.judge is None:
           print("Warning: Judge not initialized, skipping challenging question generation")
-          return None, None
+          return None, None, None
           
       max_complexity = -1
       print("Building medium question in multiple steps...")
       print("--------------------------------")
       
-      initial_chain = moderate_initial_prompt | self.llm | JsonOutputParser()
-      improvement_chain = moderate_improvement_prompt | self.llm | JsonOutputParser()
-      try:
-          res = initial_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                                      "previous_questions": self.previous_questions})
-      except Exception as e:
-          print(e)
-          return None
+      ledger = self.budget.stage("moderate")
+      if initial is None:
+        reason = ledger.stop_reason()
+        if reason is not None:
+          self.budget.record_stop("moderate", reason)
+          return None, None, None
+        res = yield ChainCall(moderate_initial_prompt, self.llm,
+                              {"passage": self.passage, "passage_language": self.passage_language, 
+                               "previous_questions": self.previous_questions_text()},
+                              stage="initial", difficulty="moderate",
+                              context=self.passage_context,
+                              abort_when=question_not_available,
+                              schema=QuestionAnswer, budget=ledger)
+      else:
+        # A candidate from candidate_steps takes the place of the initial question
+        res = initial
         
       if res is None:
         print("No question generated")
-        return None
+        return None, None, None
+      
+      if question_not_available(res):
+        print("Question can not be created (N/A)")
+        return None, None, None
       
       print("Question-Generation Agent: ", res)
       question = res["Question"]
@@ -407,14 +639,25 @@ class QuestionBuilder:
       final_answer = None
       final_quotes = None
       
-      for _ in range(iteration_limit):
-        judgement = self.judge.run_moderate_eval_prompt(question, answer, quotes)
+      for i in range(iteration_limit):
+        # The improvement after a failed last round would never be judged
+        decisive = i == iteration_limit - 1
+        reason = ledger.stop_reason()
+        if reason is not None:
+          self.budget.record_stop("moderate", reason)
+          break
+        # The last verdict is never followed by a revision, so it is not fused
+        fused = self.refinement["moderate"] == "fused" and not decisive
+        judgement = yield from budgeted_steps(
+          self.judge.moderate_eval_steps(question, answer, quotes, decisive=decisive, fused=fused), ledger)
         if judgement is None:
           print("No judgement generated")
-          return None
+          return None, None, None
+        # Revised candidate of a fused verdict; two-call verdicts and pre-judge rejections have none
+        revision = judgement.pop("Revision", None)
+        self.verdicts.append({"Difficulty": "moderate", "Question": question, "Answer": answer, "Verdict": judgement})
         print("Judgement Agent: ", judgement)
         
-        complexity = int(judgement["Complexity"])
         check_passed = True
 
         for key, value in judgement.items():
@@ -424,34 +667,56 @@ class QuestionBuilder:
             check_passed = False
             break
 
+        if decisive and not check_passed:
+          print("Check failed, no further improvement")
+          break
+
+        # A local pre-judge rejection carries no Complexity grade
+        complexity = int(judgement.get("Complexity", -1))
+
         if complexity > max_complexity and check_passed:
           
           max_complexity = complexity
           final_question = question
           final_answer = answer
           final_quotes = quotes
+          if self.budget.target_reached("moderate", complexity):
+            self.budget.record_stop("moderate", f"target complexity reached ({complexity})")
+            break
           
-        critical_recommendation = judgement["Recommendations"]["Critical"]
-        nice_to_have_recommendation = judgement["Recommendations"]["NiceToHave"]
-        
-        if critical_recommendation == "None" and nice_to_have_recommendation == "None":
+        if no_recommendations(judgement["Recommendations"]):
           print("No improvement needed")
           break
-        print("Improving question...")
-
-        try:
-            res = improvement_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                                            "original_question": question, "original_answer": answer,
-                                            "original_quotes": quotes,
-                                            "judge_feedback": judgement})  
-        except Exception as e:
-            print(e)
-            return None
+        if revision is not None:
+          print("Revised with the verdict")
+          res = revision
+        else:
+          reason = ledger.stop_reason()
+          if reason is not None:
+            self.budget.record_stop("moderate", reason)
+            break
+          print("Improving question...")
+
+          res = yield ChainCall(moderate_improvement_prompt, self.llm,
+                                {"passage": self.passage, "passage_language": self.passage_language, 
+                                 "original_question": question, "original_answer": answer,
+                                 "original_quotes": quotes,
+                                 "judge_feedback": judgement},
+                                stage="improvement", difficulty="moderate",
+                                context=self.passage_context,
+                                abort_when=question_not_available,
+                                schema=QuestionAnswer, budget=ledger)
           
         if res is None:
           print("No improvement generated")
           break
+        if question_not_available(res):
+          print("Question can not be fixed (N/A)")
+          break
         print("Question-Improvement Agent: ", res)
+        if revision_unchanged(res, question, answer, quotes):
+          self.budget.record_stop("moderate", "revision unchanged")
+          break
         
         question = res["Question"]
         answer = res["Answer"]
@@ -460,28 +725,140 @@ class QuestionBuilder:
       print(f"Final question: {final_question}")
       print(f"Final answer: {final_answer}")
       print(f"Final quotes: {final_quotes}")
+      if final_question is not None:
+        self.budget.record_accepted(ledger, final_question)
+      
       return final_question, final_answer, final_quotes
     
+    def build_easy_qna_in_single_step(self):
+        return run_steps(self.easy_qna_steps())
+    
+    def build_challenging_qna_in_multiple_steps(self):
+        return run_steps(self.challenging_qna_steps())
+    
+    def build_moderate_qna_in_multiple_steps(self):
+        return run_steps(self.moderate_qna_steps())
+    
+    async def abuild_easy_qna_in_single_step(self):
+        return await arun_steps(self.easy_qna_steps())
+    
+    async def abuild_challenging_qna_in_multiple_steps(self):
+        return await arun_steps(self.challenging_qna_steps())
+    
+    async def abuild_moderate_qna_in_multiple_steps(self):
+        return await arun_steps(self.moderate_qna_steps())
+    
     def build_qna(self):
 
         challenging_question, challenging_answer, challenging_quotes = self.build_challenging_qna_in_multiple_steps()
         results = []
         #results.append({"Question": "N/A", "Answer": "N/A"})
         challenging_question_obj = {"Question": challenging_question, "Answer": challenging_answer, "Quotes": challenging_quotes}
+        challenging_question_obj = self.drop_similar([challenging_question_obj])[0]
         results.append(challenging_question_obj)     
         self.previous_questions.append(challenging_question_obj)
         
         moderate_question, moderate_answer, moderate_quotes = self.build_moderate_qna_in_multiple_steps()
         moderate_question_obj = {"Question": moderate_question, "Answer": moderate_answer, "Quotes": moderate_quotes}
+        moderate_question_obj = self.drop_similar([moderate_question_obj])[0]
         results.append(moderate_question_obj)
         self.previous_questions.append(moderate_question_obj)
         
         easy_question, easy_answer, easy_quotes = self.build_easy_qna_in_single_step()
         easy_question_obj = {"Question": easy_question, "Answer": easy_answer, "Quotes": easy_quotes}
+        easy_question_obj = self.drop_similar([easy_question_obj])[0]
         results.append(easy_question_obj)
-        self.previous_questions.append(easy_question)
+        self.previous_questions.append(easy_question_obj["Question"])
+        
+        print("Question-Builder: ", results)
+        
+        return results
+    
+    def build_qna_steps(self):
+        """
+        Step generators of the challenging, moderate and easy stages, in result
+        order. Drive them with arun_steps or a BatchRunner and pass the stage
+        results to collect_qna.
+        """
+        return [self.challenging_qna_steps(), self.moderate_qna_steps(), self.easy_qna_steps()]
+    
+    def collect_qna(self, stage_results):
+        """
+        Turn the (question, answer, quotes) of stages that ran concurrently into
+        results. The stages only saw the questions from earlier rounds, so
+        duplicates between them are removed with dedup_results.
+        """
+        results = []
+        for question, answer, quotes in stage_results:
+            results.append({"Question": question, "Answer": answer, "Quotes": quotes})
+        
+        results = dedup_results(results, self.previous_questions)
+        results = self.drop_similar(results)
+        self.previous_questions.extend(results)
         
         print("Question-Builder: ", results)
         
         return results
-    
\ No newline at end of file
+    
+    async def abuild_qna(self):
+        """Run the challenging, moderate and easy stages concurrently."""
+        stage_results = await asyncio.gather(*(arun_steps(steps) for steps in self.build_qna_steps()))
+        return self.collect_qna(stage_results)
+    
+    def candidate_steps(self, counts):
+        """
+        Ask for several candidates per difficulty in one structured response,
+        instead of one initial question per difficulty and builder round.
+        
+        Args:
+            counts (dict): Number of candidates per difficulty, e.g. {"challenging": 3, "moderate": 3, "easy": 3}
+        
+        Returns:
+            List of candidate dicts (Difficulty, Question, Answer, Quotes)
+        """
+        ledger = self.budget.stage("candidates")
+        reason = ledger.stop_reason()
+        if reason is not None:
+            self.budget.record_stop("candidates", reason)
+            return []
+        counts_text = "\n".join(f"- {difficulty}: {count}" for difficulty, count in counts.items() if count)
+        res = yield ChainCall(multi_candidate_prompt, self.llm,
+                              {"passage": self.passage, "passage_language": self.passage_language,
+                               "country": self.country, "counts": counts_text,
+                               "previous_questions": self.previous_questions_text()},
+                              stage="initial", difficulty="candidates",
+                              context=self.passage_context,
+                              schema=CandidateSet, budget=ledger)
+        if res is None:
+            print("No candidates generated")
+            return []
+        candidates = []
+        kept = {difficulty: 0 for difficulty in counts}
+        for candidate in res.get("Candidates") or []:
+            if not isinstance(candidate, dict) or candidate.get("Difficulty") not in counts:
+                continue
+            if not candidate.get("Question") or question_not_available(candidate):
+                continue
+            # Each candidate costs a full judge/refine loop, so extras beyond the request are dropped
+            if kept[candidate["Difficulty"]] >= (counts[candidate["Difficulty"]] or 0):
+                continue
+            kept[candidate["Difficulty"]] += 1
+            candidates.append(candidate)
+        print(f"Question-Generation Agent: {len(candidates)} candidates")
+        return candidates
+    
+    def candidate_qna_steps(self, candidates):
+        """Step generators that judge and refine each candidate like an initial question of its difficulty."""
+        stages = {"challenging": self.challenging_qna_steps, "moderate": self.moderate_qna_steps,
+                  "easy": self.easy_qna_steps}
+        return [stages[candidate["Difficulty"]](initial=candidate) for candidate in candidates]
+    
+    def build_qna_from_candidates(self, counts):
+        candidates = run_steps(self.candidate_steps(counts))
+        return self.collect_qna([run_steps(steps) for steps in self.candidate_qna_steps(candidates)])
+    
+    async def abuild_qna_from_candidates(self, counts):
+        """Generate the candidates in one call, then judge and refine them concurrently."""
+        candidates = await arun_steps(self.candidate_steps(counts))
+        stage_results = await asyncio.gather(*(arun_steps(steps) for steps in self.candidate_qna_steps(candidates)))
+        return self.collect_qna(stage_results)
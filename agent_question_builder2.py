@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
 from dotenv import load_dotenv
@@ -7,7 +6,14 @@ from tqdm import tqdm
 import time
 import json
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
 from agent_llm_as_a_judge2 import LLMAsAJudge
+from agent_question_builder import dedup_results, revision_unchanged, refinement_modes_from_env, no_recommendations
+from chain_runner import ChainCall, run_steps, arun_steps, budgeted_steps
+from streaming_json import question_not_available
+from schemas import QuestionAnswer
+from budget import passage_budget_from_env
+from novelty_index import result_question
 
 load_dotenv()
 
@@ -69,7 +75,7 @@ You are a linguist and {passage_language} native speaker.
 Revise the original_question and original_answer based on the provided judge feedback.
 Your primary mandate is to resolve all issues in Recommendations.Critical. 
 
-Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits. 
+Systematically correct every dimension flagged as false in the feedback, using the associated _reason fields to guide your edits (a verdict may give reasons for the false dimensions only). 
 You need to generate a new version of reading comprehension non-opinionated question with precise, unambiguous answer, along with a list of exact quotes from the passage that were used to form the answer.
 The questions should be based on understanding and interpreting the text in the passage.
 A question can sometimes be derived partly through common knowledge in {country} that is not explicitly present in the passage.
@@ -130,52 +136,76 @@ Judge Feedback:
 
 
 class QuestionBuilder:
-    def __init__(self, passage, passage_language, country, previous_questions = []):
+    def __init__(self, passage, passage_language, country, previous_questions=None, context_cache=None, llm=None, judge_cascade=None,
+                 budget=None, novelty_index=None, refinement=None):
         # Set basic attributes first
         self.passage = passage
         self.passage_language = passage_language
         self.question_answer_pairs = []
-        self.previous_questions = previous_questions
+        self.previous_questions = list(previous_questions) if previous_questions is not None else []
         self.country = country
+        # Every judge (and pre-judge) verdict of this builder, for checkpoints and logs
+        self.verdicts = []
+        # Share one PassageBudget between the builders of all rounds of a passage
+        self.budget = budget if budget is not None else passage_budget_from_env()
+        # NoveltyIndex of the passage's accepted questions, see agent_question_builder
+        self.novelty_index = novelty_index
+        # Difficulty -> "two_call" or "fused" refinement loop, see agent_question_builder
+        self.refinement = refinement_modes_from_env(refinement)
         
-        # Initialize LLM
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
-            temperature=0.7,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-            api_key=os.getenv("GOOGLE_API_KEY"),
-        )
+        # Shared LLM client, or any chat runnable such as a HedgedRouter
+        self.llm = llm if llm is not None else get_llm("gemini-2.5-pro", temperature=0.7)
+        
+        # Register the passage once; later calls refer to the cached context instead of resending it
+        self.passage_context = context_cache.register(passage) if context_cache is not None else None
         
         # Initialize judge with error handling
         try:
-            self.judge = LLMAsAJudge(passage, passage_language, country)
+            self.judge = LLMAsAJudge(passage, passage_language, country, passage_context=self.passage_context, llm=llm,
+                                     cascade=judge_cascade)
         except Exception as e:
             print(f"Warning: Failed to initialize LLMAsAJudge: {e}")
             self.judge = None
     
 
-    def build_combined_qna_in_multiple_steps(self):
+    def previous_questions_text(self):
+      if self.novelty_index is None:
+        return self.previous_questions
+      return self.novelty_index.summary(extra=[result_question(previous)[0] for previous in self.previous_questions])
+    
+    def drop_similar(self, results):
+      if self.novelty_index is None:
+        return results
+      return self.novelty_index.filter(results, pending=self.previous_questions)
+    
+    def combined_qna_steps(self):
       if self.judge is None:
           print("Warning: Judge not initialized, skipping combined question generation")
-          return None, None
+          return None, None, None
           
       print("Building combined question in multiple steps...")
       print("--------------------------------")
       
-      initial_chain = combined_initial_prompt | self.llm | JsonOutputParser()
-      improvement_chain = combined_improvement_prompt | self.llm | JsonOutputParser()
-      try:
-          res = initial_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, "country": self.country,
-                                      "previous_questions": self.previous_questions})
-      except Exception as e:
-          print(e)
-          return None
+      ledger = self.budget.stage("combined")
+      reason = ledger.stop_reason()
+      if reason is not None:
+        self.budget.record_stop("combined", reason)
+        return None, None, None
+      res = yield ChainCall(combined_initial_prompt, self.llm,
+                            {"passage": self.passage, "passage_language": self.passage_language, "country": self.country,
+                             "previous_questions": self.previous_questions_text()},
+                            stage="initial", difficulty="combined",
+                            context=self.passage_context,
+                            abort_when=question_not_available,
+                            schema=QuestionAnswer, budget=ledger)
         
       if res is None:
         print("No question generated")
-        return None
+        return None, None, None
+      
+      if question_not_available(res):
+        print("Question can not be created (N/A)")
+        return None, None, None
       
       print("Question-Generation Agent: ", res)
       question = res["Question"]
@@ -188,11 +218,23 @@ class QuestionBuilder:
       final_answer = None
       final_quotes = None
       
-      for _ in range(iteration_limit):
-        judgement = self.judge.run_combined_eval_prompt(question, answer, quotes)
+      for i in range(iteration_limit):
+        # Only the last round's failure is final; earlier ones need the recommendations
+        decisive = i == iteration_limit - 1
+        reason = ledger.stop_reason()
+        if reason is not None:
+          self.budget.record_stop("combined", reason)
+          break
+        # The last verdict is never followed by a revision, so it is not fused
+        fused = self.refinement["combined"] == "fused" and not decisive
+        judgement = yield from budgeted_steps(
+          self.judge.combined_eval_steps(question, answer, quotes, decisive=decisive, fused=fused), ledger)
         if judgement is None:
           print("No judgement generated")
-          return None
+          return None, None, None
+        # Revised candidate of a fused verdict; two-call verdicts and pre-judge rejections have none
+        revision = judgement.pop("Revision", None)
+        self.verdicts.append({"Difficulty": "combined", "Question": question, "Answer": answer, "Verdict": judgement})
         print("Judgement Agent: ", judgement)
         
         check_passed = True
@@ -206,6 +248,10 @@ class QuestionBuilder:
             check_passed = False
             break
 
+        if decisive and not check_passed:
+          print("Check failed, no further improvement")
+          break
+
         if check_passed:
           
           final_question = question
@@ -214,28 +260,40 @@ class QuestionBuilder:
           
           break
           
-        critical_recommendation = judgement["Recommendations"]["Critical"]
-        nice_to_have_recommendation = judgement["Recommendations"]["NiceToHave"]
-        
-        if critical_recommendation == "None" and nice_to_have_recommendation == "None":
+        if no_recommendations(judgement["Recommendations"]):
           print("No improvement needed")
           break
-        print("Improving question...")
-
-        try:
-            res = improvement_chain.invoke({"passage": self.passage, "passage_language": self.passage_language, 
-                                            "country": self.country,
-                                            "original_question": question, "original_answer": answer,
-                                            "original_quotes": quotes,
-                                            "judge_feedback": judgement})  
-        except Exception as e:
-            print(e)
-            return None
+        if revision is not None:
+          print("Revised with the verdict")
+          res = revision
+        else:
+          reason = ledger.stop_reason()
+          if reason is not None:
+            self.budget.record_stop("combined", reason)
+            break
+          print("Improving question...")
+
+          res = yield ChainCall(combined_improvement_prompt, self.llm,
+                                {"passage": self.passage, "passage_language": self.passage_language, 
+                                 "country": self.country,
+                                 "original_question": question, "original_answer": answer,
+                                 "original_quotes": quotes,
+                                 "judge_feedback": judgement},
+                                stage="improvement", difficulty="combined",
+                                context=self.passage_context,
+                                abort_when=question_not_available,
+                                schema=QuestionAnswer, budget=ledger)
           
         if res is None:
           print("No improvement generated")
           break
+        if question_not_available(res):
+          print("Question can not be fixed (N/A)")
+          break
         print("Question-Improvement Agent: ", res)
+        if revision_unchanged(res, question, answer, quotes):
+          self.budget.record_stop("combined", "revision unchanged")
+          break
         
         question = res["Question"]
         answer = res["Answer"]
@@ -244,18 +302,46 @@ class QuestionBuilder:
       print(f"Final question: {final_question}")
       print(f"Final answer: {final_answer}")
       print(f"Final quotes: {final_quotes}")
+      if final_question is not None:
+        self.budget.record_accepted(ledger, final_question)
       return final_question, final_answer, final_quotes
     
+    def build_combined_qna_in_multiple_steps(self):
+      return run_steps(self.combined_qna_steps())
+    
+    async def abuild_combined_qna_in_multiple_steps(self):
+      return await arun_steps(self.combined_qna_steps())
+    
     def build_qna(self):
 
       results = []
 
       combined_question, combined_answer, combined_quotes = self.build_combined_qna_in_multiple_steps()
       combined_question_obj = {"Question": combined_question, "Answer": combined_answer, "Quotes": combined_quotes, "LLMQuestionDifficulty": "Combined"}
+      combined_question_obj = self.drop_similar([combined_question_obj])[0]
       results.append(combined_question_obj)
       self.previous_questions.append(combined_question_obj)
       
       print("Question-Builder: ", results)
       
       return results
-    
\ No newline at end of file
+    
+    def build_qna_steps(self):
+      return [self.combined_qna_steps()]
+    
+    def collect_qna(self, stage_results):
+      results = []
+      for combined_question, combined_answer, combined_quotes in stage_results:
+        combined_question_obj = {"Question": combined_question, "Answer": combined_answer, "Quotes": combined_quotes, "LLMQuestionDifficulty": "Combined"}
+        results.append(combined_question_obj)
+      results = dedup_results(results, self.previous_questions)
+      results = self.drop_similar(results)
+      self.previous_questions.extend(results)
+      
+      print("Question-Builder: ", results)
+      
+      return results
+    
+    async def abuild_qna(self):
+      stage_results = [await arun_steps(steps) for steps in self.build_qna_steps()]
+      return self.collect_qna(stage_results)
@@ -0,0 +1,78 @@
+import re
+
+# Harakat, tanween, shadda, sukun, dagger alef and Quranic marks
+DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+TATWEEL = "\u0640"
+ALEF_VARIANTS = re.compile("[\u0622\u0623\u0625\u0671]")
+WORD = re.compile(r"\w+")
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩"
+                       "۰۱۲۳۴۵۶۷۸۹",
+                       "01234567890123456789")
+
+
+def normalize_arabic(text):
+    """
+    Fold spelling variants that do not change a word, so text written by the model
+    can be compared with the passage: diacritics and tatweel are dropped, alef
+    forms become bare alef, alef maqsura becomes ya, ta marbuta becomes ha and
+    Arabic-Indic digits become ASCII.
+    """
+    text = DIACRITICS.sub("", text).replace(TATWEEL, "")
+    text = ALEF_VARIANTS.sub("ا", text)
+    text = text.replace("ى", "ي").replace("ة", "ه")
+    return text.translate(DIGITS).lower()
+
+
+def tokenize(text):
+    """Words of `text` after normalization; punctuation (including ، ؛ ؟) separates words."""
+    return WORD.findall(normalize_arabic(text))
+
+
+def word_count(text):
+    return len(tokenize(text))
+
+
+def contains_tokens(haystack, needle):
+    """True if the tokens of `needle` occur as a contiguous run in `haystack` (token lists)."""
+    n = len(needle)
+    if n == 0 or n > len(haystack):
+        return False
+    first = needle[0]
+    for i in range(len(haystack) - n + 1):
+        if haystack[i] == first and haystack[i:i + n] == needle:
+            return True
+    return False
+
+
+def contains_span(passage, text):
+    """True if `text` appears in `passage` word for word, ignoring spelling variants and punctuation."""
+    return contains_tokens(tokenize(passage), tokenize(text))
+
+
+def normalize_with_offsets(text):
+    """
+    normalize_arabic(text) together with, for every character of the result, the
+    index of the character of `text` it came from.
+    """
+    chars = []
+    offsets = []
+    for i, char in enumerate(text):
+        if char == TATWEEL or DIACRITICS.match(char):
+            continue
+        for folded in normalize_arabic(char):
+            chars.append(folded)
+            offsets.append(i)
+    return "".join(chars), offsets
+
+
+def token_spans(text):
+    """Normalized words of `text` with their (start, end) character offsets in `text` itself."""
+    normalized, offsets = normalize_with_offsets(text)
+    spans = []
+    for match in WORD.finditer(normalized):
+        end = offsets[match.end() - 1] + 1
+        # Keep the diacritics of the last letter inside the span
+        while end < len(text) and (text[end] == TATWEEL or DIACRITICS.match(text[end])):
+            end += 1
+        spans.append((match.group(), offsets[match.start()], end))
+    return spans
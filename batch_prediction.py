@@ -0,0 +1,427 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import requests
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableBinding
+from chain_runner import cache_key, invoke_chain, prepare_call, parse_output
+from llm_registry import llm_provider
+from metering import get_meter, model_name
+from question_store import QuestionStore
+from streaming_json import message_text
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_DOWNLOAD_URL = "https://generativelanguage.googleapis.com/download/v1beta"
+FINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED", "EXPIRED")
+
+
+def unwrap_llm(llm):
+    """Base chat model and the kwargs bound on top of it (outer bindings win)."""
+    kwargs = {}
+    while isinstance(llm, RunnableBinding):
+        kwargs = {**llm.kwargs, **kwargs}
+        llm = llm.bound
+    return llm, kwargs
+
+
+def rest_schema(node):
+    """JSON schema as produced by schemas.response_schema, in the REST API's enum spelling."""
+    if isinstance(node, list):
+        return [rest_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    return {key: value.upper() if key == "type" and isinstance(value, str) else rest_schema(value)
+            for key, value in node.items()}
+
+
+def render_request(prompt, llm, params):
+    """
+    GenerateContentRequest (REST JSON) for a prepared call, carrying the same
+    sampling parameters, response schema and cached content as the interactive call.
+    """
+    base, kwargs = unwrap_llm(llm)
+    contents = []
+    system = []
+    for message in prompt.format_messages(**params):
+        if message.type == "system":
+            system.append(message_text(message))
+        else:
+            contents.append({"role": "model" if message.type == "ai" else "user",
+                             "parts": [{"text": message_text(message)}]})
+
+    generation_config = {}
+    if getattr(base, "temperature", None) is not None:
+        generation_config["temperature"] = base.temperature
+    # Stage settings are bound as a generation_config, see stage_settings.StageSettings.bind
+    bound_config = kwargs.get("generation_config") or {}
+    max_output_tokens = bound_config.get("max_output_tokens", getattr(base, "max_output_tokens", None))
+    if max_output_tokens:
+        generation_config["maxOutputTokens"] = max_output_tokens
+    thinking_budget = (bound_config.get("thinking_config") or {}).get(
+        "thinking_budget", kwargs.get("thinking_budget", getattr(base, "thinking_budget", None)))
+    if thinking_budget is not None:
+        generation_config["thinkingConfig"] = {"thinkingBudget": thinking_budget}
+    if kwargs.get("response_mime_type"):
+        generation_config["responseMimeType"] = kwargs["response_mime_type"]
+    if kwargs.get("response_schema"):
+        generation_config["responseSchema"] = rest_schema(kwargs["response_schema"])
+
+    request = {"contents": contents, "generationConfig": generation_config}
+    if system:
+        request["systemInstruction"] = {"parts": [{"text": "\n".join(system)}]}
+    if kwargs.get("cached_content"):
+        request["cachedContent"] = kwargs["cached_content"]
+    return request
+
+
+def response_message(response):
+    """AIMessage with usage metadata from a GenerateContentResponse (REST JSON)."""
+    candidates = response.get("candidates") or []
+    parts = (candidates[0].get("content") or {}).get("parts", []) if candidates else []
+    text = "".join(part.get("text", "") for part in parts if not part.get("thought"))
+    usage = response.get("usageMetadata") or {}
+    thoughts = usage.get("thoughtsTokenCount", 0)
+    return AIMessage(content=text, usage_metadata={
+        "input_tokens": usage.get("promptTokenCount", 0),
+        "output_tokens": usage.get("candidatesTokenCount", 0) + thoughts,
+        "total_tokens": usage.get("totalTokenCount", 0),
+        "input_token_details": {"cache_read": usage.get("cachedContentTokenCount", 0)},
+        "output_token_details": {"reasoning": thoughts},
+    })
+
+
+class GeminiBatchBackend:
+    """
+    Gemini Batch API: one inline batchGenerateContent job per round and model,
+    polled until it reaches a final state.
+
+    Args:
+        api_key (str): API key, GOOGLE_API_KEY when None
+        timeout (float): HTTP timeout in seconds
+    """
+
+    def __init__(self, api_key=None, timeout=120):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"x-goog-api-key": self.api_key, "Content-Type": "application/json"})
+
+    def submit(self, model, batch_requests, display_name):
+        body = {"batch": {
+            "display_name": display_name,
+            "input_config": {"requests": {"requests": [
+                {"request": request, "metadata": {"key": key}} for key, request in batch_requests
+            ]}},
+        }}
+        response = self.session.post(f"{GEMINI_API_URL}/{model}:batchGenerateContent", json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["name"]
+
+    def poll(self, job):
+        """Responses by request key once the job is done, None while it is still running."""
+        response = self.session.get(f"{GEMINI_API_URL}/{job}", timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        metadata = data.get("metadata") or {}
+        state = metadata.get("state", "")
+        if not data.get("done") and not state.endswith(FINAL_STATES):
+            return None
+        if "error" in data or not state.endswith("SUCCEEDED"):
+            raise RuntimeError(f"Batch job {job} ended in {state}: {data.get('error')}")
+
+        output = data.get("response") or metadata.get("output") or {}
+        results = {}
+        inlined = output.get("inlinedResponses") or []
+        if isinstance(inlined, dict):
+            inlined = inlined.get("inlinedResponses", [])
+        for item in inlined:
+            key = (item.get("metadata") or {}).get("key")
+            results[key] = item.get("response") if "response" in item else {"error": item.get("error")}
+        if output.get("responsesFile"):
+            download = self.session.get(f"{GEMINI_DOWNLOAD_URL}/{output['responsesFile']}:download",
+                                        params={"alt": "media"}, timeout=self.timeout)
+            download.raise_for_status()
+            for line in download.text.splitlines():
+                if line.strip():
+                    item = json.loads(line)
+                    results[item.get("key")] = item.get("response") or {"error": item.get("error")}
+        return results
+
+
+def llm_responder(llm):
+    """Responder for LocalBatchBackend that answers each request with a LangChain chat model."""
+    def respond(model, request):
+        messages = []
+        if request.get("systemInstruction"):
+            messages.append(SystemMessage("".join(part["text"] for part in request["systemInstruction"]["parts"])))
+        for content in request["contents"]:
+            text = "".join(part.get("text", "") for part in content["parts"])
+            messages.append(AIMessage(text) if content.get("role") == "model" else HumanMessage(text))
+        message = llm.invoke(messages)
+        usage = getattr(message, "usage_metadata", None) or {}
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": message_text(message)}]}}],
+            "usageMetadata": {
+                "promptTokenCount": usage.get("input_tokens", 0),
+                "candidatesTokenCount": usage.get("output_tokens", 0),
+                "totalTokenCount": usage.get("total_tokens", 0),
+            },
+        }
+    return respond
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the batch service. Each job is written to
+    <directory>/<job>.requests.jsonl; the job is done once
+    <directory>/<job>.responses.jsonl exists. With a responder the backend
+    produces that file itself on the first poll, otherwise another process (or a
+    person) has to.
+
+    Args:
+        directory (str): Where job files are kept
+        responder (callable): (model, request) -> GenerateContentResponse dict, see llm_responder
+    """
+
+    def __init__(self, directory="batch_jobs", responder=None):
+        self.directory = directory
+        self.responder = responder
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job, kind):
+        return os.path.join(self.directory, f"{job}.{kind}.jsonl")
+
+    def submit(self, model, batch_requests, display_name):
+        job = f"{display_name}-{uuid.uuid4().hex[:8]}"
+        with open(self._path(job, "requests"), "w", encoding="utf-8") as f:
+            for key, request in batch_requests:
+                f.write(json.dumps({"key": key, "model": model, "request": request}, ensure_ascii=False) + "\n")
+        return job
+
+    def process(self, job):
+        with open(self._path(job, "requests"), encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        with open(self._path(job, "responses"), "w", encoding="utf-8") as out:
+            for item in items:
+                try:
+                    line = {"key": item["key"], "response": self.responder(item["model"], item["request"])}
+                except Exception as e:
+                    line = {"key": item["key"], "error": {"message": str(e)}}
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def poll(self, job):
+        path = self._path(job, "responses")
+        if not os.path.exists(path):
+            if self.responder is None:
+                return None
+            self.process(job)
+        results = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    results[item["key"]] = item.get("response") or {"error": item.get("error")}
+        return results
+
+
+class BatchRunner:
+    """
+    Drives many refinement step generators (see QuestionBuilder.build_qna_steps)
+    round by round. Each round the pending ChainCalls of all generators are
+    answered from the chain cache where possible, the rest are submitted as one
+    batch job per model, and the parsed results are sent back into the
+    generators. Calls that cannot be batched (non-Gemini models) run
+    interactively in the same round.
+
+    Args:
+        backend: GeminiBatchBackend or LocalBatchBackend
+        poll_seconds (float): Pause between status polls
+        max_wait_seconds (float): Give up on a job after this long
+    """
+
+    def __init__(self, backend, poll_seconds=30, max_wait_seconds=24 * 3600, display_name="qna"):
+        self.backend = backend
+        self.poll_seconds = poll_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.display_name = display_name
+        self.rounds = 0
+        self.batched_calls = 0
+        self.cached_calls = 0
+        self.interactive_calls = 0
+
+    def run(self, steps_list):
+        """Run all generators to completion and return their values in order."""
+        results = [None] * len(steps_list)
+        pending = {}
+        for index, steps in enumerate(steps_list):
+            self._advance(index, steps, pending, results, first=True)
+        while pending:
+            self.rounds += 1
+            answers = self.execute(pending)
+            calls, pending = pending, {}
+            for index in calls:
+                self._advance(index, steps_list[index], pending, results, value=answers.get(index))
+        return results
+
+    def _advance(self, index, steps, pending, results, first=False, value=None):
+        try:
+            pending[index] = next(steps) if first else steps.send(value)
+        except StopIteration as stop:
+            results[index] = stop.value
+
+    def execute(self, calls):
+        """Parsed results of a dict of ChainCalls, keyed like the input (None on failure)."""
+        meter = get_meter()
+        answers = {}
+        by_model = {}
+        for index, call in calls.items():
+            if llm_provider(call.llm) != "gemini":
+                self.interactive_calls += 1
+                answers[index] = invoke_chain(call)
+                continue
+            cache, key = cache_key(call)
+            if key is not None:
+                res = cache.get(key)
+                if res is not None:
+                    self.cached_calls += 1
+                    meter.measure(call).finish(cache_hit=True)
+                    answers[index] = res
+                    continue
+            prompt, llm, params = prepare_call(call)
+            model = f"models/{model_name(llm)}"
+            by_model.setdefault(model, []).append((index, call, cache, key, llm, render_request(prompt, llm, params)))
+
+        for model, items in by_model.items():
+            answers.update(self._run_job(model, items))
+        return answers
+
+    def _run_job(self, model, items):
+        meter = get_meter()
+        metered = {str(index): meter.measure(call, llm) for index, call, _, _, llm, _ in items}
+        job = self.backend.submit(model, [(str(index), request) for index, _, _, _, _, request in items],
+                                  f"{self.display_name}-round{self.rounds}")
+        print(f"Submitted batch job {job} with {len(items)} requests")
+        self.batched_calls += len(items)
+
+        started = time.monotonic()
+        responses = self.backend.poll(job)
+        while responses is None:
+            if time.monotonic() - started > self.max_wait_seconds:
+                raise TimeoutError(f"Batch job {job} did not finish in {self.max_wait_seconds} seconds")
+            time.sleep(self.poll_seconds)
+            responses = self.backend.poll(job)
+
+        answers = {}
+        for index, call, cache, key, _, _ in items:
+            response = responses.get(str(index))
+            if response is None or "error" in response:
+                print(f"Batch request {index} failed: {response and response.get('error')}")
+                metered[str(index)].finish(ok=False, batch=True)
+                answers[index] = None
+                continue
+            message = response_message(response)
+            try:
+                res = parse_output(message, call.schema) if call.parse_json else message
+            except Exception as e:
+                print(e)
+                metered[str(index)].finish(message, ok=False, batch=True)
+                answers[index] = None
+                continue
+            metered[str(index)].finish(message, batch=True)
+            if key is not None:
+                cache.put(key, res)
+            answers[index] = res
+        return answers
+
+    def stats(self):
+        return {
+            "rounds": self.rounds,
+            "batched_calls": self.batched_calls,
+            "cached_calls": self.cached_calls,
+            "interactive_calls": self.interactive_calls,
+        }
+
+
+def single_call_steps(call):
+    res = yield call
+    return res
+
+
+def batch_build_qna(builders, runner):
+    """One build_qna round for many QuestionBuilders through a BatchRunner."""
+    steps_list = []
+    spans = []
+    for builder in builders:
+        steps = builder.build_qna_steps()
+        spans.append((len(steps_list), len(steps)))
+        steps_list.extend(steps)
+    stage_results = runner.run(steps_list)
+    return [builder.collect_qna(stage_results[start:start + count])
+            for builder, (start, count) in zip(builders, spans)]
+
+
+def usable_result(result):
+    return (result.get("Question") not in (None, "N/A") and result.get("Answer") not in (None, "N/A")
+            and bool(result.get("Quotes")))
+
+
+def batch_generate_questions(passages, passage_language, country, runner, rounds=5, builder_class=None,
+                             context_cache=None, filter_results=None):
+    """
+    The fill_qna_form_* question loop (`rounds` builder rounds per passage, each
+    seeing the questions kept so far) run for all passages at once, one batch
+    job per refinement step.
+
+    Args:
+        passages (list): Passage texts
+        passage_language (str): Dialect name used in the prompts
+        country (str): Country for challenging questions
+        runner (BatchRunner): Batch driver
+        rounds (int): Builder rounds per passage
+        builder_class: QuestionBuilder class, agent_question_builder's by default
+        context_cache (PassageContextCache): Optional passage context cache
+        filter_results (callable): (results, passage) -> kept results, drops N/A and empty results by default
+
+    Returns:
+        list: Kept results per passage, as QuestionRecords
+    """
+    if builder_class is None:
+        from agent_question_builder import QuestionBuilder as builder_class
+    if filter_results is None:
+        filter_results = lambda results, passage: [r for r in results if isinstance(r, dict) and usable_result(r)]
+
+    stores = [QuestionStore() for _ in passages]
+    for _ in range(rounds):
+        builders = [builder_class(passage, passage_language, country,
+                                  previous_questions=store.window(), context_cache=context_cache)
+                    for passage, store in zip(passages, stores)]
+        for passage, store, results in zip(passages, stores, batch_build_qna(builders, runner)):
+            store.extend(filter_results(results, passage))
+    return [list(store.records) for store in stores]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate questions for many passages through batch jobs")
+    parser.add_argument("passages", nargs="+", help="Text files, one passage each")
+    parser.add_argument("--language", required=True, help="Passage language as used in the prompts")
+    parser.add_argument("--country", required=True)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", default="batch_questions.json")
+    parser.add_argument("--local", metavar="DIR", help="Use the file-based stand-in in DIR instead of the Batch API")
+    parser.add_argument("--poll-seconds", type=float, default=30)
+    args = parser.parse_args()
+
+    passages = []
+    for path in args.passages:
+        with open(path, encoding="utf-8") as f:
+            passages.append(f.read())
+
+    backend = LocalBatchBackend(args.local) if args.local else GeminiBatchBackend()
+    runner = BatchRunner(backend, poll_seconds=args.poll_seconds)
+    results = batch_generate_questions(passages, args.language, args.country, runner, rounds=args.rounds)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump([{"passage": path, "results": [record.as_dict() for record in kept]} for path, kept in zip(args.passages, results)],
+                  f, ensure_ascii=False, indent=2)
+    print(f"Batch runner: {runner.stats()}")
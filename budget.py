@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+from collections import defaultdict
+
+DIFFICULTIES = ("challenging", "moderate", "easy")
+
+# Highest grade of the judge scales: challenging 1-5, moderate 1-3
+DEFAULT_TARGET_COMPLEXITY = {"challenging": 5, "moderate": 3}
+
+
+class BudgetLimits:
+    """
+    Limits of one scope (a passage or one difficulty of it). None is unlimited.
+
+    Args:
+        calls (int): LLM calls, cache hits included
+        tokens (int): Prompt, output and thinking tokens
+        seconds (float): Wall time
+    """
+
+    def __init__(self, calls=None, tokens=None, seconds=None):
+        self.calls = calls
+        self.tokens = tokens
+        self.seconds = seconds
+
+    def exceeded(self, usage):
+        """Name of the first limit that usage reached, or None."""
+        if self.calls is not None and usage.calls >= self.calls:
+            return f"call budget ({self.calls}) used"
+        if self.tokens is not None and usage.tokens >= self.tokens:
+            return f"token budget ({self.tokens}) used"
+        if self.seconds is not None and usage.seconds >= self.seconds:
+            return f"time budget ({self.seconds}s) used"
+        return None
+
+    def __repr__(self):
+        return f"BudgetLimits(calls={self.calls}, tokens={self.tokens}, seconds={self.seconds})"
+
+
+class Usage:
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def add(self, record):
+        self.calls += 1
+        self.tokens += (record.get("prompt_tokens", 0) + record.get("output_tokens", 0)
+                        + record.get("thinking_tokens", 0))
+        self.seconds += record.get("wall_time", 0.0)
+
+    def as_dict(self):
+        return {"calls": self.calls, "tokens": self.tokens, "seconds": round(self.seconds, 1)}
+
+
+class StageLedger:
+    """
+    Usage of one stage run (one question being generated, judged and refined).
+    Set as ChainCall.budget, so every metered call of the stage is charged here
+    and to the difficulty and passage totals.
+    """
+
+    def __init__(self, budget, difficulty):
+        self.budget = budget
+        self.difficulty = difficulty
+        self.usage = Usage()
+
+    def charge(self, record):
+        with self.budget._lock:
+            self.usage.add(record)
+        self.budget.charge(self.difficulty, record)
+
+    def stop_reason(self):
+        return self.budget.stop_reason(self.difficulty)
+
+
+class PassageBudget:
+    """
+    Call, token and time budget of one passage across all builder rounds, with
+    separate limits per difficulty, and the early-stop rules of the refinement
+    loops.
+
+    The builders check stop_reason before every call and stop refining once a
+    passing candidate reaches the target complexity, keeping the best candidate
+    judged so far. Calls and time are counted per call as they finish, so
+    concurrent stages share the same totals.
+
+    Args:
+        limits (BudgetLimits): Limits of the whole passage; seconds are wall time since creation
+        difficulty_limits (dict): Difficulty -> BudgetLimits; seconds are summed call time
+        target_complexity (dict): Difficulty -> complexity at which a passing candidate is kept as is
+    """
+
+    def __init__(self, limits=None, difficulty_limits=None, target_complexity=None):
+        self.limits = limits or BudgetLimits()
+        self.difficulty_limits = difficulty_limits or {}
+        self.target_complexity = DEFAULT_TARGET_COMPLEXITY if target_complexity is None else target_complexity
+        self.started = time.monotonic()
+        self.total = Usage()
+        self.by_difficulty = defaultdict(Usage)
+        self.stops = defaultdict(int)
+        self.accepted = []
+        self._lock = threading.Lock()
+
+    def stage(self, difficulty):
+        return StageLedger(self, difficulty)
+
+    def charge(self, difficulty, record):
+        with self._lock:
+            self.total.add(record)
+            self.by_difficulty[difficulty].add(record)
+
+    def stop_reason(self, difficulty):
+        """Why no further call should be made for difficulty, or None while budget remains."""
+        with self._lock:
+            passage_usage = Usage()
+            passage_usage.calls = self.total.calls
+            passage_usage.tokens = self.total.tokens
+            passage_usage.seconds = time.monotonic() - self.started
+            reason = self.limits.exceeded(passage_usage)
+            if reason is not None:
+                return f"passage {reason}"
+            limits = self.difficulty_limits.get(difficulty)
+            if limits is not None:
+                reason = limits.exceeded(self.by_difficulty[difficulty])
+                if reason is not None:
+                    return reason
+        return None
+
+    def target_reached(self, difficulty, complexity):
+        target = self.target_complexity.get(difficulty)
+        return target is not None and complexity >= target
+
+    def record_stop(self, difficulty, reason):
+        print(f"Stopping {difficulty} refinement: {reason}")
+        # Budget reasons carry their limit, counted by rule only
+        rule = reason.split(" (")[0]
+        with self._lock:
+            self.stops[f"{difficulty}: {rule}"] += 1
+
+    def record_accepted(self, ledger, question):
+        """Keep how much of the budget the stage used to produce an accepted question."""
+        entry = {"Difficulty": ledger.difficulty, "Question": question, **ledger.usage.as_dict()}
+        with self._lock:
+            self.accepted.append(entry)
+
+    def report(self):
+        with self._lock:
+            return {
+                "total": {**self.total.as_dict(), "wall_seconds": round(time.monotonic() - self.started, 1)},
+                "by_difficulty": {difficulty: usage.as_dict() for difficulty, usage in self.by_difficulty.items()},
+                "stops": dict(self.stops),
+                "accepted": list(self.accepted),
+            }
+
+
+def _env_number(name, cast):
+    value = os.getenv(name)
+    return cast(value) if value not in (None, "") else None
+
+
+def passage_budget_from_env():
+    """
+    New PassageBudget with limits from the environment, unlimited by default.
+
+    PASSAGE_MAX_CALLS, PASSAGE_MAX_TOKENS and PASSAGE_MAX_SECONDS limit a
+    passage; CHALLENGING_MAX_CALLS, MODERATE_MAX_TOKENS, ... limit one
+    difficulty. TARGET_COMPLEXITY_CHALLENGING and TARGET_COMPLEXITY_MODERATE
+    override the early-stop grades, 0 turns the rule off.
+    """
+    def limits(prefix):
+        return BudgetLimits(calls=_env_number(f"{prefix}_MAX_CALLS", int),
+                            tokens=_env_number(f"{prefix}_MAX_TOKENS", int),
+                            seconds=_env_number(f"{prefix}_MAX_SECONDS", float))
+
+    target_complexity = {}
+    for difficulty, default in DEFAULT_TARGET_COMPLEXITY.items():
+        target = _env_number(f"TARGET_COMPLEXITY_{difficulty.upper()}", int)
+        target = default if target is None else target
+        if target > 0:
+            target_complexity[difficulty] = target
+    return PassageBudget(limits=limits("PASSAGE"),
+                         difficulty_limits={difficulty: limits(difficulty.upper()) for difficulty in DIFFICULTIES},
+                         target_complexity=target_complexity)
+
+
+def print_budget_report(label, budget):
+    report = budget.report()
+    print(f"Budget {label}: {report['total']}")
+    for difficulty, usage in sorted(report["by_difficulty"].items()):
+        print(f"  {difficulty}: {usage}")
+    for stop, count in sorted(report["stops"].items()):
+        print(f"  stopped ({stop}): {count}")
+    for entry in report["accepted"]:
+        print(f"  accepted {entry['Difficulty']} after {entry['calls']} calls, {entry['tokens']} tokens, "
+              f"{entry['seconds']}s: {entry['Question']}")
@@ -11,6 +11,7 @@ import re
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_api import execute_request, load_credentials
 import json
 from langchain_core.output_parsers import JsonOutputParser
 from agent_question_builder import QuestionBuilder
@@ -83,11 +84,11 @@ records_log = get_qnq_log()
 
 def get_survey_results(survey_id, tab):
     global records_log
-    creds = service_account.Credentials.from_service_account_file(
+    creds = load_credentials(
         'google_api_credentials2.json', scopes=SCOPES)
     service = build('sheets', 'v4', credentials=creds)
     sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=survey_id, range=f"{tab}!B5:I22").execute()
+    result = execute_request(sheet.values().get(spreadsheetId=survey_id, range=f"{tab}!B5:I22"))
     table_array = result.get('values', [])
     table_len = len(table_array)
     records = []
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict
+from langchain_core.messages import message_to_dict, messages_from_dict
+from llm_cache import llm_fingerprint, prompt_template_text
+
+RECORD = "record"
+REPLAY = "replay"
+DEFAULT_CASSETTE_PATH = "cassettes/run.jsonl"
+
+
+class CassetteMissError(KeyError):
+    """Replay asked for a request that was not recorded."""
+
+
+class RecordedError(Exception):
+    """An error replayed from a cassette; subclassed per recorded type name so retries classify it the same."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def request_hash(request):
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+                          .encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    JSONL file of every request a run sent to an LLM or to Sheets/Drive and what
+    came back (response or error, with latency).
+
+    In record mode requests go out as usual and are appended to the file. In
+    replay mode nothing leaves the machine: each request is answered from the
+    file, after the recorded latency (times `latency_scale`, 0 for none). As in
+    the chain cache, identical requests are numbered by occurrence, so repeated
+    samples and retried attempts replay in the order they were recorded.
+
+    Args:
+        path (str): Cassette file
+        mode (str): RECORD or REPLAY
+        latency_scale (float): Multiplier on recorded latencies during replay
+    """
+
+    def __init__(self, path=DEFAULT_CASSETTE_PATH, mode=REPLAY, latency_scale=1.0):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.entries = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.replayed_latency = 0.0
+        self._occurrences = defaultdict(int)
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            for entry in load_entries(path):
+                self.entries[entry["key"]] = entry
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def key_for(self, request):
+        base_hash = request_hash(request)
+        with self._lock:
+            occurrence = self._occurrences[base_hash]
+            self._occurrences[base_hash] += 1
+        return f"{base_hash}:{occurrence}"
+
+    def record(self, kind, key, request, latency, response=None, error=None):
+        entry = {"kind": kind, "key": key, "request": request, "latency": round(latency, 4)}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                raise CassetteMissError(f"Request {key} not in cassette {self.path}")
+            self.replayed += 1
+            delay = entry["latency"] * self.latency_scale
+            self.replayed_latency += delay
+        return entry, delay
+
+    def run(self, kind, request, send, encode, decode):
+        """
+        Send a request through the cassette.
+
+        Args:
+            kind (str): "llm" or "google"
+            request (dict): JSON description of the request, hashed into its key
+            send (callable): Performs the real request (record mode)
+            encode (callable): Result -> JSON response to store
+            decode (callable): Stored response -> result
+        """
+        key = self.key_for(request)
+        if self.replaying:
+            entry, delay = self.lookup(key)
+            if delay:
+                time.sleep(delay)
+            return replay_entry(entry, decode)
+        started = time.monotonic()
+        try:
+            result = send()
+        except Exception as e:
+            self.record(kind, key, request, time.monotonic() - started, error=error_entry(e))
+            raise
+        self.record(kind, key, request, time.monotonic() - started, response=encode(result))
+        return result
+
+    async def arun(self, kind, request, send, encode, decode):
+        """Async counterpart of run; send returns an awaitable."""
+        key = self.key_for(request)
+        if self.replaying:
+            entry, delay = self.lookup(key)
+            if delay:
+                await asyncio.sleep(delay)
+            return replay_entry(entry, decode)
+        started = time.monotonic()
+        try:
+            result = await send()
+        except Exception as e:
+            self.record(kind, key, request, time.monotonic() - started, error=error_entry(e))
+            raise
+        self.record(kind, key, request, time.monotonic() - started, response=encode(result))
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "mode": self.mode,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses,
+                "replayed_latency": round(self.replayed_latency, 3),
+            }
+
+
+def load_entries(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def error_entry(error):
+    status = getattr(getattr(error, "resp", None), "status", None) or getattr(error, "status_code", None) \
+        or getattr(error, "code", None)
+    entry = {"type": type(error).__name__, "message": str(error), "status": status}
+    content = getattr(error, "content", None)
+    if isinstance(content, bytes):
+        entry["content"] = content.decode("utf-8", errors="replace")
+    return entry
+
+
+def replay_entry(entry, decode):
+    error = entry.get("error")
+    if error is None:
+        return decode(entry["response"])
+    if error["type"] == "HttpError":
+        import httplib2
+        from googleapiclient.errors import HttpError
+        raise HttpError(httplib2.Response({"status": error["status"]}),
+                        error.get("content", error["message"]).encode("utf-8"),
+                        uri=entry["request"].get("uri"))
+    raise type(error["type"], (RecordedError,), {})(error["message"], error["status"])
+
+
+def llm_request(call):
+    """The request a ChainCall stands for, before passage caching and schema binding change its transport."""
+    try:
+        prompt = [[message.type, message.content] for message in call.prompt.format_messages(**call.params)]
+    except Exception:
+        prompt = prompt_template_text(call.prompt)
+    return {
+        "prompt": prompt,
+        "params": call.params,
+        "llm": llm_fingerprint(call.llm),
+        "schema": call.schema.__name__ if call.schema is not None else None,
+        "streamed": call.abort_when is not None,
+    }
+
+
+def encode_message(message):
+    return message_to_dict(message)
+
+
+def decode_message(response):
+    return messages_from_dict([response])[0]
+
+
+def google_request(request):
+    return {"method": request.method, "uri": request.uri, "body": request.body}
+
+
+_default_cassette = None
+_default_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """
+    Process-wide cassette configured from the environment, or None when off.
+
+    CASSETTE=record|replay turns it on, CASSETTE_PATH sets the file and
+    CASSETTE_LATENCY the replay latency: "original" (default), "none" or a
+    multiplier such as 0.5.
+    """
+    global _default_cassette
+    with _default_cassette_lock:
+        if _default_cassette is None:
+            mode = os.getenv("CASSETTE", "off").lower()
+            if mode not in (RECORD, REPLAY):
+                _default_cassette = False
+            else:
+                latency = os.getenv("CASSETTE_LATENCY", "original").lower()
+                scale = {"original": 1.0, "none": 0.0}.get(latency)
+                _default_cassette = Cassette(
+                    path=os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH),
+                    mode=mode,
+                    latency_scale=float(latency) if scale is None else scale,
+                )
+        return _default_cassette or None
+
+
+def set_cassette(cassette):
+    """Replace the process-wide cassette (None turns it off)."""
+    global _default_cassette
+    with _default_cassette_lock:
+        _default_cassette = cassette if cassette is not None else False
+
+
+def replaying():
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
+
+
+def summarize(entries):
+    """Request count, errors and recorded latency per kind."""
+    summary = {}
+    for entry in entries:
+        kind = summary.setdefault(entry["kind"], {"requests": 0, "errors": 0, "latency": 0.0})
+        kind["requests"] += 1
+        kind["errors"] += 1 if "error" in entry else 0
+        kind["latency"] += entry["latency"]
+    for kind in summary.values():
+        kind["latency"] = round(kind["latency"], 3)
+    return summary
+
+
+if __name__ == "__main__":
+    # Time spent waiting on the network in a recorded run; run the same script with
+    # CASSETTE=replay CASSETTE_LATENCY=none to measure the orchestration overhead alone
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH)
+    for kind, stats in summarize(load_entries(path)).items():
+        print(f"{kind}: {stats['requests']} requests, {stats['errors']} errors, {stats['latency']}s recorded latency")
@@ -0,0 +1,286 @@
+from llm_cache import get_chain_cache
+from llm_registry import llm_provider
+from rate_limiter import get_rate_limiter, estimate_prompt_tokens
+from metering import get_meter
+from streaming_json import message_text, parse_partial
+from output_repair import repair_json
+from schemas import bind_schema, validate_output
+from retry_policy import get_retry_policy, check_safety, classify_error, OutputParseError
+from cassette import get_cassette, llm_request, encode_message, decode_message
+from stage_settings import stage_settings_for
+
+
+class ChainCall:
+    """
+    A single `prompt | llm` invocation with JSON output that has been described
+    but not yet run.
+
+    The question builders express their refinement loops as generators that yield
+    ChainCall objects and receive the parsed JSON back, so the same loop can be
+    driven synchronously (run_steps) or on an event loop (arun_steps).
+    """
+
+    def __init__(self, prompt, llm, params, stage=None, difficulty=None, use_cache=True, context=None,
+                 parse_json=True, abort_when=None, schema=None, budget=None, variant=None):
+        self.prompt = prompt
+        # Thinking budget, output cap and timeout of this stage (llm_stages.yaml), bound
+        # on the shared client so cache keys and cassettes see them too
+        self.settings = stage_settings_for(stage, difficulty)
+        self.llm = self.settings.bind(llm) if self.settings is not None else llm
+        self.params = params
+        self.stage = stage
+        self.difficulty = difficulty
+        self.use_cache = use_cache
+        # PassageContext of the passage in params, if it was registered with a context cache
+        self.context = context
+        # False returns the raw AIMessage (never cached)
+        self.parse_json = parse_json
+        # Predicate on the partially parsed JSON; when set the response is streamed
+        # and cancelled as soon as it returns True, and the partial dict is returned
+        self.abort_when = abort_when
+        # Pydantic model of the expected JSON, sent to the model as a response schema
+        self.schema = schema
+        # StageLedger of a PassageBudget, charged with the metered usage of this call
+        self.budget = budget
+        # Prompt variant, e.g. the judge verdict format, so the meter can compare variants
+        self.variant = variant
+
+    def __repr__(self):
+        return f"ChainCall(stage={self.stage!r}, difficulty={self.difficulty!r})"
+
+
+def cache_key(call):
+    # Under a cassette every call goes through it, so recordings and replays see the same requests
+    if not call.use_cache or not call.parse_json or get_cassette() is not None:
+        return None, None
+    cache = get_chain_cache()
+    if cache is None:
+        return None, None
+    return cache, cache.key_for(call.prompt, call.llm, call.params)
+
+
+def prepare_call(call):
+    """Prompt, llm and params to send, with the passage swapped for its cached context."""
+    prompt, llm, params = call.prompt, call.llm, call.params
+    if call.context is not None:
+        prompt, llm, params = call.context.prepare(prompt, llm, params)
+    if call.schema is not None:
+        llm = bind_schema(llm, call.schema)
+    return prompt, llm, params
+
+
+def parse_output(message, schema=None):
+    """
+    Parse the JSON in a model response, repairing near-valid output locally
+    instead of failing the call, and validate it against `schema` if given.
+    """
+    text = message_text(message)
+    data = repair_json(text)
+    if data is None:
+        raise OutputParseError(f"Could not parse JSON output: {text[:200]}")
+    if schema is not None:
+        data = validate_output(data, schema)
+    return data
+
+
+def stream_until(runnable, params, abort_when):
+    """
+    Stream a `prompt | llm` runnable, parsing the JSON as it arrives.
+
+    Returns:
+        (message, partial): the message received so far and, if abort_when fired,
+        the partial dict it fired on (the stream is closed at that point), else None
+    """
+    message = None
+    stream = runnable.stream(params)
+    try:
+        for chunk in stream:
+            message = chunk if message is None else message + chunk
+            partial = parse_partial(message_text(message))
+            if partial is not None and abort_when(partial):
+                return message, partial
+    finally:
+        stream.close()
+    return message, None
+
+
+async def astream_until(runnable, params, abort_when):
+    message = None
+    stream = runnable.astream(params)
+    try:
+        async for chunk in stream:
+            message = chunk if message is None else message + chunk
+            partial = parse_partial(message_text(message))
+            if partial is not None and abort_when(partial):
+                return message, partial
+    finally:
+        await stream.aclose()
+    return message, None
+
+
+def replayed(message, abort_when):
+    """(message, partial) of a replayed response, as stream_until would have returned it."""
+    if abort_when is None:
+        return message, None
+    partial = parse_partial(message_text(message))
+    return message, partial if partial is not None and abort_when(partial) else None
+
+
+def send(call, prompt, llm, params):
+    """Invoke (or stream) the prepared call once, through the cassette if one is active."""
+    def transmit():
+        if call.abort_when is None:
+            return (prompt | llm).invoke(params), None
+        return stream_until(prompt | llm, params, call.abort_when)
+
+    cassette = get_cassette()
+    if cassette is None:
+        return transmit()
+    return cassette.run("llm", llm_request(call), transmit, lambda result: encode_message(result[0]),
+                        lambda response: replayed(decode_message(response), call.abort_when))
+
+
+async def asend(call, prompt, llm, params):
+    async def transmit():
+        if call.abort_when is None:
+            return await (prompt | llm).ainvoke(params), None
+        return await astream_until(prompt | llm, params, call.abort_when)
+
+    cassette = get_cassette()
+    if cassette is None:
+        return await transmit()
+    return await cassette.arun("llm", llm_request(call), transmit, lambda result: encode_message(result[0]),
+                               lambda response: replayed(decode_message(response), call.abort_when))
+
+
+def invoke_chain(call):
+    """
+    Run a ChainCall through the cache, rate limiter and retry policy.
+
+    Returns:
+        The parsed JSON (or the raw message when parse_json is False), the partial
+        dict if the call was aborted, or None once the retry policy gives up
+    """
+    meter = get_meter()
+    cache, key = cache_key(call)
+    if key is not None:
+        res = cache.get(key)
+        if res is not None:
+            meter.measure(call).finish(cache_hit=True)
+            return res
+    
+    prompt, llm, params = prepare_call(call)
+    provider = llm_provider(llm)
+    limiter = get_rate_limiter(provider)
+    # Last response seen, so usage is still metered when every attempt fails
+    last = {"message": None}
+
+    def attempt():
+        last["message"] = None
+        with limiter.limit(tokens=estimate_prompt_tokens(prompt, params)):
+            message, partial = send(call, prompt, llm, params)
+        last["message"] = message
+        if partial is not None:
+            return message, partial, None
+        if not call.parse_json:
+            # Raw-message callers (the censorship check) inspect blocked responses themselves
+            return message, None, message
+        check_safety(message)
+        return message, None, parse_output(message, call.schema)
+
+    with meter.measure(call, llm) as metered:
+        def on_retry(error_class, delay):
+            metered.retries += 1
+        try:
+            message, partial, res = get_retry_policy().call(attempt, provider, on_retry)
+        except Exception as e:
+            print(f"{call!r} failed ({classify_error(e)}): {e}")
+            metered.finish(last["message"], ok=False)
+            return None
+        if partial is not None:
+            # Decided before the model finished: not cached, the full answer was never seen
+            metered.finish(message, aborted=True)
+            return partial
+        metered.finish(message)
+    
+    if key is not None:
+        cache.put(key, res)
+    return res
+
+
+async def ainvoke_chain(call):
+    meter = get_meter()
+    cache, key = cache_key(call)
+    if key is not None:
+        res = cache.get(key)
+        if res is not None:
+            meter.measure(call).finish(cache_hit=True)
+            return res
+    
+    prompt, llm, params = prepare_call(call)
+    provider = llm_provider(llm)
+    limiter = get_rate_limiter(provider)
+    last = {"message": None}
+
+    async def attempt():
+        last["message"] = None
+        async with limiter.alimit(tokens=estimate_prompt_tokens(prompt, params)):
+            message, partial = await asend(call, prompt, llm, params)
+        last["message"] = message
+        if partial is not None:
+            return message, partial, None
+        if not call.parse_json:
+            # Raw-message callers (the censorship check) inspect blocked responses themselves
+            return message, None, message
+        check_safety(message)
+        return message, None, parse_output(message, call.schema)
+
+    with meter.measure(call, llm) as metered:
+        def on_retry(error_class, delay):
+            metered.retries += 1
+        try:
+            message, partial, res = await get_retry_policy().acall(attempt, provider, on_retry)
+        except Exception as e:
+            print(f"{call!r} failed ({classify_error(e)}): {e}")
+            metered.finish(last["message"], ok=False)
+            return None
+        if partial is not None:
+            # Decided before the model finished: not cached, the full answer was never seen
+            metered.finish(message, aborted=True)
+            return partial
+        metered.finish(message)
+    
+    if key is not None:
+        cache.put(key, res)
+    return res
+
+
+def budgeted_steps(steps, ledger):
+    """Forward the calls of sub-steps (e.g. a judge's) unchanged, charging them to a budget ledger."""
+    try:
+        call = next(steps)
+        while True:
+            call.budget = ledger
+            call = steps.send((yield call))
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_steps(steps):
+    """Drive a generator of ChainCall objects to completion and return its value."""
+    try:
+        call = next(steps)
+        while True:
+            call = steps.send(invoke_chain(call))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun_steps(steps):
+    """Async counterpart of run_steps, each yielded call is awaited with ainvoke."""
+    try:
+        call = next(steps)
+        while True:
+            call = steps.send(await ainvoke_chain(call))
+    except StopIteration as stop:
+        return stop.value
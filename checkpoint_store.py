@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CHECKPOINT_PATH = "checkpoints.sqlite"
+
+
+def passage_hash(passage):
+    return hashlib.sha256(passage.encode("utf-8")).hexdigest()
+
+
+class PassageCheckpoint:
+    """
+    Checkpoint of one (document, tab, passage) as stored on disk.
+
+    Attributes:
+        rounds (list): One dict per completed builder round, in order, with
+            "results", "accepted", "rejected" and "verdicts"
+        form_written (bool): All questions and the passage were written to the form
+        final_results (list): Questions written to the form, when form_written
+    """
+
+    def __init__(self, store, doc_id, tab, passage):
+        self.store = store
+        self.doc_id = doc_id
+        self.tab = str(tab)
+        self.passage = passage
+        self.passage_hash = passage_hash(passage)
+        self.rounds = []
+        self.form_written = False
+        self.final_results = None
+
+    @property
+    def accepted(self):
+        """Accepted questions of all completed rounds, in round order."""
+        return [result for round_ in self.rounds for result in round_["accepted"]]
+
+    def record_round(self, results, accepted, verdicts=None):
+        """
+        Store a completed builder round. Candidates in results that are not in
+        accepted are stored as rejected.
+        """
+        rejected = [result for result in results if result not in accepted]
+        round_ = {"results": results, "accepted": accepted, "rejected": rejected, "verdicts": verdicts or []}
+        self.store.put_round(self, len(self.rounds), round_)
+        self.rounds.append(round_)
+
+    def record_form_written(self, final_results):
+        self.store.set_form_written(self, final_results)
+        self.form_written = True
+        self.final_results = final_results
+
+
+class CheckpointStore:
+    """
+    Durable progress of the form-filling runs, so a run that dies partway
+    through a folder (crash, quota stop, too few questions) resumes where it
+    stopped instead of regenerating every passage.
+
+    Checkpoints are keyed by document, tab and a SHA-256 of the restored
+    passage: if a transcript is corrected after a run, its passage hash changes
+    and the passage starts over. A round is stored only once the builder
+    returned, so a rerun continues from the last completed round.
+
+    Args:
+        path (str): SQLite file
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self.resumed_rounds = 0
+        self.skipped_passages = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS passages ("
+            "doc_id TEXT NOT NULL, tab TEXT NOT NULL, passage_hash TEXT NOT NULL, passage TEXT NOT NULL, "
+            "form_written INTEGER NOT NULL DEFAULT 0, final_results TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (doc_id, tab, passage_hash))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rounds ("
+            "doc_id TEXT NOT NULL, tab TEXT NOT NULL, passage_hash TEXT NOT NULL, round INTEGER NOT NULL, "
+            "results TEXT NOT NULL, accepted TEXT NOT NULL, rejected TEXT NOT NULL, verdicts TEXT NOT NULL, "
+            "created_at REAL NOT NULL, PRIMARY KEY (doc_id, tab, passage_hash, round))"
+        )
+        self._conn.commit()
+
+    def load(self, doc_id, tab, passage):
+        """
+        Checkpoint of a restored passage, with the rounds and form status of
+        earlier runs. The passage is recorded when it is seen for the first time.
+
+        Args:
+            doc_id (str): Transcript document
+            tab (str | int): Tab of the document
+            passage (str): Restored passage text
+
+        Returns:
+            PassageCheckpoint
+        """
+        checkpoint = PassageCheckpoint(self, doc_id, tab, passage)
+        key = (checkpoint.doc_id, checkpoint.tab, checkpoint.passage_hash)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT form_written, final_results FROM passages WHERE doc_id = ? AND tab = ? AND passage_hash = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO passages (doc_id, tab, passage_hash, passage, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    key + (passage, time.time()),
+                )
+                self._conn.commit()
+                return checkpoint
+            rows = self._conn.execute(
+                "SELECT results, accepted, rejected, verdicts FROM rounds "
+                "WHERE doc_id = ? AND tab = ? AND passage_hash = ? ORDER BY round",
+                key,
+            ).fetchall()
+        checkpoint.form_written = bool(row[0])
+        checkpoint.final_results = json.loads(row[1]) if row[1] else None
+        checkpoint.rounds = [
+            {"results": json.loads(r[0]), "accepted": json.loads(r[1]), "rejected": json.loads(r[2]),
+             "verdicts": json.loads(r[3])}
+            for r in rows
+        ]
+        with self._lock:
+            if checkpoint.form_written:
+                self.skipped_passages += 1
+            else:
+                self.resumed_rounds += len(checkpoint.rounds)
+        return checkpoint
+
+    def put_round(self, checkpoint, round_number, round_):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rounds "
+                "(doc_id, tab, passage_hash, round, results, accepted, rejected, verdicts, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (checkpoint.doc_id, checkpoint.tab, checkpoint.passage_hash, round_number,
+                 json.dumps(round_["results"], ensure_ascii=False),
+                 json.dumps(round_["accepted"], ensure_ascii=False),
+                 json.dumps(round_["rejected"], ensure_ascii=False),
+                 json.dumps(round_["verdicts"], ensure_ascii=False), time.time()),
+            )
+            self._conn.execute(
+                "UPDATE passages SET updated_at = ? WHERE doc_id = ? AND tab = ? AND passage_hash = ?",
+                (time.time(), checkpoint.doc_id, checkpoint.tab, checkpoint.passage_hash),
+            )
+            self._conn.commit()
+
+    def set_form_written(self, checkpoint, final_results):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE passages SET form_written = 1, final_results = ?, updated_at = ? "
+                "WHERE doc_id = ? AND tab = ? AND passage_hash = ?",
+                (json.dumps(final_results, ensure_ascii=False), time.time(),
+                 checkpoint.doc_id, checkpoint.tab, checkpoint.passage_hash),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            passages, written = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(form_written), 0) FROM passages").fetchone()
+            rounds = self._conn.execute("SELECT COUNT(*) FROM rounds").fetchone()[0]
+            return {
+                "passages": passages,
+                "form_written": written,
+                "rounds": rounds,
+                "skipped_passages": self.skipped_passages,
+                "resumed_rounds": self.resumed_rounds,
+            }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """
+    Process-wide checkpoint store configured from the environment, or None when disabled.
+
+    CHECKPOINTS=off disables it, CHECKPOINT_PATH sets the SQLite file.
+    """
+    global _default_store
+    if os.getenv("CHECKPOINTS", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    with _default_store_lock:
+        if _default_store is False:
+            return None
+        if _default_store is None:
+            _default_store = CheckpointStore(path=os.getenv("CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH))
+        return _default_store
+
+
+def set_checkpoint_store(store):
+    """Replace the process-wide store (None disables checkpoints)."""
+    global _default_store
+    with _default_store_lock:
+        _default_store = store if store is not None else False
@@ -10,6 +10,7 @@ import random
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_api import execute_request, get_service
 import json
 from langchain_core.output_parsers import JsonOutputParser
 import time
@@ -71,11 +72,15 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-passage_paragraphs = []
-
-speaker_mark = None
-
-paragraph_mark = None
+class TranscriptState:
+  """
+  Paragraphs collected while reading one transcript tab row by row. Each call of
+  get_corrected_transcription has its own, so tabs can be restored concurrently.
+  """
+  def __init__(self):
+    self.passage_paragraphs = []
+    self.speaker_mark = None
+    self.paragraph_mark = None
 
 def get_file_ids_from_folder(folder_link):
   # Extract folder ID from the full URL
@@ -84,24 +89,18 @@ def get_file_ids_from_folder(folder_link):
   else:
     folder_id = folder_link  # Assume it's already just the ID
   
-  creds = service_account.Credentials.from_service_account_file(
-    'google_api_credentials2.json', scopes=SCOPES)
-  
-  service = build("drive", "v3", credentials=creds)
-  files = service.files().list(q=f"parents='{folder_id}'").execute()
+  service = get_service("drive", "v3", 'google_api_credentials2.json', SCOPES)
+  files = execute_request(service.files().list(q=f"parents='{folder_id}'"))
   return [(file['id'], file['name']) for file in files.get('files', [])]
 
 def get_document_tab_names(doc_id):
   """Get sheet names (tabs) and IDs from a Google Sheet"""
-  creds = service_account.Credentials.from_service_account_file(
-    'google_api_credentials2.json', scopes=SCOPES)
-  
-  service = build("sheets", "v4", credentials=creds)
+  service = get_service("sheets", "v4", 'google_api_credentials2.json', SCOPES)
   sheet = service.spreadsheets()
   
   try:
     # Get the spreadsheet metadata which includes sheet names and IDs
-    result = sheet.get(spreadsheetId=doc_id).execute()
+    result = execute_request(sheet.get(spreadsheetId=doc_id))
     sheet_info = [(sheet['properties']['title'], sheet['properties']['sheetId']) for sheet in result.get('sheets', [])]
     return sheet_info
   except HttpError as error:
@@ -113,7 +112,7 @@ def get_document_tab_names(doc_id):
 
 
 def get_table(service,doc_id, tab_name, cell_range):
-  result = service.spreadsheets().values().get(spreadsheetId=doc_id, range=f"{tab_name}!{cell_range}").execute()
+  result = execute_request(service.spreadsheets().values().get(spreadsheetId=doc_id, range=f"{tab_name}!{cell_range}"))
   res = result.get('values', None)
   if res is None:
     return None
@@ -123,11 +122,11 @@ def get_table_with_background(service,doc_id, tab_name, cell_range):
   """Get table data with background color information for each cell"""
   try:
     # Get cell data with formatting information including background colors
-    result = service.spreadsheets().get(
+    result = execute_request(service.spreadsheets().get(
       spreadsheetId=doc_id,
       ranges=f"{tab_name}!{cell_range}",
       fields="sheets(data(rowData(values(userEnteredFormat/backgroundColor,formattedValue))))"
-    ).execute()
+    ))
     
     sheets = result.get('sheets', [])
     if not sheets:
@@ -165,11 +164,11 @@ def get_hyperlink(service, doc_id, tab_name, cell_range):
   """Get hyperlink URL from a cell in Google Sheets"""
   try:
     # Get the cell data with hyperlink information
-    result = service.spreadsheets().get(
+    result = execute_request(service.spreadsheets().get(
       spreadsheetId=doc_id,
       ranges=f"{tab_name}!{cell_range}",
       fields="sheets(data(rowData(values(hyperlink,formattedValue))))"
-    ).execute()
+    ))
     
     # Extract hyperlink from the response
     sheets = result.get('sheets', [])
@@ -236,47 +235,46 @@ def get_corrected_speaker_mark(table, row_number):
 
 SKIPPED_TOKEN = "{" + "تم تخطيه" + "}"
 
-def process_row(table, color_table, row_number):
+def process_row(table, color_table, row_number, state):
   """Extract value from column A at specified row number"""
-  global speaker_mark, paragraph_mark, passage_paragraphs
   
   first_cell_value = table[row_number][0]
   
   if not isNone(first_cell_value):
     if  'المتحدث' in first_cell_value.lower():
-      speaker_mark = first_cell_value
-      passage_paragraphs.append([speaker_mark])
-      passage_paragraphs.append([])
-      paragraph_mark = None
+      state.speaker_mark = first_cell_value
+      state.passage_paragraphs.append([state.speaker_mark])
+      state.passage_paragraphs.append([])
+      state.paragraph_mark = None
     else:
-      if len(passage_paragraphs) == 0 or len(passage_paragraphs[-1]) > 0:
-        passage_paragraphs.append([])
-      paragraph_mark = first_cell_value
+      if len(state.passage_paragraphs) == 0 or len(state.passage_paragraphs[-1]) > 0:
+        state.passage_paragraphs.append([])
+      state.paragraph_mark = first_cell_value
   
   corrected_speaker_mark = get_corrected_speaker_mark(table, row_number)
   
   if not isNone(corrected_speaker_mark):  
-    speaker_mark = corrected_speaker_mark
-    passage_paragraphs.append([speaker_mark])
-    passage_paragraphs.append([])
-    paragraph_mark = str(uuid4())
+    state.speaker_mark = corrected_speaker_mark
+    state.passage_paragraphs.append([state.speaker_mark])
+    state.passage_paragraphs.append([])
+    state.paragraph_mark = str(uuid4())
 
   
-  if isNone(speaker_mark):
+  if isNone(state.speaker_mark):
     return
   
-  if isNone(paragraph_mark):
+  if isNone(state.paragraph_mark):
     return
   
   skip_mark = is_skip_mark(color_table, row_number)
   
   if skip_mark:
-    if len(passage_paragraphs) > 0 and len(passage_paragraphs[-1]) == 0:
-      passage_paragraphs.pop()
+    if len(state.passage_paragraphs) > 0 and len(state.passage_paragraphs[-1]) == 0:
+      state.passage_paragraphs.pop()
       
-    if len(passage_paragraphs) == 0 or passage_paragraphs[-1][0] != SKIPPED_TOKEN:
-      passage_paragraphs.append([SKIPPED_TOKEN])
-      passage_paragraphs.append([])
+    if len(state.passage_paragraphs) == 0 or state.passage_paragraphs[-1][0] != SKIPPED_TOKEN:
+      state.passage_paragraphs.append([SKIPPED_TOKEN])
+      state.passage_paragraphs.append([])
     print(f"Skipping row {row_number}")
     return
   
@@ -285,7 +283,7 @@ def process_row(table, color_table, row_number):
   original_value = table[row_number][1]
   
   if isNone(second_cell_value) and isNone(original_value):
-    paragraph_mark = None
+    state.paragraph_mark = None
   
   if isNone(second_cell_value):
     return
@@ -295,36 +293,25 @@ def process_row(table, color_table, row_number):
   tokens = second_cell_value.split()
   
   for token in tokens:
-    passage_paragraphs[-1].append(token)
+    state.passage_paragraphs[-1].append(token)
     
   return
 
 def write_to_google_sheet(doc_id, tab_name, text, cell_range):
-  creds = service_account.Credentials.from_service_account_file(
-    'google_api_credentials2.json', scopes=SCOPES)
-  
-  service = build("sheets", "v4", credentials=creds)
+  service = get_service("sheets", "v4", 'google_api_credentials2.json', SCOPES)
   sheet = service.spreadsheets()
   
-  sheet.values().update(
+  execute_request(sheet.values().update(
     spreadsheetId=doc_id,
     range=f"{tab_name}!{cell_range}",
     valueInputOption="USER_ENTERED",
     body={"values": [[text]]}
-  ).execute()
+  ))
 
 def get_corrected_transcription(doc_id, tab_name):
-  global passage_paragraphs, speaker_mark, paragraph_mark
+  state = TranscriptState()
   
-  # Reset global variables
-  passage_paragraphs = []
-  speaker_mark = None
-  paragraph_mark = None
-  
-  creds = service_account.Credentials.from_service_account_file(
-    'google_api_credentials2.json', scopes=SCOPES)
-  
-  service = build("sheets", "v4", credentials=creds)
+  service = get_service("sheets", "v4", 'google_api_credentials2.json', SCOPES)
   sheet = service.spreadsheets()
   
   hyperlink = get_hyperlink(service, doc_id, tab_name, 'A2')
@@ -337,19 +324,19 @@ def get_corrected_transcription(doc_id, tab_name):
     raise Exception(f"Table is None for {doc_id} {tab_name}")
   
   for row_number in range(len(table)):
-    process_row(table, color_table, row_number)
+    process_row(table, color_table, row_number, state)
     
   text = f"{hyperlink}\n\n"
   
-  for i in range(len(passage_paragraphs)):
+  for i in range(len(state.passage_paragraphs)):
     
-    words = passage_paragraphs[i]
+    words = state.passage_paragraphs[i]
     
     if len(words) == 0:
       continue
     
-    if i + 1 < len(passage_paragraphs):
-      words_next = passage_paragraphs[i + 1]
+    if i + 1 < len(state.passage_paragraphs):
+      words_next = state.passage_paragraphs[i + 1]
     else:
       words_next = None
       
@@ -384,12 +371,6 @@ if __name__ == "__main__":
     
     for tab_name in tab_names:
       
-      passage_paragraphs.clear()
-
-      speaker_mark = None
-      
-      paragraph_mark = None
-      
       if "status" in tab_name.lower():
         continue
       
@@ -405,7 +386,6 @@ if __name__ == "__main__":
       
       target_row_id += 1
       # break
-      time.sleep(3)
       
     # break
 
@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import tqdm
 import os
@@ -10,8 +9,11 @@ import random
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_api import execute_request, load_credentials
 import json
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
+from chain_runner import ChainCall, invoke_chain
 
 load_dotenv()
 
@@ -53,15 +55,7 @@ TEMPLATE_ID = "1FUHdBALXPddxs6aT_S3lF9wTF0kVXYnYPq72zQo7Ytw"
 
 if __name__ == "__main__":
 
-  llm = ChatGoogleGenerativeAI(
-      model="gemini-2.5-pro",
-      temperature=0.7,
-      max_tokens=None,
-      timeout=None,
-      max_retries=2,
-      api_key=os.getenv("GOOGLE_API_KEY"),
-      # other params...
-  )
+  llm = get_llm(model_name, temperature=0.7)
 
   chain = passage_eval_prompt | llm
   
@@ -75,41 +69,21 @@ if __name__ == "__main__":
 
 def censorship_check(passage, dialect):
   
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        temperature=0.7,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=os.getenv("GOOGLE_API_KEY"),
-    )
-    chain = passage_eval_prompt | llm
-    try:  
-        res = chain.invoke({"passage": passage, "dialect": dialect})
-    except Exception as e:
-        print(e)
-        time.sleep(random.randint(2, 5))
-        return None
-   
-    return res
+    llm = get_llm(model_name, temperature=0.7)
+    # Plain-text answer, so the message is returned as is and not cached
+    return invoke_chain(ChainCall(passage_eval_prompt, llm, {"passage": passage, "dialect": dialect},
+                                  stage="censorship", parse_json=False))
 
 def run_json_prompt(prompt, passage, dialect):
-    chain = prompt | llm | JsonOutputParser()
-    try:  
-        res = chain.invoke({"passage": passage, "dialect": dialect})
-    except Exception as e:
-        print(e)
-        time.sleep(random.randint(2, 5))
-        return None
-   
-    return res
+    # Paced by the shared rate limiter in chain_runner instead of fixed sleeps
+    return invoke_chain(ChainCall(prompt, llm, {"passage": passage, "dialect": dialect}, stage="censorship"))
   
 
 def set_cell_value(cell, value):
     creds = None
     try:
         # Load credentials from service account file
-        creds = service_account.Credentials.from_service_account_file(
+        creds = load_credentials(
             'google_api_credentials2.json', scopes=SCOPES)
 
         # Build the Sheets API service
@@ -117,12 +91,12 @@ def set_cell_value(cell, value):
 
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().update(
+        result = execute_request(sheet.values().update(
             spreadsheetId=TEMPLATE_ID,
             range=f'QnA!{cell}',
             valueInputOption="USER_ENTERED",
             body={"values": [[value]]}
-        ).execute()
+        ))
         
         return result
     except HttpError as err:
@@ -133,7 +107,7 @@ def set_row_value(cell, value):
     creds = None
     try:
         # Load credentials from service account file
-        creds = service_account.Credentials.from_service_account_file(
+        creds = load_credentials(
             'google_api_credentials2.json', scopes=SCOPES)
 
         # Build the Sheets API service
@@ -141,12 +115,12 @@ def set_row_value(cell, value):
 
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().update(
+        result = execute_request(sheet.values().update(
             spreadsheetId=TEMPLATE_ID,
             range=f'QnA!{cell}',
             valueInputOption="USER_ENTERED",
             body={"values": [[value]]}
-        ).execute()
+        ))
         
         return result
     except HttpError as err:
@@ -172,7 +146,7 @@ def set_eval_result(row, result):
         data.append({'range': f'QnA!{result_map[key]}{row}', 'values': [[str(value)]]})
     try:
         # Load credentials from service account file
-        creds = service_account.Credentials.from_service_account_file(
+        creds = load_credentials(
             'google_api_credentials2.json', scopes=SCOPES)
 
         # Build the Sheets API service
@@ -180,10 +154,10 @@ def set_eval_result(row, result):
 
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        sheet.values().batchUpdate(
+        execute_request(sheet.values().batchUpdate(
             spreadsheetId=TEMPLATE_ID,
             body={"valueInputOption": "RAW", "data": data}
-        ).execute()
+        ))
     except HttpError as err:
         print(f"An error occurred: {err}")
 
@@ -204,8 +178,6 @@ if __name__ == "__main__":
         else:
             set_row_value(i+2, "N/A")
 
-        time.sleep(random.randint(5, 10))
-
 
   
   
@@ -1,4 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 import tqdm
 import os
@@ -10,8 +9,11 @@ import random
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_api import execute_request, load_credentials
 import json
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
+from chain_runner import ChainCall, invoke_chain
 
 load_dotenv()
 
@@ -54,15 +56,7 @@ TEMPLATE_ID = "1Z86UWLj3C3JO9iduDVJVMGYNgmbBfyLxxU8G8wlgk4U" # Egy corrected pas
 
 if __name__ == "__main__":
 
-  llm = ChatGoogleGenerativeAI(
-      model="gemini-2.5-pro",
-      temperature=0.3,
-      max_tokens=None,
-      timeout=None,
-      max_retries=2,
-      api_key=os.getenv("GOOGLE_API_KEY"),
-      # other params...
-  )
+  llm = get_llm(model_name, temperature=0.3)
 
   chain = passage_eval_prompt | llm
   
@@ -74,21 +68,14 @@ if __name__ == "__main__":
 ]
 
 def run_json_prompt(prompt, passage, dialect):
-    chain = prompt | llm | JsonOutputParser()
-    try:  
-        res = chain.invoke({"passage": passage, "dialect": dialect})
-    except Exception as e:
-        print(e)
-        time.sleep(random.randint(2, 5))
-        return None
-   
-    return res
+    # Paced by the shared rate limiter in chain_runner instead of fixed sleeps
+    return invoke_chain(ChainCall(prompt, llm, {"passage": passage, "dialect": dialect}, stage="censorship"))
 
 def get_cell_value(service, cell, spreadsheet_id):
     try:
         # Call the Sheets API to get the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=f'QnA!{cell}').execute()
+        result = execute_request(sheet.values().get(spreadsheetId=spreadsheet_id, range=f'QnA!{cell}'))
         return result.get('values', [[None]])[0][0]
     except HttpError as err:
         print(f"An error occurred: {err}")
@@ -98,12 +85,12 @@ def set_cell_value(service, cell, value):
     try:
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().update(
+        result = execute_request(sheet.values().update(
             spreadsheetId=TEMPLATE_ID,
             range=f'QnA!{cell}',
             valueInputOption="USER_ENTERED",
             body={"values": [[value]]}
-        ).execute()
+        ))
         
         return result
     except HttpError as err:
@@ -114,12 +101,12 @@ def set_row_value(service, cell, value, spreadsheet_id):
     try:
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().update(
+        result = execute_request(sheet.values().update(
             spreadsheetId=spreadsheet_id,
             range=f'QnA!{cell}',
             valueInputOption="USER_ENTERED",
             body={"values": [[value]]}
-        ).execute()
+        ))
         
         return result
     except HttpError as err:
@@ -146,17 +133,17 @@ def set_eval_result(service, row, result, spreadsheet_id):
 
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        sheet.values().batchUpdate(
+        execute_request(sheet.values().batchUpdate(
             spreadsheetId=spreadsheet_id,
             body={"valueInputOption": "RAW", "data": data}
-        ).execute()
+        ))
     except HttpError as err:
         print(f"An error occurred: {err}")
 
 if __name__ == "__main__":
   
     # Load credentials from service account file
-    creds = service_account.Credentials.from_service_account_file(
+    creds = load_credentials(
       'google_api_credentials2.json', scopes=SCOPES)
 
     # Build the Sheets API service
@@ -179,8 +166,6 @@ if __name__ == "__main__":
         else:
             set_row_value(service, f"C{i+2}", "N/A", TEMPLATE_ID)
 
-        time.sleep(random.randint(5, 10))
-
 
   
   
@@ -11,6 +11,7 @@ import random
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_api import execute_request, load_credentials
 from agent_question_builder import QuestionBuilder
 
 load_dotenv()
@@ -29,7 +30,7 @@ def set_cell_value(cell, value):
     creds = None
     try:
         # Load credentials from service account file
-        creds = service_account.Credentials.from_service_account_file(
+        creds = load_credentials(
             'google_api_credentials2.json', scopes=SCOPES)
 
         # Build the Sheets API service
@@ -37,12 +38,12 @@ def set_cell_value(cell, value):
 
         # Call the Sheets API to set the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().update(
+        result = execute_request(sheet.values().update(
             spreadsheetId=TEMPLATE_ID,
             range=f'QnA!{cell}',
             valueInputOption="USER_ENTERED",
             body={"values": [[value]]}
-        ).execute()
+        ))
         
         return result
     except HttpError as err:
@@ -53,7 +54,7 @@ def get_cell_value(service, cell, spreadsheet_id):
     try:
         # Call the Sheets API to get the value of the cell
         sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=f'QnA!{cell}').execute()
+        result = execute_request(sheet.values().get(spreadsheetId=spreadsheet_id, range=f'QnA!{cell}'))
         return result.get('values', [[None]])[0][0]
     except HttpError as err:
         print(f"An error occurred: {err}")
@@ -62,7 +63,7 @@ def get_cell_value(service, cell, spreadsheet_id):
 if __name__ == "__main__":
 
     # Load credentials from service account file
-    creds = service_account.Credentials.from_service_account_file(
+    creds = load_credentials(
       'google_api_credentials2.json', scopes=SCOPES)
 
     # Build the Sheets API service
@@ -108,7 +109,5 @@ if __name__ == "__main__":
             set_cell_value(f"Q{i+2}", "N/A")
             
 
-        time.sleep(random.randint(2, 5))
-
 
 
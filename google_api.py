@@ -0,0 +1,65 @@
+import threading
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from google.auth.credentials import AnonymousCredentials
+from rate_limiter import get_rate_limiter
+from retry_policy import get_retry_policy
+from cassette import get_cassette, google_request, replaying
+
+
+def load_credentials(filename, scopes):
+    """
+    Service account credentials from `filename`. A replayed run never reaches
+    Google, so it gets anonymous credentials and needs no key file.
+    """
+    if replaying():
+        return AnonymousCredentials()
+    return service_account.Credentials.from_service_account_file(filename, scopes=scopes)
+
+
+_credentials = {}
+_credentials_lock = threading.Lock()
+_services = threading.local()
+
+
+def get_service(name, version, filename, scopes):
+    """
+    googleapiclient service built once per thread and shared by all calls of
+    that thread. Credentials are loaded once per process. Services are not
+    shared across threads because their HTTP connection is not thread-safe.
+    """
+    key = (filename, tuple(scopes))
+    with _credentials_lock:
+        if key not in _credentials:
+            _credentials[key] = load_credentials(filename, scopes=list(scopes))
+        credentials = _credentials[key]
+    services = getattr(_services, "cache", None)
+    if services is None:
+        services = _services.cache = {}
+    service_key = (name, version) + key
+    if service_key not in services:
+        services[service_key] = build(name, version, credentials=credentials)
+    return services[service_key]
+
+
+def execute_request(request):
+    """
+    Execute a googleapiclient request under the shared Sheets/Drive rate limiter.
+
+    Replaces the fixed sleeps between spreadsheet writes: calls go out as fast as
+    the per-minute quota allows and back off automatically on 429 responses.
+    429, 5xx and timeouts are retried with jittered backoff; other errors
+    (e.g. a 400 on a bad range) are raised straight away.
+    """
+    name = "drive" if "www.googleapis.com/drive" in getattr(request, "uri", "") else "sheets"
+    limiter = get_rate_limiter(name)
+    cassette = get_cassette()
+
+    def attempt():
+        with limiter.limit():
+            if cassette is None:
+                return request.execute()
+            return cassette.run("google", google_request(request), request.execute,
+                                lambda response: response, lambda response: response)
+
+    return get_retry_policy().call(attempt, name)
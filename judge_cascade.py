@@ -0,0 +1,102 @@
+import os
+import threading
+from llm_registry import get_llm
+
+
+def verdict_passed(judgement):
+    """True when no boolean check of a judge verdict came back false."""
+    for key, value in judgement.items():
+        if key.endswith("_reason"):
+            continue
+        if type(value) == bool and value == False:
+            return False
+    return True
+
+
+class JudgeCascade:
+    """
+    Judges refinement iterations with a fast model and only asks the judge's own
+    (strong) model to confirm candidates the fast model passed. A failing fast
+    verdict is used as is: its recommendations drive the next improvement.
+
+    One instance is shared by the builders of a run so the stats cover all of them.
+
+    Args:
+        fast_llm: Chat model for the first verdict
+    """
+
+    def __init__(self, fast_llm):
+        self.fast_llm = fast_llm
+        self.fast_verdicts = 0
+        self.fast_failures = 0
+        self.confirmations = 0
+        self.overturns = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def steps(self, make_call):
+        """
+        Step generator yielding the fast verdict and, if it passed, the strong one.
+
+        Args:
+            make_call (callable): llm, stage -> judge ChainCall
+
+        Returns:
+            The verdict the builder should act on, None if a call failed
+        """
+        fast = yield make_call(self.fast_llm, "judge_fast")
+        if fast is None:
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            self.fast_verdicts += 1
+        if not verdict_passed(fast):
+            with self._lock:
+                self.fast_failures += 1
+            return fast
+        strong = yield make_call(None, "judge")
+        if strong is None:
+            with self._lock:
+                self.errors += 1
+            return None
+        with self._lock:
+            if verdict_passed(strong):
+                self.confirmations += 1
+            else:
+                self.overturns += 1
+        return strong
+
+    def stats(self):
+        with self._lock:
+            passed = self.confirmations + self.overturns
+            return {
+                "fast_verdicts": self.fast_verdicts,
+                "fast_failures": self.fast_failures,
+                "strong_verdicts": passed,
+                "confirmations": self.confirmations,
+                "overturns": self.overturns,
+                # Share of fast passes the strong judge rejected
+                "overturn_rate": self.overturns / passed if passed else 0.0,
+                "errors": self.errors,
+            }
+
+
+def get_judge_cascade():
+    """
+    JudgeCascade over JUDGE_FAST_MODEL (default gemini-2.5-flash) when
+    JUDGE_CASCADE=on, else None and every verdict comes from the strong judge.
+    Off by default until the overturn rate of the fast judge is known to be low.
+    """
+    if os.getenv("JUDGE_CASCADE", "off").lower() not in ("on", "1", "true", "yes"):
+        return None
+    return JudgeCascade(get_llm(os.getenv("JUDGE_FAST_MODEL", "gemini-2.5-flash"), temperature=0.7))
+
+
+def print_cascade_stats(cascade):
+    if cascade is None:
+        return
+    stats = cascade.stats()
+    print(f"Judge cascade: {stats['fast_verdicts']} fast verdicts, {stats['fast_failures']} failed by the fast judge, "
+          f"{stats['strong_verdicts']} rechecked by the strong judge, {stats['overturns']} overturned "
+          f"({stats['overturn_rate']:.1%})")
@@ -0,0 +1,200 @@
+"""
+SQLite cache of chain call results, shared by the sync, async and batch runners.
+
+Only deterministic calls (temperature 0) are cached by default. Calls sampled at
+temperature > 0, i.e. question generation, improvement and judging, go to the
+model on every run, so rerunning a tab that fell short of questions draws new
+samples instead of replaying the same ones. LLM_CACHE_BYPASS_STOCHASTIC=0 caches
+them too, e.g. to replay a run while debugging.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import defaultdict
+from langchain_core.runnables import RunnableBinding
+
+DEFAULT_CACHE_PATH = "llm_cache.sqlite"
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def prompt_template_text(prompt):
+    """Raw template text of a ChatPromptTemplate (or any prompt), before rendering."""
+    messages = getattr(prompt, "messages", None)
+    if messages is None:
+        return str(getattr(prompt, "template", prompt))
+    parts = []
+    for message in messages:
+        inner = getattr(message, "prompt", None)
+        template = getattr(inner, "template", None)
+        parts.append(f"{type(message).__name__}:{template if template is not None else message}")
+    return "\n".join(parts)
+
+
+def llm_fingerprint(llm):
+    """Model name and sampling parameters of a chat model, also through .bind() wrappers."""
+    kwargs = {}
+    while isinstance(llm, RunnableBinding):
+        kwargs.update(llm.kwargs)
+        llm = llm.bound
+    params = dict(getattr(llm, "_identifying_params", {}) or {})
+    params["_type"] = type(llm).__name__
+    params.update(kwargs)
+    return params
+
+
+def llm_temperature(llm):
+    while isinstance(llm, RunnableBinding):
+        llm = llm.bound
+    return getattr(llm, "temperature", None)
+
+
+class ChainCache:
+    """
+    On-disk, content-addressed cache of parsed chain results.
+
+    The key is a SHA-256 of the template text, the rendered variables, the model
+    and its sampling parameters. Identical requests made several times in one
+    process (e.g. the challenging initial prompt in every builder round) get an
+    occurrence number in their key, so a rerun replays the 1st, 2nd, ... sample
+    instead of collapsing all rounds onto one answer.
+
+    Args:
+        path (str): SQLite file
+        ttl_seconds (float): Entries older than this are treated as missing
+        max_entries (int): Least recently used entries are evicted above this size
+        bypass_stochastic (bool): Skip the cache for calls with temperature > 0 (the default)
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, bypass_stochastic=True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bypass_stochastic = bypass_stochastic
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self._occurrences = defaultdict(int)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chain_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chain_cache_last_access ON chain_cache(last_access)")
+        self._conn.commit()
+        self.purge_expired()
+
+    def key_for(self, prompt, llm, params):
+        """Return the cache key for a call, or None when the call must not be cached."""
+        if self.bypass_stochastic and (llm_temperature(llm) or 0) > 0:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        base = json.dumps({
+            "template": prompt_template_text(prompt),
+            "params": params,
+            "llm": llm_fingerprint(llm),
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        base_hash = hashlib.sha256(base.encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences[base_hash]
+            self._occurrences[base_hash] += 1
+        return f"{base_hash}:{occurrence}"
+
+    def get(self, key):
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM chain_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM chain_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE chain_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        if key is None or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chain_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM chain_cache").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM chain_cache WHERE key IN "
+                    "(SELECT key FROM chain_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM chain_cache WHERE created_at < ?",
+                                        (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM chain_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "entries": size,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_chain_cache():
+    """
+    Process-wide cache configured from the environment, or None when disabled.
+
+    LLM_CACHE=off disables it, LLM_CACHE_PATH, LLM_CACHE_TTL (seconds),
+    LLM_CACHE_MAX_ENTRIES and LLM_CACHE_BYPASS_STOCHASTIC=0 (also cache
+    calls with temperature > 0) tune it.
+    """
+    global _default_cache
+    if os.getenv("LLM_CACHE", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is False:
+            return None
+        if _default_cache is None:
+            _default_cache = ChainCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                bypass_stochastic=os.getenv("LLM_CACHE_BYPASS_STOCHASTIC", "on").lower() not in ("off", "0", "false", "no"),
+            )
+        return _default_cache
+
+
+def set_chain_cache(cache):
+    """Replace the process-wide cache (None disables caching)."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache if cache is not None else False
@@ -0,0 +1,100 @@
+import os
+import threading
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableBinding
+from cassette import replaying
+
+# provider -> (chat model class, environment variable holding the API key)
+PROVIDERS = {
+    "gemini": (ChatGoogleGenerativeAI, "GOOGLE_API_KEY"),
+    "openai": (ChatOpenAI, "OPENAI_API_KEY"),
+}
+
+_lock = threading.Lock()
+_clients = {}
+_reuse_counts = {}
+
+
+def _mask_api_key(api_key):
+    if not api_key:
+        return None
+    return f"...{api_key[-4:]}"
+
+
+def get_llm(model="gemini-2.5-pro", provider="gemini", temperature=0.7, api_key=None, **kwargs):
+    """
+    Return the process-wide chat client for (provider, model, temperature, api key).
+
+    The first call for a key builds the client, later calls hand out the same
+    instance so that its HTTP/gRPC connection pool is shared by every
+    QuestionBuilder, LLMAsAJudge and script in the process. LangChain chat
+    models are safe to call from several threads at once.
+
+    Args:
+        model (str): Model name, e.g. "gemini-2.5-pro" or "gpt-4"
+        provider (str): One of PROVIDERS ("gemini" or "openai")
+        temperature (float): Sampling temperature
+        api_key (str): API key, read from the provider's environment variable when None
+        **kwargs: Extra constructor arguments; they are part of the registry key
+
+    Returns:
+        The shared chat model instance
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+    llm_class, api_key_env = PROVIDERS[provider]
+    if api_key is None:
+        api_key = os.getenv(api_key_env)
+    if api_key is None and replaying():
+        # Clients are built but never called when a cassette is replayed
+        api_key = "replay"
+
+    key = (provider, model, temperature, api_key, tuple(sorted(kwargs.items())))
+
+    with _lock:
+        llm = _clients.get(key)
+        if llm is not None:
+            _reuse_counts[key] += 1
+            return llm
+
+        # Retries are done by retry_policy, per error class and behind a circuit breaker
+        params = {"max_tokens": None, "timeout": None, "max_retries": 0}
+        params.update(kwargs)
+        llm = llm_class(model=model, temperature=temperature, api_key=api_key, **params)
+        _clients[key] = llm
+        _reuse_counts[key] = 0
+        return llm
+
+
+def registry_stats():
+    """Number of live clients and how many times each one was handed out again."""
+    with _lock:
+        entries = []
+        for key, reuses in _reuse_counts.items():
+            provider, model, temperature, api_key, extra = key
+            entries.append({
+                "provider": provider,
+                "model": model,
+                "temperature": temperature,
+                "api_key": _mask_api_key(api_key),
+                "params": dict(extra),
+                "reuses": reuses,
+            })
+        return {"clients": len(_clients), "entries": entries}
+
+
+def clear_registry():
+    with _lock:
+        _clients.clear()
+        _reuse_counts.clear()
+
+
+def llm_provider(llm):
+    """Provider name ("gemini", "openai") of a chat model, also through .bind() wrappers."""
+    while isinstance(llm, RunnableBinding):
+        llm = llm.bound
+    for provider, (llm_class, _) in PROVIDERS.items():
+        if isinstance(llm, llm_class):
+            return provider
+    return getattr(llm, "provider", "gemini")
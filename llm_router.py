@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.runnables import Runnable
+from llm_registry import get_llm, llm_provider
+from llm_cache import llm_fingerprint
+from metering import model_name
+from output_repair import repair_json
+from streaming_json import message_text
+from rate_limiter import get_rate_limiter, estimate_tokens
+from retry_policy import get_circuit_breaker, classify_error
+
+
+def valid_json_message(message):
+    """Default validity check: the response contains (repairable) JSON."""
+    return repair_json(message_text(message)) is not None
+
+
+class HedgedRouter(Runnable):
+    """
+    Chat model stand-in that sends each request to `primary` and, if no valid
+    answer arrived by the deadline, a duplicate to `secondary`; the first valid
+    answer wins. The deadline is the p95 of recent primary latencies (times
+    `deadline_factor`), `initial_deadline` until `min_samples` latencies are known.
+    A primary error before the deadline hedges immediately.
+
+    Kwargs bound on the router (e.g. a Gemini response_schema) are only passed on to
+    models of the primary's provider; the other provider gets the plain prompt and
+    its output goes through the local JSON repair.
+
+    The caller's rate limiter and circuit breaker are those of the primary's
+    provider. Duplicates sent to a secondary of another provider take a slot of
+    that provider's limiter and report to its breaker instead.
+
+    Args:
+        primary: Chat model used first
+        secondary: Chat model for hedged duplicates
+        initial_deadline (float): Seconds before hedging while the p95 is unknown
+        min_deadline (float): Lower bound for the deadline
+        deadline_factor (float): Multiplier on the observed p95
+        window (int): Number of primary latencies kept for the p95
+        min_samples (int): Latencies needed before the p95 is used
+        is_valid (callable): message -> bool, valid_json_message by default
+        max_workers (int): Threads for sync requests. Each request in flight can use two
+            (primary and duplicate), so 2 * PASSAGE_WORKERS (default 4) when None
+    """
+
+    def __init__(self, primary, secondary, initial_deadline=60.0, min_deadline=5.0, deadline_factor=1.0,
+                 window=200, min_samples=20, is_valid=valid_json_message, max_workers=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.provider = llm_provider(primary)
+        self.secondary_provider = llm_provider(secondary)
+        self.model = f"{model_name(primary)}|{model_name(secondary)}"
+        self.initial_deadline = initial_deadline
+        self.min_deadline = min_deadline
+        self.deadline_factor = deadline_factor
+        self.min_samples = min_samples
+        self.is_valid = is_valid
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.failovers = 0
+        self.primary_wins = 0
+        self.secondary_wins = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self.max_workers = max_workers or 2 * int(os.getenv("PASSAGE_WORKERS", 4))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+
+    @property
+    def _identifying_params(self):
+        return {"primary": llm_fingerprint(self.primary), "secondary": llm_fingerprint(self.secondary)}
+
+    def deadline(self):
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return self.initial_deadline
+            ordered = sorted(self.latencies)
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return max(self.min_deadline, p95 * self.deadline_factor)
+
+    def _kwargs_for(self, llm, kwargs):
+        return kwargs if llm_provider(llm) == self.provider else {}
+
+    def _observe(self, started):
+        """Primary latency for the p95, also when the primary lost the race."""
+        with self._lock:
+            self.latencies.append(time.monotonic() - started)
+
+    def _submit(self, llm, input, config, kwargs):
+        return self._executor.submit(contextvars.copy_context().run, llm.invoke, input, config,
+                                     **self._kwargs_for(llm, kwargs))
+
+    def _invoke_secondary(self, input, config=None, **kwargs):
+        """The duplicate request, under the secondary provider's limiter and breaker."""
+        if self.secondary_provider == self.provider:
+            return self.secondary.invoke(input, config, **kwargs)
+        breaker = get_circuit_breaker(self.secondary_provider)
+        with breaker.guard():
+            try:
+                with get_rate_limiter(self.secondary_provider).limit(tokens=estimate_tokens(str(input))):
+                    message = self.secondary.invoke(input, config, **kwargs)
+            except Exception as e:
+                breaker.record(classify_error(e))
+                raise
+            breaker.record(None)
+        return message
+
+    async def _ainvoke_secondary(self, input, config=None, **kwargs):
+        if self.secondary_provider == self.provider:
+            return await self.secondary.ainvoke(input, config, **kwargs)
+        breaker = get_circuit_breaker(self.secondary_provider)
+        # A losing duplicate is cancelled: the guard frees a half-open trial and the
+        # limiter its slot, and neither counts the cancellation as an outcome
+        async with breaker.aguard():
+            try:
+                async with get_rate_limiter(self.secondary_provider).alimit(tokens=estimate_tokens(str(input))):
+                    message = await self.secondary.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                breaker.record(classify_error(e))
+                raise
+            breaker.record(None)
+        return message
+
+    def _record(self, winner, hedged=False, failover=False):
+        with self._lock:
+            self.requests += 1
+            if hedged:
+                self.hedged += 1
+            if failover:
+                self.failovers += 1
+            if winner == "primary":
+                self.primary_wins += 1
+            elif winner == "secondary":
+                self.secondary_wins += 1
+            else:
+                self.failures += 1
+
+    def _mark(self, message, winner):
+        message.response_metadata = {**(message.response_metadata or {}), "router_winner": winner}
+        return message
+
+    def invoke(self, input, config=None, **kwargs):
+        started = time.monotonic()
+        primary = self._submit(self.primary, input, config, kwargs)
+        primary.add_done_callback(lambda future: future.exception() is None and self._observe(started))
+        done, _ = wait([primary], timeout=self.deadline())
+        error = None
+        if done:
+            try:
+                message = primary.result()
+                if self.is_valid(message):
+                    self._record("primary")
+                    return self._mark(message, "primary")
+            except Exception as e:
+                error = e
+
+        secondary = self._executor.submit(contextvars.copy_context().run, self._invoke_secondary, input, config,
+                                          **self._kwargs_for(self.secondary, kwargs))
+        futures = {secondary: "secondary"} if done else {primary: "primary", secondary: "secondary"}
+        fallback = None
+        while futures:
+            finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in finished:
+                source = futures.pop(future)
+                try:
+                    message = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if self.is_valid(message):
+                    self._record(source, hedged=True, failover=done)
+                    return self._mark(message, source)
+                fallback = fallback or message
+        self._record(None, hedged=True, failover=done)
+        if fallback is not None:
+            return fallback
+        raise error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.primary.ainvoke(input, config, **self._kwargs_for(self.primary, kwargs)))
+        done, _ = await asyncio.wait([primary], timeout=self.deadline())
+        error = None
+        if done:
+            try:
+                message = primary.result()
+                self._observe(started)
+                if self.is_valid(message):
+                    self._record("primary")
+                    return self._mark(message, "primary")
+            except Exception as e:
+                error = e
+
+        secondary = asyncio.ensure_future(self._ainvoke_secondary(input, config, **self._kwargs_for(self.secondary, kwargs)))
+        tasks = {secondary: "secondary"} if done else {primary: "primary", secondary: "secondary"}
+        fallback = None
+        try:
+            while tasks:
+                finished, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    source = tasks.pop(task)
+                    try:
+                        message = task.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if source == "primary":
+                        self._observe(started)
+                    if self.is_valid(message):
+                        self._record(source, hedged=True, failover=done)
+                        return self._mark(message, source)
+                    fallback = fallback or message
+        finally:
+            # The losing request is no longer needed; a cancelled primary still
+            # counts with its elapsed time so the p95 does not drift down
+            for task, source in tasks.items():
+                task.cancel()
+                if source == "primary":
+                    self._observe(started)
+            # Let the cancelled requests release their limiter slot and breaker trial
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        self._record(None, hedged=True, failover=done)
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def stats(self):
+        with self._lock:
+            requests = self.requests
+            stats = {
+                "requests": requests,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / requests if requests else 0.0,
+                "failovers": self.failovers,
+                "primary_wins": self.primary_wins,
+                "secondary_wins": self.secondary_wins,
+                "failures": self.failures,
+            }
+        stats["deadline"] = round(self.deadline(), 3)
+        return stats
+
+    def close(self):
+        """Stop the router's threads once no more requests will be sent."""
+        self._executor.shutdown(wait=False)
+
+
+def get_hedged_router(primary_model="gemini-2.5-pro", secondary_model="gpt-4", primary_provider="gemini",
+                      secondary_provider="openai", temperature=0.7, **kwargs):
+    """HedgedRouter over two shared clients from the LLM registry."""
+    return HedgedRouter(get_llm(primary_model, provider=primary_provider, temperature=temperature),
+                        get_llm(secondary_model, provider=secondary_provider, temperature=temperature),
+                        **kwargs)
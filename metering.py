@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import logging
+import hashlib
+import argparse
+import threading
+import contextvars
+from collections import defaultdict
+from langchain_core.runnables import RunnableBinding
+
+DEFAULT_METER_PATH = "llm_metering.jsonl"
+
+# USD per 1M tokens: (input, cached input, output including thinking)
+PRICING = {
+    "gemini-2.5-pro": (1.25, 0.31, 10.0),
+    "gemini-2.5-flash": (0.30, 0.075, 2.50),
+    "gpt-4": (30.0, 30.0, 60.0),
+    "gpt-4o": (2.50, 1.25, 10.0),
+}
+
+# Batch jobs are billed at this fraction of the interactive price
+BATCH_DISCOUNT = 0.5
+
+# Loggers the provider clients write to before each internal retry
+RETRY_LOGGERS = {
+    "langchain_google_genai.chat_models": logging.WARNING,
+    "openai._base_client": logging.INFO,
+}
+
+_current_call = contextvars.ContextVar("metered_call", default=None)
+
+
+class _RetryCounter(logging.Handler):
+    """Attributes client-side retry log lines to the call running in the current context."""
+
+    def emit(self, record):
+        call = _current_call.get()
+        if call is not None and "retry" in record.getMessage().lower():
+            call.retries += 1
+
+
+_retry_counter_installed = False
+_retry_counter_lock = threading.Lock()
+
+
+def install_retry_counter():
+    global _retry_counter_installed
+    with _retry_counter_lock:
+        if _retry_counter_installed:
+            return
+        handler = _RetryCounter()
+        for name, level in RETRY_LOGGERS.items():
+            logger = logging.getLogger(name)
+            if logger.getEffectiveLevel() > level:
+                logger.setLevel(level)
+            logger.addHandler(handler)
+        _retry_counter_installed = True
+
+
+def model_name(llm):
+    while isinstance(llm, RunnableBinding):
+        llm = llm.bound
+    name = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+    return str(name).split("/")[-1]
+
+
+def call_dialect(params):
+    for key in ("passage_language", "dialect"):
+        if params.get(key):
+            return params[key]
+    return None
+
+
+def usage_from_message(message):
+    """(prompt, cached, output, thinking) token counts of an AIMessage, None when not reported."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    input_details = usage.get("input_token_details") or {}
+    output_details = usage.get("output_token_details") or {}
+    thinking = output_details.get("reasoning", 0) or 0
+    return (
+        usage.get("input_tokens", 0) or 0,
+        input_details.get("cache_read", 0) or 0,
+        (usage.get("output_tokens", 0) or 0) - thinking,
+        thinking,
+    )
+
+
+def call_cost(record, pricing=PRICING):
+    """USD cost of one call record, 0 for cache hits and unpriced models."""
+    if record.get("cache_hit"):
+        return 0.0
+    prices = pricing.get(record.get("model"))
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    cached = record.get("cached_tokens", 0)
+    uncached = max(0, record.get("prompt_tokens", 0) - cached)
+    output = record.get("output_tokens", 0) + record.get("thinking_tokens", 0)
+    cost = (uncached * input_price + cached * cached_price + output * output_price) / 1e6
+    return cost * BATCH_DISCOUNT if record.get("batch") else cost
+
+
+class MeteredCall:
+    """Measurement of one chain invocation, written to the meter by finish()."""
+
+    def __init__(self, meter, call, llm):
+        self.meter = meter
+        self.call = call
+        self.llm = llm
+        self.retries = 0
+        self.started = time.monotonic()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_call.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_call.reset(self._token)
+        return False
+
+    def finish(self, message=None, cache_hit=False, ok=True, aborted=False, batch=False):
+        usage = usage_from_message(message)
+        prompt_tokens, cached_tokens, output_tokens, thinking_tokens = usage or (0, 0, 0, 0)
+        passage = self.call.params.get("passage")
+        record = {
+            "event": "call",
+            "stage": self.call.stage,
+            "difficulty": self.call.difficulty,
+            "variant": self.call.variant,
+            "settings": self.call.settings.label if self.call.settings is not None else None,
+            "dialect": call_dialect(self.call.params),
+            "model": model_name(self.llm),
+            "passage": hashlib.sha256(passage.encode("utf-8")).hexdigest()[:12] if isinstance(passage, str) else None,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "thinking_tokens": thinking_tokens,
+            "usage_reported": usage is not None,
+            "wall_time": round(time.monotonic() - self.started, 3),
+            "retries": self.retries,
+            "cache_hit": cache_hit,
+            "aborted": aborted,
+            "batch": batch,
+            "ok": ok,
+        }
+        self.meter.record(record)
+        if self.call.budget is not None:
+            self.call.budget.charge(record)
+
+
+class Meter:
+    """
+    Appends one JSON line per chain invocation (and per batch of accepted
+    questions) to a JSONL file. Records carry the run id so several runs can
+    share one file.
+
+    Args:
+        path (str): JSONL file, None to keep records in memory only
+        run_id (str): Label of this run, defaults to start time and pid
+    """
+
+    def __init__(self, path=DEFAULT_METER_PATH, run_id=None):
+        self.path = path
+        self.run_id = run_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.records = []
+        self._lock = threading.Lock()
+        install_retry_counter()
+
+    def measure(self, call, llm=None):
+        return MeteredCall(self, call, llm if llm is not None else call.llm)
+
+    def record(self, record):
+        record = {"ts": time.time(), "run_id": self.run_id, **record}
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_accepted(self, dialect, count):
+        """Count questions that made it into the form, the denominator of the summary."""
+        self.record({"event": "accepted", "dialect": dialect, "count": count})
+
+    def summary(self, pricing=PRICING):
+        with self._lock:
+            records = list(self.records)
+        return summarize(records, pricing)
+
+
+def summarize(records, pricing=PRICING):
+    """
+    Calls, tokens, cost and latency per dialect, and the same divided by the
+    number of accepted questions of that dialect.
+
+    Args:
+        records (list): Records as written by Meter
+        pricing (dict): Model name -> (input, cached input, output) USD per 1M tokens
+
+    Returns:
+        dict: dialect -> totals and per accepted question figures
+    """
+    totals = defaultdict(lambda: defaultdict(int))
+    for record in records:
+        dialect = record.get("dialect") or "unknown"
+        total = totals[dialect]
+        if record.get("event") == "accepted":
+            total["accepted"] += record.get("count", 0)
+            continue
+        total["calls"] += 1
+        total["cache_hits"] += 1 if record.get("cache_hit") else 0
+        total["failed"] += 0 if record.get("ok", True) else 1
+        total["aborted"] += 1 if record.get("aborted") else 0
+        total["retries"] += record.get("retries", 0)
+        for field in ("prompt_tokens", "cached_tokens", "output_tokens", "thinking_tokens", "wall_time"):
+            total[field] += record.get(field, 0)
+        total["cost_usd"] += call_cost(record, pricing)
+
+    summary = {}
+    for dialect, total in totals.items():
+        total = dict(total)
+        accepted = int(total.get("accepted", 0))
+        total["accepted"] = accepted
+        if accepted:
+            total["cost_per_accepted_usd"] = total.get("cost_usd", 0.0) / accepted
+            total["seconds_per_accepted"] = total.get("wall_time", 0.0) / accepted
+            total["calls_per_accepted"] = total.get("calls", 0) / accepted
+        summary[dialect] = total
+    return summary
+
+
+def variant_summary(records, pricing=PRICING, field="variant"):
+    """
+    Mean output tokens, thinking tokens, latency and cost per call of each prompt
+    variant (or, with field="settings", each stage setting), grouped by stage,
+    model and difficulty so variants are compared on the same calls. Cache hits,
+    aborted calls and calls without usage are left out of the means since their
+    token counts are not a full response; failed calls (e.g. timeouts) are counted.
+
+    Returns:
+        dict: (stage, model, difficulty) -> variant -> means and call counts
+    """
+    totals = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+    for record in records:
+        if record.get("event") != "call" or record.get(field) is None or record.get("cache_hit"):
+            continue
+        total = totals[(record.get("stage"), record.get("model"), record.get("difficulty"))][record[field]]
+        if not record.get("ok", True):
+            total["failed"] += 1
+        if record.get("aborted") or not record.get("usage_reported", True):
+            continue
+        total["calls"] += 1
+        for name in ("output_tokens", "thinking_tokens", "wall_time"):
+            total[name] += record.get(name, 0)
+        total["cost_usd"] += call_cost(record, pricing)
+
+    summary = {}
+    for group, variants in totals.items():
+        summary[group] = {}
+        for variant, total in variants.items():
+            calls = int(total["calls"])
+            means = {name: total[name] / calls if calls else 0.0
+                     for name in ("output_tokens", "thinking_tokens", "wall_time", "cost_usd")}
+            summary[group][variant] = {"calls": calls, "failed": int(total["failed"]), **means}
+    return summary
+
+
+def print_variant_summary(summary, baseline=None):
+    """Per call means of each variant, and their change against the baseline variant of the same group."""
+    for (stage, model, difficulty), variants in sorted(summary.items(), key=lambda item: [str(part) for part in item[0]]):
+        print(f"{stage} / {model} / {difficulty}:")
+        base = variants.get(baseline)
+        for variant, means in sorted(variants.items()):
+            line = (f"  {variant}: {means['calls']} calls, {means['failed']} failed, {means['output_tokens']:.0f} output tokens, "
+                    f"{means['thinking_tokens']:.0f} thinking tokens, {means['wall_time']:.2f}s, ${means['cost_usd']:.5f} per call")
+            if base is not None and variant != baseline and base["output_tokens"]:
+                saved = 1 - means["output_tokens"] / base["output_tokens"]
+                line += f" ({saved:.0%} fewer output tokens than {baseline})"
+            print(line)
+
+
+def load_records(path, run_id=None):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if run_id is None or record.get("run_id") == run_id:
+                records.append(record)
+    return records
+
+
+_default_meter = None
+_default_meter_lock = threading.Lock()
+
+
+def get_meter():
+    """
+    Process-wide meter. LLM_METER=off keeps records in memory only,
+    LLM_METER_PATH sets the JSONL file.
+    """
+    global _default_meter
+    with _default_meter_lock:
+        if _default_meter is None:
+            path = os.getenv("LLM_METER_PATH", DEFAULT_METER_PATH)
+            if os.getenv("LLM_METER", "on").lower() in ("off", "0", "false", "no"):
+                path = None
+            _default_meter = Meter(path)
+        return _default_meter
+
+
+def print_summary(summary):
+    for dialect, total in sorted(summary.items()):
+        print(f"{dialect}:")
+        for field, value in total.items():
+            print(f"  {field}: {round(value, 4) if isinstance(value, float) else value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize LLM metering records per dialect")
+    parser.add_argument("path", nargs="?", default=DEFAULT_METER_PATH)
+    parser.add_argument("--run", default=None, help="Only records of this run id")
+    parser.add_argument("--variants", metavar="BASELINE", nargs="?", const="full", default=None,
+                        help="Compare prompt variants per call (e.g. judge verdict formats) against BASELINE")
+    parser.add_argument("--settings", action="store_true",
+                        help="Compare stage settings (thinking budget, output cap, timeout) per call")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"No metering file at {args.path}")
+    records = load_records(args.path, args.run)
+    if args.variants is not None:
+        print_variant_summary(variant_summary(records), args.variants)
+    elif args.settings:
+        print_variant_summary(variant_summary(records, field="settings"))
+    else:
+        print_summary(summarize(records))
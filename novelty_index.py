@@ -0,0 +1,213 @@
+import os
+import threading
+import numpy as np
+from arabic_text import normalize_arabic, tokenize
+from question_store import QuestionRecord
+
+DEFAULT_MODEL = "google/embeddinggemma-300m"
+DEFAULT_THRESHOLD = 0.85
+# Token overlap that counts as a near duplicate when no embedding model is available
+DEFAULT_LEXICAL_THRESHOLD = 0.7
+DEFAULT_SUMMARY_LIMIT = 10
+DEFAULT_SUMMARY_CHARS = 1500
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_embeddings_model(name):
+    """
+    SentenceTransformer loaded once per process, or None when the name is
+    "lexical", sentence-transformers is not installed or the model fails to load
+    (gated model, no network, unsupported by the installed transformers).
+    """
+    if name == "lexical":
+        return None
+    with _models_lock:
+        if name not in _models:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                print("sentence-transformers not installed, novelty index falls back to token overlap")
+                _models[name] = None
+            else:
+                try:
+                    _models[name] = SentenceTransformer(name)
+                except Exception as e:
+                    # Remembered as None, so the failure is reported once and not retried every round
+                    print(f"Failed to load embeddings model {name}, novelty index falls back to token overlap: {e}")
+                    _models[name] = None
+        return _models[name]
+
+
+def token_overlap(a, b):
+    a = set(tokenize(a))
+    b = set(tokenize(b))
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def result_question(result):
+    if isinstance(result, (dict, QuestionRecord)):
+        return result.get("Question"), result.get("Answer")
+    return result, None
+
+
+class NoveltyIndex:
+    """
+    Accepted questions and answers of one passage, used to reject near-duplicate
+    candidates after generation instead of pasting every earlier result into the
+    prompts.
+
+    A candidate is a near duplicate when its question embedding is at least
+    threshold cosine-similar to an indexed question, or when its answer is the
+    same as an indexed answer after Arabic normalization. Without an embedding
+    model the question similarity is the token overlap of the normalized text.
+
+    Args:
+        threshold (float): Question similarity from which a candidate is rejected
+        model_name (str): SentenceTransformer model, "lexical" for token overlap only
+        summary_limit (int): Most recent questions listed by summary()
+        summary_chars (int): Length cap of summary()
+    """
+
+    def __init__(self, threshold=None, model_name=DEFAULT_MODEL, summary_limit=DEFAULT_SUMMARY_LIMIT,
+                 summary_chars=DEFAULT_SUMMARY_CHARS):
+        self.model_name = model_name
+        self.summary_limit = summary_limit
+        self.summary_chars = summary_chars
+        self.questions = []
+        self.answers = set()
+        self.embeddings = []
+        self.rejected = 0
+        self._model = None
+        self._model_loaded = False
+        self._threshold = threshold
+        self._lock = threading.Lock()
+
+    def model(self):
+        # Loaded on first use, so runs that never filter do not pay for the model
+        if not self._model_loaded:
+            self._model = load_embeddings_model(self.model_name)
+            self._model_loaded = True
+        return self._model
+
+    @property
+    def threshold(self):
+        if self._threshold is not None:
+            return self._threshold
+        return DEFAULT_THRESHOLD if self.model() is not None else DEFAULT_LEXICAL_THRESHOLD
+
+    def embed(self, texts):
+        model = self.model()
+        if model is None:
+            return [None] * len(texts)
+        return list(model.encode([normalize_arabic(text) for text in texts], normalize_embeddings=True))
+
+    def similarity(self, question, embedding, other, other_embedding):
+        if embedding is not None and other_embedding is not None:
+            return float(np.dot(embedding, other_embedding))
+        return token_overlap(question, other)
+
+    def nearest(self, question, embedding=None, extra=()):
+        """Most similar indexed (or extra) question and its similarity, (None, 0.0) when empty."""
+        best, best_score = None, 0.0
+        for other, other_embedding in list(zip(self.questions, self.embeddings)) + list(extra):
+            score = self.similarity(question, embedding, other, other_embedding)
+            if score > best_score:
+                best, best_score = other, score
+        return best, best_score
+
+    def add(self, question, answer=None):
+        if not question or question == "N/A":
+            return
+        embedding = self.embed([question])[0]
+        with self._lock:
+            self.questions.append(question)
+            self.embeddings.append(embedding)
+            if answer:
+                self.answers.add(normalize_arabic(answer))
+
+    def add_results(self, results):
+        for result in results:
+            question, answer = result_question(result)
+            self.add(question, answer)
+
+    def filter(self, results, pending=()):
+        """
+        Blank out results that nearly repeat an indexed question, a pending one
+        (e.g. earlier in the same builder round) or an earlier result of this list.
+        Results are not added to the index; add_results does that once they are accepted.
+
+        Args:
+            results (list): Result dicts with Question, Answer and Quotes
+            pending (list): Result dicts or question strings not yet in the index
+
+        Returns:
+            List of results in the same order, duplicates with Question, Answer and Quotes set to None
+        """
+        pending = [result_question(result) for result in pending]
+        pending = [(question, answer) for question, answer in pending if question and question != "N/A"]
+        seen = list(zip([question for question, _ in pending], self.embed([question for question, _ in pending])))
+        answers = set(self.answers) | {normalize_arabic(answer) for _, answer in pending if answer}
+
+        filtered = []
+        for result in results:
+            question = result.get("Question")
+            answer = result.get("Answer")
+            if question is None or question == "N/A":
+                filtered.append(result)
+                continue
+            embedding = self.embed([question])[0]
+            nearest, score = self.nearest(question, embedding, seen)
+            if score >= self.threshold or (answer and normalize_arabic(answer) in answers):
+                reason = f"{score:.2f} to {nearest!r}" if score >= self.threshold else f"answer {answer!r} already used"
+                print(f"Dropping near-duplicate question ({reason}): {question}")
+                with self._lock:
+                    self.rejected += 1
+                filtered.append({**result, "Question": None, "Answer": None, "Quotes": None})
+                continue
+            seen.append((question, embedding))
+            if answer:
+                answers.add(normalize_arabic(answer))
+            filtered.append(result)
+        return filtered
+
+    def summary(self, extra=()):
+        """
+        Short list of the most recent questions (plus extra ones) for the prompts.
+        Capped in count and length, so it does not grow with the number of rounds.
+        """
+        questions = self.questions + [question for question in extra if question and question != "N/A"]
+        lines = []
+        length = 0
+        for question in reversed(questions[-self.summary_limit:]):
+            line = f"- {question}"
+            if length + len(line) > self.summary_chars:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return "\n".join(reversed(lines)) if lines else "None"
+
+    def stats(self):
+        with self._lock:
+            return {"indexed": len(self.questions), "rejected": self.rejected,
+                    "model": "lexical" if self._model_loaded and self._model is None else self.model_name}
+
+
+def novelty_index_from_env():
+    """
+    New NoveltyIndex for one passage, or None when NOVELTY_INDEX=off (the
+    prompts then get the full previous_questions list as before).
+
+    NOVELTY_MODEL, NOVELTY_THRESHOLD, NOVELTY_SUMMARY_LIMIT and
+    NOVELTY_SUMMARY_CHARS tune it.
+    """
+    if os.getenv("NOVELTY_INDEX", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    threshold = os.getenv("NOVELTY_THRESHOLD")
+    return NoveltyIndex(threshold=float(threshold) if threshold else None,
+                        model_name=os.getenv("NOVELTY_MODEL", DEFAULT_MODEL),
+                        summary_limit=int(os.getenv("NOVELTY_SUMMARY_LIMIT", DEFAULT_SUMMARY_LIMIT)),
+                        summary_chars=int(os.getenv("NOVELTY_SUMMARY_CHARS", DEFAULT_SUMMARY_CHARS)))
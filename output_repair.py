@@ -0,0 +1,101 @@
+import re
+import ast
+import json
+from langchain_core.utils.json import parse_partial_json
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_JSON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PYTHON_LITERALS = {"true": "True", "false": "False", "null": "None"}
+
+
+def _strip_outside_strings(text, literals=_JSON_LITERALS):
+    """Drop // and /* */ comments and trailing commas, and map literals, outside of strings."""
+    out = []
+    i = 0
+    in_string = False
+    quote = None
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if char == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 2
+                continue
+            if char == quote:
+                in_string = False
+            i += 1
+            continue
+        if char in "\"'":
+            in_string = True
+            quote = char
+            out.append(char)
+            i += 1
+            continue
+        if text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end == -1 else end
+            continue
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        if char == ",":
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                i += 1
+                continue
+        word = re.match(r"[A-Za-z_]+", text[i:])
+        if word:
+            token = word.group(0)
+            out.append(literals.get(token, token))
+            i += len(token)
+            continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _extract_object(text):
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start == -1:
+        return text.strip()
+    end = text.rfind("}")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def repair_json(text):
+    """
+    Parse near-valid JSON as returned by the models: markdown fences or prose
+    around the object, // comments copied from the prompt template, trailing
+    commas, Python True/False/None, single quotes, raw newlines in strings and
+    output truncated before the closing braces.
+
+    Returns:
+        The parsed value, or None if nothing could be recovered
+    """
+    if text is None:
+        return None
+    candidate = _extract_object(text)
+    try:
+        return json.loads(candidate, strict=False)
+    except ValueError:
+        pass
+    cleaned = _strip_outside_strings(candidate)
+    try:
+        return json.loads(cleaned, strict=False)
+    except ValueError:
+        pass
+    try:
+        partial = parse_partial_json(cleaned, strict=False)
+    except ValueError:
+        partial = None
+    if partial is not None:
+        return partial
+    try:
+        return ast.literal_eval(_strip_outside_strings(candidate, _PYTHON_LITERALS))
+    except (ValueError, SyntaxError):
+        return None
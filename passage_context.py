@@ -0,0 +1,191 @@
+import os
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableBinding
+import google.ai.generativelanguage_v1beta as genai_v1beta
+from rate_limiter import estimate_tokens, estimate_prompt_tokens
+from cassette import replaying
+
+PASSAGE_CONTEXT_TEMPLATE = """The following passage is referred to by all later requests.
+
+Passage:
+--------------------------------
+{passage}
+--------------------------------
+"""
+
+# Sent in place of the passage text once the passage lives in a cached context
+PASSAGE_REFERENCE = "(The passage is provided in the cached context above.)"
+
+
+def passage_hash(passage):
+    return hashlib.sha256(passage.encode("utf-8")).hexdigest()
+
+
+def base_model_name(llm):
+    while isinstance(llm, RunnableBinding):
+        llm = llm.bound
+    return str(getattr(llm, "model", "")).split("/")[-1]
+
+
+class PassageContext:
+    """
+    A passage registered once with a context cache. ChainCalls that carry it send
+    PASSAGE_REFERENCE instead of the passage, and the model reads the passage
+    from the cache.
+    """
+
+    def __init__(self, backend, passage, model, cache_name, passage_tokens):
+        self.backend = backend
+        self.passage = passage
+        self.model = model
+        self.cache_name = cache_name
+        self.passage_tokens = passage_tokens
+        self.calls = 0
+        self.cached_calls = 0
+        self.cached_input_tokens = 0
+        self.uncached_input_tokens = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, prompt, llm, params):
+        """Return the (prompt, llm, params) to actually send for a call on this passage."""
+        cached = (self.cache_name is not None
+                  and params.get("passage") == self.passage
+                  and (self.model is None or base_model_name(llm) == self.model))
+        if cached:
+            params = {**params, "passage": PASSAGE_REFERENCE}
+        prompt_tokens = estimate_prompt_tokens(prompt, params)
+        if cached:
+            prompt, llm = self.backend.attach(self, prompt, llm)
+        with self._lock:
+            self.calls += 1
+            if cached:
+                self.cached_calls += 1
+                self.cached_input_tokens += self.passage_tokens
+            self.uncached_input_tokens += prompt_tokens
+        return prompt, llm, params
+
+    def stats(self):
+        with self._lock:
+            return {
+                "passage": passage_hash(self.passage)[:12],
+                "cache_name": self.cache_name,
+                "calls": self.calls,
+                "cached_calls": self.cached_calls,
+                "cached_input_tokens": self.cached_input_tokens,
+                "uncached_input_tokens": self.uncached_input_tokens,
+            }
+
+
+class PassageContextCache(ABC):
+    """
+    Registers each passage once per model and hands out PassageContext handles.
+    Subclasses decide where the passage is stored (create_cache) and how a call
+    is pointed at it (attach).
+    """
+
+    def __init__(self, model="gemini-2.5-pro", min_tokens=0):
+        self.model = model
+        self.min_tokens = min_tokens
+        self.contexts = {}
+        self._lock = threading.Lock()
+
+    def register(self, passage):
+        key = passage_hash(passage)
+        with self._lock:
+            context = self.contexts.get(key)
+            if context is not None:
+                return context
+            passage_tokens = estimate_tokens(PASSAGE_CONTEXT_TEMPLATE.format(passage=passage))
+            cache_name = None
+            if passage_tokens >= self.min_tokens:
+                try:
+                    cache_name, passage_tokens = self.create_cache(passage, passage_tokens)
+                except Exception as e:
+                    print(f"Warning: Failed to create passage context cache: {e}")
+            context = PassageContext(self, passage, self.model, cache_name, passage_tokens)
+            self.contexts[key] = context
+            return context
+
+    @abstractmethod
+    def create_cache(self, passage, passage_tokens):
+        """Store the passage and return (cache name, its token count)."""
+
+    @abstractmethod
+    def attach(self, context, prompt, llm):
+        """Return the (prompt, llm) of a call pointed at the cached passage."""
+
+    def close(self):
+        pass
+
+    def report(self):
+        """Cached versus uncached input tokens per registered passage."""
+        with self._lock:
+            contexts = list(self.contexts.values())
+        return [context.stats() for context in contexts]
+
+
+class GeminiPassageContextCache(PassageContextCache):
+    """
+    Stores passages as Gemini cached content and binds calls to it through
+    ChatGoogleGenerativeAI's cached_content argument. Passages below the model's
+    caching minimum (4096 tokens for 2.5 Pro) are sent inline as before.
+    """
+
+    def __init__(self, model="gemini-2.5-pro", ttl_seconds=3600, min_tokens=4096, api_key=None):
+        super().__init__(model=model, min_tokens=min_tokens)
+        self.ttl_seconds = ttl_seconds
+        self.client = genai_v1beta.CacheServiceClient(
+            client_options={"api_key": api_key or os.getenv("GOOGLE_API_KEY")})
+
+    def create_cache(self, passage, passage_tokens):
+        if replaying():
+            # Replayed responses do not depend on the cache name, only on the call
+            return f"replay/{passage_hash(passage)[:12]}", passage_tokens
+        cached_content = self.client.create_cached_content(cached_content=genai_v1beta.CachedContent(
+            model=f"models/{self.model}",
+            display_name=f"passage-{passage_hash(passage)[:12]}",
+            contents=[genai_v1beta.Content(
+                role="user",
+                parts=[genai_v1beta.Part(text=PASSAGE_CONTEXT_TEMPLATE.format(passage=passage))],
+            )],
+            ttl={"seconds": self.ttl_seconds},
+        ))
+        return cached_content.name, cached_content.usage_metadata.total_token_count or passage_tokens
+
+    def attach(self, context, prompt, llm):
+        return prompt, llm.bind(cached_content=context.cache_name)
+
+    def close(self):
+        """Delete the cached contents created by this instance."""
+        with self._lock:
+            contexts = list(self.contexts.values())
+        for context in contexts:
+            if context.cache_name is None or context.cache_name.startswith("replay/"):
+                continue
+            try:
+                self.client.delete_cached_content(name=context.cache_name)
+            except Exception as e:
+                print(f"Warning: Failed to delete cached content {context.cache_name}: {e}")
+
+
+class LocalPassageContextCache(PassageContextCache):
+    """
+    In-process stand-in for tests and offline runs. Calls take the same code path
+    as with the Gemini backend, but the passage is put back in front of the prompt
+    as a separate message, so any model still sees it. Token accounting reports
+    what the Gemini backend would have served from cache.
+    """
+
+    def __init__(self, model=None, min_tokens=0):
+        super().__init__(model=model, min_tokens=min_tokens)
+
+    def create_cache(self, passage, passage_tokens):
+        return f"local/{passage_hash(passage)[:12]}", passage_tokens
+
+    def attach(self, context, prompt, llm):
+        context_prompt = ChatPromptTemplate.from_messages(
+            [("human", PASSAGE_CONTEXT_TEMPLATE.replace("{passage}", "{cached_passage}"))])
+        return (context_prompt + prompt).partial(cached_passage=context.passage), llm
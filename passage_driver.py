@@ -0,0 +1,99 @@
+import os
+import time
+import contextvars
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+class PassageResult:
+    """Outcome of one passage: the value returned by the worker or the error it raised."""
+
+    def __init__(self, key, value=None, error=None, seconds=0.0):
+        self.key = key
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"PassageResult({self.key!r}, {status}, {self.seconds:.1f}s)"
+
+
+class PassageDriver:
+    """
+    Processes many passages (e.g. (document, tab) pairs) concurrently on a
+    bounded thread pool.
+
+    Passages spend nearly all their time waiting on Gemini and Sheets, so several
+    are kept in flight; the shared rate limiters and circuit breakers decide how
+    fast calls actually go out, so throughput follows the quota. A failing
+    passage is reported in its PassageResult and does not stop the others.
+
+    Args:
+        max_workers (int): Passages in flight, PASSAGE_WORKERS (default 4) when None
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or int(os.getenv("PASSAGE_WORKERS", 4))
+        self.wall_seconds = 0.0
+
+    def _run_one(self, process, key):
+        started = time.monotonic()
+        try:
+            value = process(key)
+        except Exception as e:
+            print(f"Passage {key} failed: {e}")
+            traceback.print_exc()
+            return PassageResult(key, error=e, seconds=time.monotonic() - started)
+        return PassageResult(key, value=value, seconds=time.monotonic() - started)
+
+    def run(self, keys, process):
+        """
+        Call process(key) for every key concurrently.
+
+        Args:
+            keys (iterable): One key per passage, passed to process
+            process (callable): Does all the work of one passage and returns its result
+
+        Returns:
+            List of PassageResult in the order of keys
+        """
+        keys = list(keys)
+        started = time.monotonic()
+        results = [None] * len(keys)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="passage") as executor:
+            futures = {executor.submit(contextvars.copy_context().run, self._run_one, process, key): i
+                       for i, key in enumerate(keys)}
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results[futures[future]] = result
+                print(f"Passage {result.key} {'done' if result.ok else 'failed'} in {result.seconds:.1f}s "
+                      f"({done}/{len(keys)})")
+        self.wall_seconds = time.monotonic() - started
+        return results
+
+
+def summarize_results(results, wall_seconds):
+    failed = [result for result in results if not result.ok]
+    busy = sum(result.seconds for result in results)
+    return {
+        "passages": len(results),
+        "failed": len(failed),
+        "wall_seconds": round(wall_seconds, 1),
+        "passages_per_hour": round(3600 * len(results) / wall_seconds, 1) if wall_seconds else 0.0,
+        # Sum of per-passage times over wall time: how many passages were effectively in flight
+        "concurrency": round(busy / wall_seconds, 2) if wall_seconds else 0.0,
+        "errors": {str(result.key): str(result.error) for result in failed},
+    }
+
+
+def print_passage_results(results, wall_seconds):
+    summary = summarize_results(results, wall_seconds)
+    print(f"Passages: {summary['passages']} ({summary['failed']} failed) in {summary['wall_seconds']}s, "
+          f"{summary['passages_per_hour']}/h, effective concurrency {summary['concurrency']}")
+    for key, error in summary["errors"].items():
+        print(f"  {key}: {error}")
@@ -0,0 +1,131 @@
+import os
+import threading
+from arabic_text import tokenize, contains_tokens
+from quote_aligner import align_result
+
+# Word limits stated in the judge prompts
+CHALLENGING_MAX_QUESTION_WORDS = 16
+CHALLENGING_MAX_ANSWER_WORDS = 5
+MODERATE_MAX_QUESTION_WORDS = 16
+MODERATE_MAX_ANSWER_WORDS = 3
+COMBINED_MAX_QUESTION_WORDS = 20
+# Shorter answers (a name, a number) can be inferred yet still occur in the passage
+MIN_VERBATIM_ANSWER_WORDS = 2
+
+# Easy questions have no judge and no improvement loop to send a failure to, so
+# their failed checks are reported but the question is kept
+REPORT_ONLY_KINDS = ("easy",)
+
+_lock = threading.Lock()
+_stats = {"candidates": 0, "rejected": 0, "flagged": 0}
+
+
+def _short(tokens, limit, subject):
+    if len(tokens) <= limit:
+        return None
+    return f"Shorten the {subject} to at most {limit} words (it has {len(tokens)})."
+
+
+def _not_verbatim(passage_tokens, answer_tokens):
+    if len(answer_tokens) >= MIN_VERBATIM_ANSWER_WORDS and contains_tokens(passage_tokens, answer_tokens):
+        return "The answer is copied from a single span of the passage; ask for something that must be inferred."
+    return None
+
+
+def _verbatim(passage_tokens, answer_tokens):
+    if contains_tokens(passage_tokens, answer_tokens):
+        return None
+    return "The answer must be copied verbatim from the passage."
+
+
+def _quotes_in_passage(passage_tokens, quotes):
+    if not quotes:
+        return "Provide the exact quotes from the passage that support the answer."
+    missing = []
+    for quote in quotes:
+        text = quote.get("text", "") if isinstance(quote, dict) else str(quote)
+        if not contains_tokens(passage_tokens, tokenize(text)):
+            missing.append(text)
+    if missing:
+        return f"These quotes are not in the passage, copy them exactly: {missing}"
+    return None
+
+
+def rules(kind, passage_tokens, question_tokens, answer_tokens, quotes):
+    """(check, failure message or None) of every mechanical check of the `kind` rubric."""
+    if kind == "challenging":
+        return [
+            ("IsShortQuestion", _short(question_tokens, CHALLENGING_MAX_QUESTION_WORDS, "question")),
+            ("IsShortAndPreciseAnswer", _short(answer_tokens, CHALLENGING_MAX_ANSWER_WORDS, "answer")),
+            ("AnswerNotInSpan", _not_verbatim(passage_tokens, answer_tokens)),
+            ("QuotesInPassage", _quotes_in_passage(passage_tokens, quotes)),
+        ]
+    if kind == "moderate":
+        return [
+            ("IsShortQuestion", _short(question_tokens, MODERATE_MAX_QUESTION_WORDS, "question")),
+            ("IsShortAnswer", _short(answer_tokens, MODERATE_MAX_ANSWER_WORDS, "answer")),
+            ("IsNotVerbatimAnswer", _not_verbatim(passage_tokens, answer_tokens)),
+            ("QuotesInPassage", _quotes_in_passage(passage_tokens, quotes)),
+        ]
+    if kind == "combined":
+        return [
+            ("IsShortQuestion", _short(question_tokens, COMBINED_MAX_QUESTION_WORDS, "question")),
+            ("QuotesInPassage", _quotes_in_passage(passage_tokens, quotes)),
+        ]
+    if kind == "easy":
+        return [
+            ("IsShortQuestion", _short(question_tokens, MODERATE_MAX_QUESTION_WORDS, "question")),
+            ("IsVerbatimAnswer", _verbatim(passage_tokens, answer_tokens)),
+            ("QuotesInPassage", _quotes_in_passage(passage_tokens, quotes)),
+        ]
+    raise ValueError(f"Unknown rubric: {kind}")
+
+
+def prejudge(kind, passage, question, answer, quotes):
+    """
+    Check the rubric dimensions that need no model: word limits, verbatim and
+    non-verbatim answers and quote existence, on Arabic-normalized tokens.
+    Quote dicts are first aligned to the passage in place, as filter_results
+    would, so a quote the aligner repairs does not fail QuotesInPassage.
+
+    Args:
+        kind (str): "challenging", "moderate", "combined" or "easy"
+        passage (str): The passage
+        question (str), answer (str), quotes (list): The candidate
+
+    Returns:
+        None if every check passes, else a verdict in the judge's format (failed
+        checks with reasons and a Critical recommendation) to improve against.
+        For REPORT_ONLY_KINDS the verdict is informational only
+    """
+    if quotes:
+        align_result({"Quotes": quotes}, passage)
+    failures = [(check, message)
+                for check, message in rules(kind, tokenize(passage), tokenize(question or ""), tokenize(answer or ""),
+                                            quotes or [])
+                if message is not None]
+    with _lock:
+        _stats["candidates"] += 1
+        if failures:
+            _stats["flagged" if kind in REPORT_ONLY_KINDS else "rejected"] += 1
+    if not failures:
+        return None
+    verdict = {}
+    for check, message in failures:
+        verdict[check] = False
+        verdict[f"{check}_reason"] = message
+    verdict["Recommendations"] = {
+        "Critical": " ".join(f"{check}: {message}" for check, message in failures),
+        "NiceToHave": "None",
+    }
+    return verdict
+
+
+def prejudge_enabled():
+    return os.getenv("PREJUDGE", "on").lower() not in ("off", "0", "false", "no")
+
+
+def prejudge_stats():
+    """Candidates checked, rejected locally (judge calls saved) and flagged without rejecting."""
+    with _lock:
+        return dict(_stats)
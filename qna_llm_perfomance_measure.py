@@ -1,5 +1,3 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
 from dotenv import load_dotenv
@@ -10,6 +8,12 @@ import json
 import pandas as pd
 from difflib import SequenceMatcher
 from langchain_core.output_parsers import JsonOutputParser
+from llm_registry import get_llm
+from chain_runner import ChainCall, invoke_chain
+from schemas import GeneratedAnswer
+from batch_prediction import single_call_steps
+from llm_cache import get_chain_cache
+from metering import get_meter, print_summary
 from camel_tools.utils.dediac import dediac_ar
 from camel_tools.morphology.database import MorphologyDB
 from camel_tools.morphology.analyzer import Analyzer
@@ -23,23 +27,9 @@ analyzer = Analyzer(db)
 
 load_dotenv()
 
-llm1 = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        temperature=0.7,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-        api_key=os.getenv("GOOGLE_API_KEY"),
-    )
+llm1 = get_llm("gemini-2.5-pro", temperature=0.7)
 
-llm2 = ChatOpenAI(
-    model="gpt-4",
-    temperature=0.7,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    api_key=os.getenv("OPENAI_API_KEY"),
-)
+llm2 = get_llm("gpt-4", provider="openai", temperature=0.7)
 
 
 reading_comprehension_easy_answer_prompt = ChatPromptTemplate.from_template("""
@@ -150,7 +140,7 @@ question_difficulty_to_prompt = {
 }
 
 class ReadingComprehensionAnswerGenerator:
-    def __init__(self, passage, passage_language, question_difficulty, country="any", llm_provider="gemini"):
+    def __init__(self, passage, passage_language, question_difficulty, country="any", llm_provider="gemini", context_cache=None, llm=None):
         """
         Initialize the reading comprehension answer generator.
         
@@ -160,17 +150,43 @@ class ReadingComprehensionAnswerGenerator:
             question_difficulty (str): The difficulty level ("Easy", "Moderate", "Challenging")
             country (str): The country context for external knowledge (default: "any")
             llm_provider (str): Either "gemini" or "chatgpt"
+            context_cache (PassageContextCache): Registers the passage once so it is not resent with every question
+            llm: Chat model or runnable (e.g. a HedgedRouter) overriding llm_provider
         """
         self.passage = passage
         self.passage_language = passage_language
         self.question_difficulty = question_difficulty
         self.country = country
         
-        if llm_provider.lower() == "chatgpt":
+        if llm is not None:
+            self.llm = llm
+        elif llm_provider.lower() == "chatgpt":
             self.llm = llm2  # ChatGPT
         else:
             self.llm = llm1  # Gemini (default)
+        
+        self.passage_context = context_cache.register(passage) if context_cache is not None else None
             
+    def answer_call(self, question):
+        """ChainCall that answers `question`, for generate_answer or a BatchRunner."""
+        # Select the appropriate prompt based on question difficulty
+        prompt = question_difficulty_to_prompt.get(self.question_difficulty)
+        
+        # Prepare the input parameters
+        input_params = {
+            "passage": self.passage,
+            "passage_language": self.passage_language,
+            "question": question
+        }
+        
+        # Add country parameter for challenging questions
+        if self.question_difficulty == "Challenging":
+            input_params["country"] = self.country
+        
+        return ChainCall(prompt, self.llm, input_params,
+                         stage="answer", difficulty=self.question_difficulty,
+                         context=self.passage_context, schema=GeneratedAnswer)
+    
     def generate_answer(self, question):
         """
         Generate an answer to a reading comprehension question.
@@ -181,32 +197,27 @@ class ReadingComprehensionAnswerGenerator:
         Returns:
             str: Generated answer based on the passage
         """
-        # Select the appropriate prompt based on question difficulty
-        prompt = question_difficulty_to_prompt.get(self.question_difficulty)
-        
-        chain = prompt | self.llm | JsonOutputParser()
-        
-        try:
-            # Prepare the input parameters
-            input_params = {
-                "passage": self.passage,
-                "passage_language": self.passage_language,
-                "question": question
-            }
-            
-            # Add country parameter for challenging questions
-            if self.question_difficulty == "Challenging":
-                input_params["country"] = self.country
-            
-            result = chain.invoke(input_params)
-            return result.get("answer", None)
-        except Exception as e:
-            print(f"Error generating answer: {e}")
-            return None
+        # Goes through the persistent chain cache, so reruns do not re-query the model
+        result = invoke_chain(self.answer_call(question))
+        return extract_answer(result, question)
+
+
+def extract_answer(result, question):
+    if result is None:
+        print(f"Error generating answer for: {question}")
+        return None
+    return result.get("answer", None)
+
     
-def generate_answers(df_qna_egyptian):
+def generate_answers(df_qna_egyptian, runner=None):
+  """
+  Generate an answer for every Easy/Moderate/Challenging row. With a
+  BatchRunner all answer requests are sent as one batch job instead of one
+  interactive call per row.
+  """
   
   generated_answers = []
+  batched = []
   
   for _, row in tqdm(df_qna_egyptian.iterrows(), total=len(df_qna_egyptian), desc="Generating answers"):
     
@@ -226,9 +237,19 @@ def generate_answers(df_qna_egyptian):
       llm_provider="gemini"
     )
     
+    if runner is not None:
+      batched.append((len(generated_answers), question, generator.answer_call(question)))
+      generated_answers.append(None)
+      continue
+    
     generated_answer = generator.generate_answer(question)
     
     generated_answers.append(generated_answer)
+  
+  if batched:
+    results = runner.run([single_call_steps(call) for _, _, call in batched])
+    for (position, question, _), result in zip(batched, results):
+      generated_answers[position] = extract_answer(result, question)
 
   return generated_answers
 
@@ -288,11 +309,16 @@ def evaluate_challenging_answer(passage, question, question_difficulty, answer,
   
   return similarities[0][0]
 
-def build_generated_answers_table():
+def build_generated_answers_table(runner=None):
 
   df_qna_egyptian = pd.read_csv("qna_dataset_table.csv")
-  df_qna_egyptian["GeneratedAnswer"] = generate_answers(df_qna_egyptian)
+  df_qna_egyptian["GeneratedAnswer"] = generate_answers(df_qna_egyptian, runner=runner)
   df_qna_egyptian.to_csv("qna_dataset_table_with_generated_answers.csv", index=False)
+  
+  cache = get_chain_cache()
+  if cache is not None:
+    print(f"LLM cache: {cache.stats()}")
+  print_summary(get_meter().summary())
 
 def build_evaluations_table():
   df_qna_egyptian = pd.read_csv("qna_dataset_table_with_generated_answers.csv")
@@ -0,0 +1,96 @@
+DEFAULT_WINDOW = 30
+
+FIELDS = {"Question": "question", "Answer": "answer", "Quotes": "quotes", "Difficulty": "difficulty"}
+
+
+class QuestionRecord:
+    """
+    Accepted question, answer and quotes. Immutable, so one record can be shared
+    by the store, the builders of later rounds and the final selection without
+    copying. Reads like the result dicts (record["Question"], record.get("Quotes")).
+    """
+
+    __slots__ = ("question", "answer", "quotes", "difficulty")
+
+    def __init__(self, question, answer, quotes, difficulty=None):
+        object.__setattr__(self, "question", question)
+        object.__setattr__(self, "answer", answer)
+        object.__setattr__(self, "quotes", tuple(quotes) if quotes is not None else None)
+        object.__setattr__(self, "difficulty", difficulty)
+
+    @classmethod
+    def from_result(cls, result):
+        if isinstance(result, QuestionRecord):
+            return result
+        return cls(result.get("Question"), result.get("Answer"), result.get("Quotes"), result.get("Difficulty"))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuestionRecord is immutable")
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, FIELDS[key])
+
+    def get(self, key, default=None):
+        value = getattr(self, FIELDS[key]) if key in FIELDS else None
+        return default if value is None else value
+
+    def as_dict(self):
+        result = {"Question": self.question, "Answer": self.answer,
+                  "Quotes": list(self.quotes) if self.quotes is not None else None}
+        if self.difficulty is not None:
+            result["Difficulty"] = self.difficulty
+        return result
+
+    def __repr__(self):
+        # The builders paste previous questions into prompts; keep the text of the result dicts
+        return repr(self.as_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, QuestionRecord):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __hash__(self):
+        return hash((self.question, self.answer))
+
+
+class QuestionStore:
+    """
+    Append-only store of the accepted questions of one passage.
+
+    Builders of later rounds get window(), the most recent records, instead of
+    a deep copy of every earlier result, so what they see (and paste into
+    prompts) stays bounded however many rounds run.
+
+    Args:
+        window (int): Records returned by window(), None for all
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window_size = window
+        self._records = []
+
+    def append(self, result):
+        record = QuestionRecord.from_result(result)
+        self._records.append(record)
+        return record
+
+    def extend(self, results):
+        return [self.append(result) for result in results]
+
+    @property
+    def records(self):
+        return tuple(self._records)
+
+    def window(self):
+        if self.window_size is None:
+            return tuple(self._records)
+        return tuple(self._records[-self.window_size:])
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(tuple(self._records))
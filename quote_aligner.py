@@ -0,0 +1,150 @@
+import threading
+from collections import defaultdict, Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+from arabic_text import token_spans, tokenize
+
+# Word-level similarity from which a quote that is not in the passage word for
+# word is still taken to mean the best matching passage span
+DEFAULT_MIN_RATIO = 0.8
+# Candidate window starts examined per quote in fuzzy matching
+FUZZY_CANDIDATES = 8
+
+_lock = threading.Lock()
+_stats = {"quotes": 0, "exact": 0, "offsets_repaired": 0, "text_repaired": 0, "failed": 0}
+
+
+class PassageIndex:
+    """
+    Normalized words of a passage with their character offsets and a word ->
+    positions index, so every word of a quote is looked up at once instead of
+    scanning the passage per quote.
+    """
+
+    def __init__(self, passage):
+        self.passage = passage
+        self.spans = token_spans(passage)
+        self.words = [word for word, _, _ in self.spans]
+        self.positions = defaultdict(list)
+        for i, word in enumerate(self.words):
+            self.positions[word].append(i)
+
+    def char_span(self, first, last):
+        """Character (start, end) in the passage of the words first..last-1."""
+        return self.spans[first][1], self.spans[last - 1][2]
+
+    def find_exact(self, needle):
+        """Word positions where needle occurs word for word."""
+        n = len(needle)
+        return [i for i in self.positions.get(needle[0], ())
+                if self.words[i:i + n] == needle]
+
+    def find_fuzzy(self, needle, min_ratio=DEFAULT_MIN_RATIO):
+        """
+        Best (first, last, ratio) word window for a quote the model misspelled or
+        shortened, or None. Every word of the needle that occurs in the passage
+        votes for the window start it implies; only the best voted starts are
+        compared word by word.
+        """
+        n = len(needle)
+        votes = Counter()
+        for k, word in enumerate(needle):
+            for i in self.positions.get(word, ()):
+                votes[max(0, i - k)] += 1
+        best = None
+        for start, _ in votes.most_common(FUZZY_CANDIDATES):
+            for length in range(max(1, n - 2), n + 3):
+                window = self.words[start:start + length]
+                if not window:
+                    continue
+                ratio = SequenceMatcher(None, needle, window, autojunk=False).ratio()
+                if best is None or ratio > best[2]:
+                    best = (start, start + len(window), ratio)
+        if best is None or best[2] < min_ratio:
+            return None
+        return best
+
+
+@lru_cache(maxsize=32)
+def passage_index(passage):
+    return PassageIndex(passage)
+
+
+def _offset(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def align_quote(quote, passage, min_ratio=DEFAULT_MIN_RATIO):
+    """
+    Point a quote dict at the passage span it means, rewriting text, start_char
+    and end_char in place. Diacritics, tatweel, alef/ya/ta marbuta variants,
+    whitespace and punctuation are ignored when matching; among several
+    occurrences the one closest to the model's start_char is taken.
+
+    Args:
+        quote (dict): Quote with text, start_char and end_char as returned by the model
+        passage (str): Passage the quote was taken from
+
+    Returns:
+        "exact" (already correct), "offsets_repaired", "text_repaired" or "failed"
+    """
+    text = quote.get("text")
+    if not isinstance(text, str) or text.strip() in ("", "N/A"):
+        return "failed"
+    start, end = _offset(quote.get("start_char")), _offset(quote.get("end_char"))
+    if start is not None and end is not None and 0 <= start < end <= len(passage) and passage[start:end] == text:
+        return "exact"
+
+    needle = tokenize(text)
+    if not needle:
+        return "failed"
+    index = passage_index(passage)
+    hint = start if start is not None and start >= 0 else 0
+    matches = index.find_exact(needle)
+    if matches:
+        first = min(matches, key=lambda i: abs(index.spans[i][1] - hint))
+        last = first + len(needle)
+    else:
+        fuzzy = index.find_fuzzy(needle, min_ratio)
+        if fuzzy is None:
+            return "failed"
+        first, last, _ = fuzzy
+    start, end = index.char_span(first, last)
+    status = "offsets_repaired" if passage[start:end] == text or text in passage else "text_repaired"
+    quote["text"] = passage[start:end]
+    quote["start_char"] = start
+    quote["end_char"] = end
+    return status
+
+
+def align_result(result, passage, min_ratio=DEFAULT_MIN_RATIO):
+    """
+    Align every quote of a result dict in place. Quotes that can not be found are
+    left as they are.
+
+    Returns:
+        List of align_quote statuses, one per quote
+    """
+    quotes = result.get("Quotes")
+    if not isinstance(quotes, list):
+        return []
+    statuses = [align_quote(quote, passage, min_ratio) if isinstance(quote, dict) else "failed"
+                for quote in quotes]
+    with _lock:
+        for status in statuses:
+            _stats["quotes"] += 1
+            _stats[status] += 1
+    return statuses
+
+
+def aligner_stats():
+    """Quotes seen, already exact, repaired locally (each one a candidate kept) and not found."""
+    with _lock:
+        stats = dict(_stats)
+    quotes = stats["quotes"]
+    stats["repair_rate"] = (stats["offsets_repaired"] + stats["text_repaired"]) / quotes if quotes else 0.0
+    stats["failure_rate"] = stats["failed"] / quotes if quotes else 0.0
+    return stats
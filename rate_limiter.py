@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+# name -> (requests per minute, tokens per minute or None, max concurrency)
+DEFAULT_LIMITS = {
+    "gemini": (150, 2000000, 16),
+    "openai": (500, 30000, 16),
+    "sheets": (60, None, 4),
+    "drive": (600, None, 4),
+}
+
+
+def estimate_tokens(text):
+    """Rough token count for quota accounting; Arabic averages about 3 characters per token."""
+    return len(text) // 3 + 1
+
+
+def estimate_prompt_tokens(prompt, params):
+    try:
+        return estimate_tokens(prompt.format(**params))
+    except Exception:
+        return estimate_tokens(str(params))
+
+
+def is_rate_limit_error(error):
+    status = getattr(getattr(error, "resp", None), "status", None) or getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "ResourceExhausted" in message or "rate limit" in message.lower()
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class AdaptiveRateLimiter:
+    """
+    Token-bucket limiter for requests and tokens per minute with an adaptive
+    concurrency window.
+
+    The window grows by one after a window's worth of calls finish without a 429
+    and at normal latency, halves on a 429 (which also pauses new calls for an
+    exponentially growing cooldown) and shrinks by one when a call takes more than
+    twice the running average latency.
+
+    Args:
+        name (str): Label used in stats
+        requests_per_minute (float): Request quota
+        tokens_per_minute (float): Token quota, None to ignore tokens
+        max_concurrency (int): Upper bound of the concurrency window
+        min_concurrency (int): Lower bound of the concurrency window
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None, max_concurrency=8, min_concurrency=1):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max(min_concurrency, min(max_concurrency, 2))
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_rate_limits = 0
+        self.successes_in_window = 0
+        self.avg_latency = None
+        self.calls = 0
+        self.rate_limited = 0
+        self.waited_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self, tokens):
+        """Take a slot if possible. Returns 0 on success, otherwise seconds to wait."""
+        now = time.monotonic()
+        if now < self.cooldown_until:
+            return self.cooldown_until - now
+        if self.in_flight >= self.concurrency:
+            return 0.05
+        self.request_bucket.refill(now)
+        wait = self.request_bucket.wait_time(1)
+        if self.token_bucket is not None and tokens:
+            self.token_bucket.refill(now)
+            wait = max(wait, self.token_bucket.wait_time(tokens))
+        if wait > 0:
+            return wait
+        self.request_bucket.level -= 1
+        if self.token_bucket is not None and tokens:
+            self.token_bucket.level -= min(tokens, self.token_bucket.capacity)
+        self.in_flight += 1
+        self.calls += 1
+        return 0.0
+
+    def acquire(self, tokens=0):
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    break
+                self._condition.wait(timeout=wait)
+            self.waited_seconds += time.monotonic() - started
+        return time.monotonic()
+
+    async def aacquire(self, tokens=0):
+        started = time.monotonic()
+        while True:
+            with self._condition:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    self.waited_seconds += time.monotonic() - started
+                    return time.monotonic()
+            await asyncio.sleep(wait)
+
+    def release(self, started, rate_limited=False):
+        latency = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.rate_limited += 1
+                self.consecutive_rate_limits += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self.successes_in_window = 0
+                cooldown = min(60.0, 2.0 ** self.consecutive_rate_limits)
+                self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+            else:
+                self.consecutive_rate_limits = 0
+                if self.avg_latency is not None and latency > 2 * self.avg_latency:
+                    self.concurrency = max(self.min_concurrency, self.concurrency - 1)
+                    self.successes_in_window = 0
+                else:
+                    self.successes_in_window += 1
+                    if self.successes_in_window >= self.concurrency:
+                        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                        self.successes_in_window = 0
+                if self.avg_latency is None:
+                    self.avg_latency = latency
+                else:
+                    self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+            self._condition.notify_all()
+
+    @contextmanager
+    def limit(self, tokens=0):
+        started = self.acquire(tokens)
+        rate_limited = False
+        try:
+            yield
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            # Also on cancellation, or the slot stays in flight for good
+            self.release(started, rate_limited=rate_limited)
+
+    @asynccontextmanager
+    async def alimit(self, tokens=0):
+        started = await self.aacquire(tokens)
+        rate_limited = False
+        try:
+            yield
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            # Also on cancellation, or the slot stays in flight for good
+            self.release(started, rate_limited=rate_limited)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "rate_limited": self.rate_limited,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "avg_latency": self.avg_latency,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """
+    Process-wide limiter for a provider ("gemini", "openai", "sheets", "drive").
+
+    Quotas default to DEFAULT_LIMITS and can be overridden with
+    RATE_LIMIT_<NAME>_RPM, RATE_LIMIT_<NAME>_TPM and RATE_LIMIT_<NAME>_CONCURRENCY.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rpm, tpm, concurrency = DEFAULT_LIMITS.get(name, (60, None, 4))
+            prefix = f"RATE_LIMIT_{name.upper()}"
+            rpm = float(os.getenv(f"{prefix}_RPM", rpm))
+            tpm = os.getenv(f"{prefix}_TPM", tpm)
+            tpm = float(tpm) if tpm else None
+            concurrency = int(os.getenv(f"{prefix}_CONCURRENCY", concurrency))
+            limiter = AdaptiveRateLimiter(name, rpm, tpm, max_concurrency=concurrency)
+            _limiters[name] = limiter
+        return limiter
+
+
+def rate_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import argparse
+from collections import defaultdict
+from dotenv import load_dotenv
+from agent_question_builder import QuestionBuilder, REFINEMENT_MODES, REFINED_DIFFICULTIES
+from agent_question_builder2 import QuestionBuilder as CombinedQuestionBuilder
+from chain_runner import run_steps
+from metering import get_meter, call_cost
+
+load_dotenv()
+
+# Difficulty -> builder class and the step generator of its refinement loop
+LOOPS = {
+    "challenging": (QuestionBuilder, "challenging_qna_steps"),
+    "moderate": (QuestionBuilder, "moderate_qna_steps"),
+    "combined": (CombinedQuestionBuilder, "combined_qna_steps"),
+}
+
+
+def run_loop(passage, passage_language, country, difficulty, mode):
+    """
+    One refinement loop of `difficulty` in `mode` on a passage.
+
+    Returns:
+        dict with the accepted question (None if none was), its complexity, the
+        loop's wall time and the meter records of its calls
+    """
+    builder_class, steps_name = LOOPS[difficulty]
+    meter = get_meter()
+    first = len(meter.records)
+    builder = builder_class(passage, passage_language, country, refinement={difficulty: mode})
+    started = time.monotonic()
+    question, _, _ = run_steps(getattr(builder, steps_name)())
+    seconds = time.monotonic() - started
+    complexity = None
+    for verdict in builder.verdicts:
+        if verdict["Question"] == question and "Complexity" in verdict["Verdict"]:
+            complexity = verdict["Verdict"]["Complexity"]
+    return {
+        "question": question,
+        "complexity": complexity,
+        "seconds": seconds,
+        "records": [record for record in meter.records[first:] if record.get("event") == "call"],
+    }
+
+
+def summarize_loops(loops):
+    """Calls, tokens, cost and time per loop and per accepted question of one difficulty and mode."""
+    total = defaultdict(float)
+    complexities = []
+    for loop in loops:
+        total["loops"] += 1
+        total["seconds"] += loop["seconds"]
+        if loop["question"] is not None:
+            total["accepted"] += 1
+            if loop["complexity"] is not None:
+                complexities.append(loop["complexity"])
+        for record in loop["records"]:
+            total["calls"] += 1
+            total["failed"] += 0 if record.get("ok", True) else 1
+            for field in ("prompt_tokens", "output_tokens", "thinking_tokens"):
+                total[field] += record.get(field, 0)
+            total["cost_usd"] += call_cost(record)
+    summary = {"loops": int(total["loops"]), "accepted": int(total["accepted"]), "failed_calls": int(total["failed"])}
+    for field in ("calls", "prompt_tokens", "output_tokens", "thinking_tokens", "cost_usd", "seconds"):
+        summary[f"{field}_per_loop"] = total[field] / total["loops"] if total["loops"] else 0.0
+        summary[f"{field}_per_accepted"] = total[field] / total["accepted"] if total["accepted"] else None
+    summary["acceptance_rate"] = total["accepted"] / total["loops"] if total["loops"] else 0.0
+    summary["mean_complexity"] = sum(complexities) / len(complexities) if complexities else None
+    return summary
+
+
+def print_comparison(summaries):
+    for difficulty, modes in summaries.items():
+        print(f"{difficulty}:")
+        for mode, summary in modes.items():
+            print(f"  {mode}:")
+            for field, value in summary.items():
+                print(f"    {field}: {round(value, 4) if isinstance(value, float) else value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the two-call and fused refinement loops on the same passages")
+    parser.add_argument("passages", nargs="+", help="Text files, one passage each")
+    parser.add_argument("--language", required=True, help="Passage language as used in the prompts")
+    parser.add_argument("--country", required=True)
+    parser.add_argument("--difficulties", nargs="+", choices=REFINED_DIFFICULTIES, default=["challenging", "moderate"])
+    parser.add_argument("--modes", nargs="+", choices=REFINEMENT_MODES, default=list(REFINEMENT_MODES))
+    parser.add_argument("--repeats", type=int, default=3, help="Loops per passage, difficulty and mode")
+    parser.add_argument("--output", default=None, help="Also write the summaries to this JSON file")
+    args = parser.parse_args()
+
+    # Cached verdicts and revisions would make both modes look free
+    os.environ.setdefault("LLM_CACHE", "off")
+
+    passages = []
+    for path in args.passages:
+        with open(path, encoding="utf-8") as f:
+            passages.append(f.read())
+
+    summaries = {}
+    for difficulty in args.difficulties:
+        summaries[difficulty] = {}
+        for mode in args.modes:
+            loops = [run_loop(passage, args.language, args.country, difficulty, mode)
+                     for passage in passages for _ in range(args.repeats)]
+            summaries[difficulty][mode] = summarize_loops(loops)
+
+    print_comparison(summaries)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
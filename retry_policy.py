@@ -0,0 +1,332 @@
+import os
+import time
+import random
+import socket
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from rate_limiter import is_rate_limit_error
+
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+SAFETY = "safety"
+PARSE = "parse"
+OTHER = "other"
+
+# Finish reasons that mean the provider withheld the answer
+SAFETY_FINISH_REASONS = ("SAFETY", "PROHIBITED_CONTENT", "BLOCKLIST", "SPII", "RECITATION", "content_filter")
+
+
+class SafetyBlockedError(Exception):
+    """The provider blocked the prompt or the response."""
+
+
+class OutputParseError(ValueError):
+    """The response could not be turned into the expected JSON."""
+
+
+def _status_code(error):
+    for status in (getattr(getattr(error, "resp", None), "status", None),
+                   getattr(error, "status_code", None),
+                   getattr(error, "code", None)):
+        try:
+            return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def classify_error(error):
+    """One of RATE_LIMIT, SERVER, TIMEOUT, SAFETY, PARSE or OTHER."""
+    if isinstance(error, SafetyBlockedError):
+        return SAFETY
+    if isinstance(error, OutputParseError):
+        return PARSE
+    if is_rate_limit_error(error):
+        return RATE_LIMIT
+    name = type(error).__name__
+    message = str(error)
+    if (isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError))
+            or "Timeout" in name or name == "DeadlineExceeded"
+            or "timed out" in message.lower() or "DEADLINE_EXCEEDED" in message):
+        return TIMEOUT
+    status = _status_code(error)
+    if (status is not None and 500 <= status < 600) or name in ("ServiceUnavailable", "InternalServerError", "BadGateway", "APIConnectionError", "ConnectionError") \
+            or "UNAVAILABLE" in message or "503" in message or "500 Internal" in message:
+        return SERVER
+    if "SAFETY" in message or "block_reason" in message or "content_filter" in message:
+        return SAFETY
+    return OTHER
+
+
+def check_safety(message):
+    """Raise SafetyBlockedError if a chat response was withheld by the provider."""
+    metadata = getattr(message, "response_metadata", None) or {}
+    finish_reason = str(metadata.get("finish_reason") or "")
+    block_reason = (metadata.get("prompt_feedback") or {}).get("block_reason")
+    if finish_reason in SAFETY_FINISH_REASONS or block_reason not in (None, 0, "BLOCK_REASON_UNSPECIFIED"):
+        raise SafetyBlockedError(f"Response blocked: finish_reason={finish_reason} block_reason={block_reason}")
+
+
+class RetryRule:
+    """
+    Args:
+        attempts (int): Total attempts for this error class (1 = no retry)
+        base_delay (float): Backoff base in seconds, doubled per attempt
+        max_delay (float): Backoff cap in seconds
+    """
+
+    def __init__(self, attempts, base_delay=1.0, max_delay=60.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+DEFAULT_RULES = {
+    RATE_LIMIT: RetryRule(6, 2.0, 60.0),
+    SERVER: RetryRule(5, 1.0, 30.0),
+    TIMEOUT: RetryRule(3, 1.0, 10.0),
+    # A sampled response can pass on a second try; the prompt itself rarely changes outcome
+    SAFETY: RetryRule(2, 0.5, 1.0),
+    PARSE: RetryRule(2, 0.5, 1.0),
+    OTHER: RetryRule(1),
+}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive server or timeout errors of one
+    provider. While open every caller waits (the pipeline pauses) instead of
+    spending the remaining passages on a dead provider; after the pause one
+    trial call goes through, success closes the breaker and failure reopens it
+    with a doubled pause, up to `max_pause_seconds`.
+
+    Callers go through guard()/aguard() and report the outcome with record(). A
+    trial call that leaves without a record (cancelled, interrupted) frees the
+    trial without counting as a success or a failure.
+    """
+
+    def __init__(self, name, failure_threshold=5, pause_seconds=30.0, max_pause_seconds=600.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.pause_seconds = pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.current_pause = pause_seconds
+        self.trial_in_flight = False
+        # Number of the latest trial, so a late release can not free a newer one
+        self.trials = 0
+        self.openings = 0
+        self.paused_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        """(seconds to wait before calling, 0 when the call may go ahead; trial number or None)."""
+        with self._lock:
+            if self.open_until == 0.0:
+                return 0.0, None
+            now = time.monotonic()
+            if now < self.open_until:
+                return self.open_until - now, None
+            if self.trial_in_flight:
+                return 1.0, None
+            self.trial_in_flight = True
+            self.trials += 1
+            return 0.0, self.trials
+
+    def before_call(self):
+        """Wait while the breaker is open. Returns the trial number if this call is the trial, else None."""
+        wait, trial = self._wait_time()
+        while wait > 0:
+            self.paused_seconds += wait
+            time.sleep(wait)
+            wait, trial = self._wait_time()
+        return trial
+
+    async def abefore_call(self):
+        wait, trial = self._wait_time()
+        while wait > 0:
+            self.paused_seconds += wait
+            await asyncio.sleep(wait)
+            wait, trial = self._wait_time()
+        return trial
+
+    def release_trial(self, trial):
+        """Free trial `trial` if it is still in flight, without recording an outcome."""
+        if trial is None:
+            return
+        with self._lock:
+            if self.trial_in_flight and self.trials == trial:
+                self.trial_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        trial = self.before_call()
+        try:
+            yield
+        finally:
+            self.release_trial(trial)
+
+    @asynccontextmanager
+    async def aguard(self):
+        trial = await self.abefore_call()
+        try:
+            yield
+        finally:
+            self.release_trial(trial)
+
+    def record(self, error_class=None):
+        """Outcome of a call: None for success, else its error class."""
+        with self._lock:
+            self.trial_in_flight = False
+            if error_class not in (SERVER, TIMEOUT):
+                if error_class is None or self.open_until == 0.0:
+                    self.consecutive_failures = 0
+                    self.open_until = 0.0
+                    self.current_pause = self.pause_seconds
+                return
+            self.consecutive_failures += 1
+            if self.open_until != 0.0 or self.consecutive_failures >= self.failure_threshold:
+                if self.open_until != 0.0:
+                    self.current_pause = min(self.max_pause_seconds, self.current_pause * 2)
+                self.open_until = time.monotonic() + self.current_pause
+                self.openings += 1
+                print(f"Circuit breaker for {self.name} open, pausing for {self.current_pause:.0f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "open": self.open_until != 0.0,
+                "consecutive_failures": self.consecutive_failures,
+                "openings": self.openings,
+                "paused_seconds": round(self.paused_seconds, 1),
+            }
+
+
+class RetryPolicy:
+    """
+    Retries a call according to the class of the error it raised, with
+    full-jitter exponential backoff, behind the provider's circuit breaker.
+
+    Args:
+        rules (dict): Error class -> RetryRule, DEFAULT_RULES by default
+    """
+
+    def __init__(self, rules=None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.retries = {error_class: 0 for error_class in self.rules}
+        self.give_ups = {error_class: 0 for error_class in self.rules}
+        self._lock = threading.Lock()
+
+    def _next_delay(self, error, attempts):
+        """Backoff before the next attempt, or None to give up."""
+        error_class = classify_error(error)
+        attempts[error_class] = attempts.get(error_class, 0) + 1
+        rule = self.rules.get(error_class, self.rules[OTHER])
+        with self._lock:
+            if attempts[error_class] >= rule.attempts:
+                self.give_ups[error_class] += 1
+                return error_class, None
+            self.retries[error_class] += 1
+        return error_class, rule.delay(attempts[error_class])
+
+    def call(self, fn, name, on_retry=None):
+        """
+        Run fn() under the breaker of provider `name`, retrying by error class.
+
+        Args:
+            fn (callable): The call
+            name (str): Provider name ("gemini", "openai", "sheets", "drive")
+            on_retry (callable): Called with (error_class, delay) before each retry
+        """
+        breaker = get_circuit_breaker(name)
+        attempts = {}
+        while True:
+            with breaker.guard():
+                try:
+                    result = fn()
+                except Exception as e:
+                    error = e
+                    error_class, delay = self._next_delay(e, attempts)
+                    breaker.record(error_class)
+                    if delay is None:
+                        raise
+                else:
+                    breaker.record(None)
+                    return result
+            if on_retry is not None:
+                on_retry(error_class, delay)
+            print(f"{name} {error_class} error, retrying in {delay:.1f}s: {error}")
+            time.sleep(delay)
+
+    async def acall(self, fn, name, on_retry=None):
+        """Async counterpart of call; fn returns an awaitable."""
+        breaker = get_circuit_breaker(name)
+        attempts = {}
+        while True:
+            async with breaker.aguard():
+                try:
+                    result = await fn()
+                except Exception as e:
+                    error = e
+                    error_class, delay = self._next_delay(e, attempts)
+                    breaker.record(error_class)
+                    if delay is None:
+                        raise
+                else:
+                    breaker.record(None)
+                    return result
+            if on_retry is not None:
+                on_retry(error_class, delay)
+            print(f"{name} {error_class} error, retrying in {delay:.1f}s: {error}")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {"retries": dict(self.retries), "give_ups": dict(self.give_ups)}
+
+
+_breakers = {}
+_policy = None
+_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """
+    Process-wide breaker per provider. CIRCUIT_BREAKER_THRESHOLD and
+    CIRCUIT_BREAKER_PAUSE (seconds) override the defaults.
+    """
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name,
+                                     failure_threshold=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", 5)),
+                                     pause_seconds=float(os.getenv("CIRCUIT_BREAKER_PAUSE", 30)))
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_retry_policy():
+    global _policy
+    with _lock:
+        if _policy is None:
+            _policy = RetryPolicy()
+        return _policy
+
+
+def retry_stats():
+    with _lock:
+        breakers = list(_breakers.values())
+        policy = _policy
+    return {
+        "policy": policy.stats() if policy is not None else None,
+        "breakers": [breaker.stats() for breaker in breakers],
+    }
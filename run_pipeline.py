@@ -0,0 +1,273 @@
+import json
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from omegaconf import OmegaConf
+from tqdm import tqdm
+from camel_tools.utils.dediac import dediac_ar
+from agent_question_builder import QuestionBuilder
+from agent_question_builder2 import QuestionBuilder as CombinedQuestionBuilder
+from corrected_passage_restoration_google_sheets import get_file_ids_from_folder, get_document_tab_names, get_corrected_transcription
+from qna_form import set_cell_value, set_merged_cell_value, filter_results, custom_sort_key, build_spans
+from llm_cache import get_chain_cache
+from metering import get_meter, print_summary
+from passage_context import GeminiPassageContextCache
+from judge_cascade import get_judge_cascade, print_cascade_stats
+from prejudge import prejudge_stats
+from passage_driver import PassageDriver, print_passage_results
+from checkpoint_store import get_checkpoint_store
+from budget import passage_budget_from_env, print_budget_report
+from novelty_index import novelty_index_from_env
+from question_store import QuestionStore
+from quote_aligner import aligner_stats
+
+load_dotenv()
+
+DEFAULT_CONFIG = "dialects.yaml"
+
+BUILDERS = {"standard": QuestionBuilder, "combined": CombinedQuestionBuilder}
+
+FILE_SORTS = {
+    "suffix_number": lambda file: int(file[1].split("_")[-1]),
+    "prefix_number": lambda file: int(file[1].split("_")[0]),
+    "name": lambda file: file[1],
+}
+
+
+def load_profiles(path=DEFAULT_CONFIG, names=None, overrides=()):
+    """
+    Dialect profiles from an OmegaConf file, each merged over its defaults.
+
+    Args:
+        path (str): YAML file with defaults and dialects sections
+        names (list): Dialects to run, all of the file when empty
+        overrides (list): OmegaConf dotlist overrides, e.g. "dialects.emirati.rounds=6"
+
+    Returns:
+        (config, list of profiles)
+    """
+    config = OmegaConf.load(path)
+    if overrides:
+        config = OmegaConf.merge(config, OmegaConf.from_dotlist(list(overrides)))
+    profiles = []
+    for name in names or list(config.dialects.keys()):
+        if name not in config.dialects:
+            raise ValueError(f"Unknown dialect {name!r}, expected one of {list(config.dialects.keys())}")
+        profile = OmegaConf.merge(config.defaults, config.dialects[name], {"name": name})
+        if profile.builder not in BUILDERS:
+            raise ValueError(f"{name}: unknown builder {profile.builder!r}, expected one of {list(BUILDERS)}")
+        if profile.file_sort not in FILE_SORTS:
+            raise ValueError(f"{name}: unknown file_sort {profile.file_sort!r}, expected one of {list(FILE_SORTS)}")
+        if profile.generation_mode == "candidates" and profile.builder != "standard":
+            print(f"{name}: candidates mode needs the standard builder, using rounds")
+            profile.generation_mode = "rounds"
+        profiles.append(profile)
+    return config, profiles
+
+
+def split_workers(profiles, workers):
+    """Passage workers per dialect in proportion to the profile weights, at least one each."""
+    total_weight = sum(profile.weight for profile in profiles)
+    return {profile.name: max(1, round(workers * profile.weight / total_weight)) for profile in profiles}
+
+
+class SharedResources:
+    """
+    What all dialects of one run share. LLM clients, rate limiters, circuit
+    breakers and the chain cache are process-wide already; the passage context
+    cache, judge cascade and checkpoint store are created here once.
+    """
+
+    def __init__(self):
+        # Each passage is uploaded once and shared by all builder rounds and judge calls
+        self.context_cache = GeminiPassageContextCache()
+        self.judge_cascade = get_judge_cascade()
+        self.checkpoints = get_checkpoint_store()
+
+    def close(self):
+        cache = get_chain_cache()
+        if cache is not None:
+            print(f"LLM cache: {cache.stats()}")
+        for context_stats in self.context_cache.report():
+            print(f"Passage context cache: {context_stats}")
+        self.context_cache.close()
+        print_cascade_stats(self.judge_cascade)
+        print(f"Pre-judge: {prejudge_stats()}")
+        print(f"Quote aligner: {aligner_stats()}")
+        if self.checkpoints is not None:
+            print(f"Checkpoints: {self.checkpoints.stats()}")
+
+
+class DialectRun:
+    """
+    Restores the transcript tabs of one dialect profile, builds and filters their
+    questions and writes them to the dialect's form.
+
+    Args:
+        profile (DictConfig): Merged dialect profile from load_profiles
+        resources (SharedResources): Caches shared with the other dialects of the run
+    """
+
+    def __init__(self, profile, resources):
+        self.profile = profile
+        self.resources = resources
+        self.builder_class = BUILDERS[profile.builder]
+
+    def build_round(self, question_builder):
+        if self.profile.generation_mode == "candidates":
+            return question_builder.build_qna_from_candidates(OmegaConf.to_container(self.profile.candidate_counts))
+        return question_builder.build_qna()
+
+    def fill_tab(self, doc_id, j):
+        """Restore tab j, build and filter its questions and write them to form tab j."""
+        profile = self.profile
+        checkpoints = self.resources.checkpoints
+        tab_info = get_document_tab_names(doc_id)
+
+        tab_name = tab_info[j][0]
+
+        passage = get_corrected_transcription(doc_id, tab_name)
+
+        # Rounds and form writes of an earlier run of this passage are not repeated
+        checkpoint = checkpoints.load(doc_id, tab_name, passage) if checkpoints is not None else None
+        if checkpoint is not None and checkpoint.form_written:
+            print(f"{profile.name}: tab {tab_name} already written, skipping")
+            return checkpoint.final_results
+
+        form_tab_info = get_document_tab_names(profile.template_id)
+
+        form_tab_name = form_tab_info[j][0]
+        form_tab_id = form_tab_info[j][1]
+
+        print(passage)
+
+        # Accepted questions of the passage, shared as immutable records between rounds
+        questions = QuestionStore()
+        if checkpoint is not None:
+            questions.extend(checkpoint.accepted)
+        first_round = len(checkpoint.rounds) if checkpoint is not None else 0
+        # Calls, tokens and time of all rounds of this passage count against one budget
+        budget = passage_budget_from_env()
+        # Near duplicates of accepted questions are dropped after generation, so the
+        # prompts only carry a short summary instead of every earlier result
+        novelty = novelty_index_from_env()
+        if novelty is not None:
+            novelty.add_results(questions)
+
+        rounds = profile.rounds if profile.generation_mode == "rounds" else 1
+        log_path = f"question_logs_{profile.name}_{j}.txt"
+        if profile.log and not first_round:
+            open(log_path, "w").close()
+        for i in tqdm(range(first_round, rounds + profile.extra_rounds), desc=f"Building {profile.name} questions"):
+            if i >= rounds and len(questions) >= profile.questions_per_form:
+                break
+            previous_questions = questions.window() if novelty is None else []
+            question_builder = self.builder_class(passage, profile.passage_language, profile.country,
+                                                  previous_questions=previous_questions,
+                                                  context_cache=self.resources.context_cache,
+                                                  judge_cascade=self.resources.judge_cascade,
+                                                  budget=budget, novelty_index=novelty,
+                                                  refinement=OmegaConf.to_container(profile.refinement, resolve=True))
+            results = self.build_round(question_builder)
+            if profile.log:
+                logged = [{**result, "Passage": passage} for result in results] if profile.log_passage else results
+                with open(log_path, "a") as log_out:
+                    log_out.write(json.dumps(logged, indent=4, ensure_ascii=False))
+                    log_out.write("\n")
+                    log_out.write("\n")
+            filtered_results = filter_results(results, passage, strict_offsets=profile.strict_quote_offsets)
+            if novelty is not None:
+                novelty.add_results(filtered_results)
+            if checkpoint is not None:
+                checkpoint.record_round(results, filtered_results, question_builder.verdicts)
+            questions.extend(filtered_results)
+            print("-"*100)
+
+        print_budget_report(f"{profile.name}/{tab_name}", budget)
+        if novelty is not None:
+            print(f"Novelty index {profile.name}/{tab_name}: {novelty.stats()}")
+        total_results = filter_results(questions.records, passage, strict_offsets=profile.strict_quote_offsets)
+
+        total_results = sorted(total_results, key=lambda x: custom_sort_key(x))
+
+        if len(total_results) < profile.questions_per_form:
+            raise ValueError(f"Not enough questions found: {len(total_results)}")
+
+        total_results = total_results[:profile.questions_per_form]
+        # Only the questions written to the form count as accepted
+        get_meter().record_accepted(profile.passage_language, len(total_results))
+
+        quotes = [result["Quotes"] for result in total_results]
+
+        color_spans = build_spans(quotes, passage)
+
+        for i, result in enumerate(total_results):
+            question = dediac_ar(result["Question"]) if profile.dediac else result["Question"]
+            answer = dediac_ar(result["Answer"]) if profile.dediac else result["Answer"]
+            set_cell_value(profile.template_id, form_tab_name, f"B{2*i+5}", question)
+            set_cell_value(profile.template_id, form_tab_name, f"B{2*i+6}", answer)
+
+        set_merged_cell_value(profile.template_id, form_tab_id, "B2:F3", passage, color_spans=color_spans)
+        if checkpoint is not None:
+            checkpoint.record_form_written([result.as_dict() for result in total_results])
+        return total_results
+
+    def run(self, workers):
+        file_ids = get_file_ids_from_folder(self.profile.folder_link)
+        file_ids = list(sorted(file_ids, key=FILE_SORTS[self.profile.file_sort]))
+        doc_id = file_ids[self.profile.document][0]
+
+        # Tabs are independent, so several are restored, generated and written at once
+        driver = PassageDriver(max_workers=workers)
+        passage_results = driver.run(list(self.profile.tabs), lambda j: self.fill_tab(doc_id, j))
+        print(f"{self.profile.name}:")
+        print_passage_results(passage_results, driver.wall_seconds)
+        return passage_results
+
+
+def run_dialects(profiles, workers=4):
+    """
+    Run several dialect profiles in one process. Dialects run side by side and
+    split the passage workers by weight; since every call goes through the same
+    rate limiters, each dialect's share of the LLM and Sheets quota follows its
+    share of passages in flight.
+
+    Returns:
+        Dict of dialect name -> list of PassageResult
+    """
+    resources = SharedResources()
+    workers_by_dialect = split_workers(profiles, workers)
+    print(f"Passage workers per dialect: {workers_by_dialect}")
+    runs = [DialectRun(profile, resources) for profile in profiles]
+    with ThreadPoolExecutor(max_workers=len(runs), thread_name_prefix="dialect") as executor:
+        futures = {run.profile.name: executor.submit(contextvars.copy_context().run, run.run,
+                                                     workers_by_dialect[run.profile.name])
+                   for run in runs}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"Dialect {name} failed: {e}")
+                results[name] = None
+    resources.close()
+    # Cost and latency per accepted question, the figure these runs are budgeted against
+    print_summary(get_meter().summary())
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the QnA forms of several dialects in one run")
+    parser.add_argument("dialects", nargs="*", help="Dialect profiles to run, all of the config when omitted")
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--workers", type=int, default=None, help="Passages in flight across all dialects")
+    parser.add_argument("--set", dest="overrides", action="append", default=[],
+                        help="OmegaConf dotlist override, e.g. dialects.emirati.rounds=6 (repeatable)")
+    args = parser.parse_args(argv)
+    config, profiles = load_profiles(args.config, args.dialects, args.overrides)
+    return run_dialects(profiles, args.workers or int(config.workers))
+
+
+if __name__ == "__main__":
+    main()
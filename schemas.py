@@ -0,0 +1,165 @@
+from functools import lru_cache
+from typing import List, Literal
+from pydantic import BaseModel, Field, ValidationError, create_model, field_validator
+from langchain_core.utils.json_schema import dereference_refs
+from llm_registry import llm_provider
+
+# Quality checks of each judge rubric, in prompt order. Every check also has a
+# "<check>_reason" string (in compact verdicts only when the check fails) and the
+# rubric ends with "IsIn<passage_language>".
+CHALLENGING_CHECKS = [
+    "IsNonOpinionated", "UnambiguousAnswer", "IsUnbiased", "IsAnswerable", "IsRelevant",
+    "AnswerNotInSpan", "IsInThirdPerson", "NoHighLexicalOverlap", "NoSpecializedExternalKnowledge",
+    "IsShortQuestion", "IsShortAndPreciseAnswer",
+]
+MODERATE_CHECKS = [
+    "IsNonOpinionated", "UnambiguousAnswer", "IsUnbiased", "IsAnswerable", "IsRelevant",
+    "IsInThirdPerson", "IsNotVerbatimAnswer", "QuestionFreeFromLinguisticOrGrammarTerms",
+    "IsShortQuestion", "IsPreciseAnswer", "IsShortAnswer",
+]
+COMBINED_CHECKS = [
+    "IsNonOpinionated", "UnambiguousAnswer", "IsUnbiased", "IsAnswerable", "IsRelevant",
+    "IsInThirdPerson", "QuestionFreeFromLinguisticOrGrammarTerms", "IsShortQuestion", "IsPreciseAnswer",
+]
+
+
+def coerce_offset(value):
+    """Quote offsets as int; "N/A", empty and unparsable values become -1."""
+    if isinstance(value, bool) or value is None:
+        return -1
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(float(str(value).strip()))
+    except ValueError:
+        return -1
+
+
+class Quote(BaseModel):
+    text: str
+    start_char: int
+    end_char: int
+
+    @field_validator("start_char", "end_char", mode="before")
+    @classmethod
+    def _offset(cls, value):
+        return coerce_offset(value)
+
+
+class QuestionAnswer(BaseModel):
+    Question: str
+    Answer: str
+    Quotes: List[Quote]
+
+
+class Candidate(BaseModel):
+    Difficulty: Literal["challenging", "moderate", "easy"]
+    Question: str
+    Answer: str
+    Quotes: List[Quote]
+
+
+class CandidateSet(BaseModel):
+    Candidates: List[Candidate]
+
+
+class GeneratedAnswer(BaseModel):
+    answer: str
+
+
+class Recommendations(BaseModel):
+    Critical: str
+    NiceToHave: str
+
+
+@lru_cache(maxsize=None)
+def judge_schema(checks, passage_language, max_complexity=None, compact=False, revision=False):
+    """
+    Pydantic model of a judge verdict. Field names follow the prompt, including
+    the per-dialect "IsIn<passage_language>" check, so they are set as aliases.
+
+    Args:
+        checks (tuple): Boolean checks of the rubric, e.g. tuple(CHALLENGING_CHECKS)
+        passage_language (str): Dialect name used in the prompt
+        max_complexity (int): Upper bound of the Complexity grade, None if the rubric has none
+        compact (bool): Reasons are optional and there is no Complexity_reason
+        revision (bool): The verdict ends with the revised candidate (fused judge-and-revise calls)
+    """
+    fields = {}
+    if max_complexity is not None:
+        fields["complexity"] = (int, Field(alias="Complexity", ge=1, le=max_complexity))
+        if not compact:
+            fields["complexity_reason"] = (str, Field(alias="Complexity_reason"))
+    for i, check in enumerate(list(checks) + [f"IsIn{passage_language}"]):
+        fields[f"check_{i}"] = (bool, Field(alias=check))
+        if compact:
+            fields[f"check_{i}_reason"] = (str, Field(None, alias=f"{check}_reason"))
+        else:
+            fields[f"check_{i}_reason"] = (str, Field(alias=f"{check}_reason"))
+    fields["recommendations"] = (Recommendations, Field(alias="Recommendations"))
+    if revision:
+        fields["revision"] = (QuestionAnswer, Field(alias="Revision"))
+        return create_model("FusedJudgeVerdict", **fields)
+    return create_model("CompactJudgeVerdict" if compact else "JudgeVerdict", **fields)
+
+
+def challenging_judge_schema(passage_language, compact=False, revision=False):
+    return judge_schema(tuple(CHALLENGING_CHECKS), passage_language, 5, compact, revision)
+
+
+def moderate_judge_schema(passage_language, compact=False, revision=False):
+    return judge_schema(tuple(MODERATE_CHECKS), passage_language, 3, compact, revision)
+
+
+def combined_judge_schema(passage_language, compact=False, revision=False):
+    return judge_schema(tuple(COMBINED_CHECKS), passage_language, None, compact, revision)
+
+
+def _gemini_schema(node):
+    """Strip what the Gemini schema subset rejects and pin property order to the prompt's."""
+    if isinstance(node, list):
+        return [_gemini_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    node = {key: _gemini_schema(value) for key, value in node.items() if key not in ("title", "$defs", "default")}
+    if "properties" in node:
+        node["propertyOrdering"] = list(node["properties"])
+    return node
+
+
+@lru_cache(maxsize=None)
+def response_schema(schema):
+    """JSON schema of a pydantic model, by alias, with $refs inlined."""
+    json_schema = schema.model_json_schema(by_alias=True)
+    return _gemini_schema(dereference_refs(json_schema))
+
+
+def bind_schema(llm, schema):
+    """
+    Ask the model for output matching `schema`. Gemini gets it as response_schema;
+    other models (gpt-4 has no json_schema response format) are returned unchanged
+    and rely on the local parser.
+    """
+    if llm_provider(llm) == "gemini":
+        return llm.bind(response_mime_type="application/json", response_schema=response_schema(schema))
+    return llm
+
+
+def validate_output(data, schema):
+    """
+    Validate parsed output against `schema` and return it as a plain dict keyed by
+    the prompt's field names. Output that does not fit is returned as parsed, with
+    quote offsets coerced, so a single missing reason does not throw the call away.
+    Optional fields the model left out (reasons of compact verdicts) stay out.
+    """
+    try:
+        return schema.model_validate(data).model_dump(by_alias=True, exclude_unset=True)
+    except ValidationError as e:
+        print(f"Output does not match {schema.__name__}: {e.error_count()} error(s), keeping parsed JSON")
+    if isinstance(data, dict) and isinstance(data.get("Quotes"), list):
+        for quote in data["Quotes"]:
+            if isinstance(quote, dict):
+                for key in ("start_char", "end_char"):
+                    if key in quote:
+                        quote[key] = coerce_offset(quote[key])
+    return data
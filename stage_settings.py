@@ -0,0 +1,147 @@
+import os
+import threading
+from omegaconf import OmegaConf
+from langchain_core.runnables import RunnableBinding
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import ChatOpenAI
+
+DEFAULT_STAGE_SETTINGS_PATH = "llm_stages.yaml"
+
+# Settings a stage can pin; anything left unset keeps the client's default
+# (model-chosen thinking, no output cap, no timeout)
+SETTING_NAMES = ("thinking_budget", "max_tokens", "timeout")
+
+
+class StageSettings:
+    """
+    Thinking budget, output cap and timeout of the calls of one stage.
+
+    Args:
+        name (str): Stage, or "stage/difficulty" for a difficulty-specific entry
+        thinking_budget (int): Gemini thinking tokens; ignored for other providers
+        max_tokens (int): Output cap. On Gemini 2.5 it includes the thinking tokens
+        timeout (float): Seconds per request, before retries
+    """
+
+    def __init__(self, name, thinking_budget=None, max_tokens=None, timeout=None):
+        self.name = name
+        self.thinking_budget = thinking_budget
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    @property
+    def label(self):
+        """Name and values, e.g. "judge(thinking_budget=2048,max_tokens=8192)", as recorded by the meter."""
+        values = ",".join(f"{name}={getattr(self, name)}" for name in SETTING_NAMES if getattr(self, name) is not None)
+        return f"{self.name}({values})"
+
+    def bind(self, llm):
+        """
+        The chat model with these settings bound as call arguments, so the shared
+        client (and its connection pool) is reused. Runnables that are not a
+        Gemini or OpenAI chat model, e.g. a HedgedRouter, are returned unchanged.
+        """
+        base = llm
+        while isinstance(base, RunnableBinding):
+            base = base.bound
+        kwargs = {}
+        if isinstance(base, ChatGoogleGenerativeAI):
+            generation_config = {}
+            if self.thinking_budget is not None:
+                generation_config["thinking_config"] = {"thinking_budget": self.thinking_budget}
+            if self.max_tokens is not None:
+                generation_config["max_output_tokens"] = self.max_tokens
+            if generation_config:
+                kwargs["generation_config"] = generation_config
+        elif isinstance(base, ChatOpenAI):
+            if self.max_tokens is not None:
+                kwargs["max_tokens"] = self.max_tokens
+        else:
+            return llm
+        if self.timeout is not None:
+            kwargs["timeout"] = self.timeout
+        return llm.bind(**kwargs) if kwargs else llm
+
+    def __repr__(self):
+        return f"StageSettings({self.label})"
+
+
+class StageSettingsTable:
+    """
+    Per-stage settings, looked up by the stage and difficulty of a ChainCall. A
+    difficulty entry of a stage is merged over the stage's own values.
+
+    Args:
+        stages (dict): stage -> {thinking_budget, max_tokens, timeout, difficulties: {difficulty -> values}}
+    """
+
+    def __init__(self, stages):
+        self.settings = {}
+        for stage, values in stages.items():
+            values = dict(values or {})
+            difficulties = values.pop("difficulties", None) or {}
+            self.settings[(stage, None)] = self._make(stage, values)
+            for difficulty, overrides in difficulties.items():
+                self.settings[(stage, difficulty)] = self._make(f"{stage}/{difficulty}", {**values, **(overrides or {})})
+
+    @staticmethod
+    def _make(name, values):
+        unknown = set(values) - set(SETTING_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown settings for stage {name}: {sorted(unknown)}, expected {list(SETTING_NAMES)}")
+        return StageSettings(name, **values)
+
+    def lookup(self, stage, difficulty=None):
+        """StageSettings of a call, None if its stage is not configured."""
+        settings = self.settings.get((stage, difficulty))
+        if settings is None:
+            settings = self.settings.get((stage, None))
+        return settings
+
+    def __len__(self):
+        return len(self.settings)
+
+
+def load_stage_settings(path=DEFAULT_STAGE_SETTINGS_PATH):
+    """StageSettingsTable from the stages section of a YAML file."""
+    config = OmegaConf.to_container(OmegaConf.load(path), resolve=True)
+    return StageSettingsTable(config.get("stages") or {})
+
+
+_default_table = None
+_default_table_lock = threading.Lock()
+
+
+def get_stage_settings():
+    """
+    Process-wide stage settings, or None when disabled or not configured.
+
+    STAGE_SETTINGS=off sends every call with the client defaults, STAGE_SETTINGS_PATH
+    sets the YAML file.
+    """
+    global _default_table
+    if os.getenv("STAGE_SETTINGS", "on").lower() in ("off", "0", "false", "no"):
+        return None
+    with _default_table_lock:
+        if _default_table is False:
+            return None
+        if _default_table is None:
+            path = os.getenv("STAGE_SETTINGS_PATH", DEFAULT_STAGE_SETTINGS_PATH)
+            if not os.path.exists(path):
+                print(f"No stage settings at {path}, using client defaults")
+                _default_table = False
+                return None
+            _default_table = load_stage_settings(path)
+        return _default_table
+
+
+def set_stage_settings(table):
+    """Replace the process-wide settings (None sends every call with the client defaults)."""
+    global _default_table
+    with _default_table_lock:
+        _default_table = table if table is not None else False
+
+
+def stage_settings_for(stage, difficulty=None):
+    table = get_stage_settings()
+    return table.lookup(stage, difficulty) if table is not None else None
@@ -0,0 +1,44 @@
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
+
+
+def message_text(message):
+    """Text of a (possibly partial) AIMessage whose content may be a list of parts."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type", "text") == "text":
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+def parse_partial(text):
+    """Best-effort parse of a JSON object that is still being streamed, None if nothing parses yet."""
+    try:
+        partial = parse_json_markdown(text, parser=parse_partial_json)
+    except Exception:
+        return None
+    return partial if isinstance(partial, dict) else None
+
+
+def field_done(partial, key):
+    """
+    True once `key` can no longer change: a boolean was parsed or the model has
+    moved on to a later key. Strings and numbers are open while they are last.
+    """
+    if key not in partial:
+        return False
+    return isinstance(partial[key], bool) or list(partial)[-1] != key
+
+
+def question_not_available(partial):
+    """Abort predicate for generation prompts: the model answered "N/A"."""
+    return field_done(partial, "Question") and partial["Question"] == "N/A"
+
+
+def failing_verdict(partial):
+    """Abort predicate for judge prompts: some quality check came back false."""
+    return any(value is False for key, value in partial.items() if not key.endswith("_reason"))